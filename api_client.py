@@ -1,70 +1,225 @@
 import requests
+import gzip
 import json
 import time
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import logging
+from http_transport import APITransport, get_transport
+from punch_index import PunchIndex
+from circuit_breaker import CircuitBreaker, get_breaker
+from metrics import METRICS
+from zkteco_device import serialize_records
 
 class APIClient:
-    def __init__(self, api_url: str):
+    # Refus définitifs du contenu d'un lot (validation): le renvoyer tel quel échouerait toujours.
+    # 401/403/404 signalent une configuration erronée et restent des échecs ordinaires (nouvel essai)
+    REJECTED_STATUSES = (400, 422)
+
+    def __init__(self, api_url: str, batch_size: int = 500, max_in_flight: int = 2,
+                 compress: bool = False, timeout: float = 30, transport: APITransport = None,
+                 index: PunchIndex = None, breaker: CircuitBreaker = None, metrics_label: str = None):
         self.api_url = api_url
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Content-Type': 'application/json',
-            'User-Agent': 'ZKTeco-Service/2.0'
-        })
-        # Désactiver la vérification SSL pour les tests
-        self.session.verify = False
-        import urllib3
-        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        self.batch_size = max(1, batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.compress = compress  # Corps gzip: l'API doit accepter Content-Encoding: gzip
+        self.timeout = timeout
+        self.index = index  # Pointages déjà acquittés: filtrés avant l'envoi
+        # Session HTTP partagée: les connexions (et sessions TLS) sont réutilisées d'un envoi à l'autre
+        self.transport = transport or get_transport()
+        self.session = self.transport.session
+        # Disjoncteur partagé par tous les clients de cet endpoint
+        self.breaker = breaker or get_breaker(api_url)
+        self.metrics_label = metrics_label or api_url  # Étiquette device des métriques
         
         self.logger = logging.getLogger(__name__)
     
-    def send_attendance(self, attendance_data: List[Dict[str, Any]], max_retries: int = 3) -> bool:
-        """Envoyer les pointages à l'API avec système de retry"""
+    def send_attendance(self, attendance_data: List[Dict[str, Any]],
+                        on_ack: Callable[[List[Dict[str, Any]]], None] = None, device: str = None,
+                        on_reject: Callable[[List[Dict[str, Any]], str], None] = None) -> bool:
+        """
+        Envoyer les pointages à l'API par lots, avec plusieurs lots en vol.
+
+        Une seule tentative par lot et aucune attente: les lots en échec restent à la charge de
+        l'appelant (file d'envoi), et le disjoncteur refuse les envois tant que l'API est hors service.
+
+        :param on_ack: appelé avec chaque lot acquitté dès sa réponse, dans l'ordre des lots: après un lot
+            en échec, les suivants ne sont plus acquittés (ils restent en file)
+        :param device: numéro de série du device, pour écarter les pointages déjà acquittés
+        :param on_reject: appelé avec les pointages refusés définitivement (400/422) et le motif; le lot refusé
+            est alors coupé en deux jusqu'à isoler ces pointages, et les autres sont acquittés normalement.
+            Sans on_reject, un lot refusé est un échec comme un autre
+        :return: True si tous les lots ont été acquittés (pointages refusés écartés)
+        """
+        if self.index and device and attendance_data:
+            attendance_data, duplicates = self.index.filter(device, attendance_data)
+            if duplicates:
+                METRICS.inc('zkteco_duplicates_skipped_total', len(duplicates), device=self.metrics_label, source='index')
+                self.logger.info(f"🧹 {len(duplicates)} doublons déjà acquittés écartés avant l'envoi")
+                if on_ack:
+                    on_ack(duplicates)
+        
         if not attendance_data:
             self.logger.info("📭 Aucune donnée à envoyer")
             return True
         
-        for attempt in range(max_retries):
-            try:
-                self.logger.info(f"📤 Tentative {attempt + 1}/{max_retries} - Envoi de {len(attendance_data)} pointages")
-                
-                response = self.session.post(
-                    self.api_url,
-                    json=attendance_data,
-                    timeout=30,
-                    verify=False
-                )
-                
-                if response.status_code in [200, 201]:
-                    try:
-                        response_data = response.json()
-                        self.logger.info(f"✅ Réponse API: {response_data.get('message', 'Succès')}")
-                        self.logger.info(f"📊 {response_data.get('saved_count', 0)} sauvegardés, {response_data.get('duplicates_skipped', 0)} doublons ignorés")
-                        return True
-                    except ValueError:
-                        self.logger.info("✅ Pointages envoyés avec succès")
-                        return True
-                else:
-                    self.logger.warning(f"⚠️  Réponse API {response.status_code}: {response.text}")
-                    
-                    if attempt < max_retries - 1:
-                        wait_time = (attempt + 1) * 10
-                        self.logger.info(f"⏳ Nouvelle tentative dans {wait_time}s...")
-                        time.sleep(wait_time)
-                    
-            except requests.exceptions.ConnectionError as e:
-                self.logger.error(f"🔌 Erreur connexion API: {e}")
-            except requests.exceptions.Timeout as e:
-                self.logger.error(f"⏰ Timeout API: {e}")
-            except Exception as e:
-                self.logger.error(f"💥 Erreur inattendue: {e}")
-            
-            if attempt < max_retries - 1:
-                time.sleep((attempt + 1) * 10)
+        if not self.breaker.allow():
+            self.logger.warning(
+                f"🔌 API indisponible (circuit ouvert): envoi de {len(attendance_data)} pointages reporté "
+                f"de {self.breaker.retry_in():.0f}s"
+            )
+            return False
         
-        self.logger.error(f"🔴 Échec après {max_retries} tentatives")
-        return False
+        batches = [attendance_data[i:i + self.batch_size] for i in range(0, len(attendance_data), self.batch_size)]
+        results: List[Optional[Tuple[bool, Optional[float], int, list]]] = [None] * len(batches)
+        acked = 0  # Lots acquittés, toujours un préfixe de la liste des lots
+        rejected_count = 0
+        
+        def acknowledge_ready():
+            nonlocal acked, rejected_count
+            # Acquittement dans l'ordre des lots, arrêté au premier lot en échec
+            while acked < len(batches) and results[acked] is not None and results[acked][0]:
+                rejected = results[acked][3]
+                accepted = batches[acked]
+                if rejected:
+                    refused = {id(att) for att, _ in rejected}
+                    accepted = [att for att in accepted if id(att) not in refused]
+                    for att, reason in rejected:
+                        on_reject([att], reason)
+                    rejected_count += len(rejected)
+                if self.index and device:
+                    self.index.add(device, accepted)
+                if on_ack and accepted:
+                    on_ack(accepted)
+                acked += 1
+        
+        send = self._send_isolating if on_reject else self._send_batch
+        start = time.perf_counter()
+        if len(batches) == 1:
+            results[0] = send(batches[0], 1, 1)
+            acknowledge_ready()
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as executor:
+                futures = {
+                    executor.submit(send, batch, index + 1, len(batches)): index
+                    for index, batch in enumerate(batches)
+                }
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    acknowledge_ready()
+        elapsed = time.perf_counter() - start
+        
+        success = acked == len(batches)
+        if not success and self.index and device:
+            # Lots reçus par l'API après un lot en échec: non acquittés, mais écartés comme doublons au prochain envoi
+            for batch, (ok, _, _, rejected) in zip(batches[acked + 1:], results[acked + 1:]):
+                if ok and not rejected:
+                    self.index.add(device, batch)
+        
+        latencies = [latency for ok, latency, _, _ in results if ok and latency is not None]
+        sent_bytes = sum(size for _, _, size, _ in results)
+        if len(batches) > 1 or not success:
+            sent = sum(len(batch) for batch in batches[:acked]) - rejected_count
+            self.logger.info(
+                f"📈 {sent}/{len(attendance_data)} pointages acquittés en {acked}/{len(batches)} lots, "
+                f"{elapsed:.2f}s ({sent / elapsed if elapsed else 0:.0f} pointages/s), "
+                f"latence moyenne {sum(latencies) / len(latencies) * 1000 if latencies else 0:.0f} ms, "
+                f"max {max(latencies, default=0) * 1000:.0f} ms, {sent_bytes} octets envoyés"
+            )
+        if not success:
+            self.logger.error(
+                f"🔴 Échec de {len(batches) - len(latencies)} lot(s): {len(batches) - acked} lot(s) laissés en file "
+                f"pour un nouvel essai"
+            )
+        return success
+    
+    def _encode_batch(self, batch: List[Dict[str, Any]]) -> Tuple[bytes, Dict[str, str]]:
+        # Format JSON de l'API produit ici seulement, au moment de l'envoi
+        body = json.dumps(serialize_records(batch), separators=(',', ':')).encode('utf-8')
+        if not self.compress:
+            return body, {}
+        return gzip.compress(body, compresslevel=6), {'Content-Encoding': 'gzip'}
+    
+    def _send_isolating(self, batch: List[Dict[str, Any]], index: int,
+                        count: int) -> Tuple[bool, Optional[float], int, list]:
+        """
+        Envoyer un lot; s'il est refusé définitivement, le couper en deux et renvoyer chaque moitié,
+        jusqu'à isoler les pointages refusés (les autres sont enregistrés par l'API).
+
+        :return: (lot traité, latence, octets envoyés, [(pointage refusé, motif)])
+        """
+        ok, latency, size, rejected = self._send_batch(batch, index, count)
+        if ok or not rejected:
+            return ok, latency, size, []
+        if len(batch) == 1:
+            return True, latency, size, rejected
+        middle = len(batch) // 2
+        isolated = []
+        for half in (batch[:middle], batch[middle:]):
+            ok, _, half_size, half_rejected = self._send_isolating(half, index, count)
+            size += half_size
+            if not ok:
+                return False, None, size, []
+            isolated += half_rejected
+        return True, latency, size, isolated
+    
+    def _send_batch(self, batch: List[Dict[str, Any]], index: int, count: int) -> Tuple[bool, Optional[float], int, list]:
+        """
+        Envoyer un lot (une tentative).
+
+        :return: (succès, latence, octets envoyés, [(pointage, motif)] si le lot est refusé définitivement)
+        """
+        label = f"Lot {index}/{count} - " if count > 1 else ""
+        if index > 1 and not self.breaker.allow():
+            # Circuit ouvert pendant l'envoi des lots précédents
+            return False, None, 0, []
+        body, headers = self._encode_batch(batch)
+        try:
+            self.logger.info(f"📤 {label}Envoi de {len(batch)} pointages ({len(body)} octets)")
+            
+            started = time.perf_counter()
+            response = self.session.post(
+                self.api_url,
+                data=body,
+                headers=headers,
+                timeout=self.timeout,
+                verify=False
+            )
+            latency = time.perf_counter() - started
+            METRICS.observe('zkteco_phase_duration_seconds', latency, device=self.metrics_label, phase='http_post')
+            METRICS.inc('zkteco_api_bytes_sent_total', len(body), device=self.metrics_label)
+            
+            if response.status_code in [200, 201]:
+                self.breaker.record_success()
+                try:
+                    response_data = response.json()
+                    METRICS.inc('zkteco_duplicates_skipped_total', response_data.get('duplicates_skipped') or 0,
+                                device=self.metrics_label, source='api')
+                    self.logger.info(f"✅ {label}Réponse API en {latency * 1000:.0f} ms: {response_data.get('message', 'Succès')}")
+                    self.logger.info(f"📊 {response_data.get('saved_count', 0)} sauvegardés, {response_data.get('duplicates_skipped', 0)} doublons ignorés")
+                except ValueError:
+                    self.logger.info(f"✅ {label}Pointages envoyés avec succès en {latency * 1000:.0f} ms")
+                return True, latency, len(body), []
+            
+            self.logger.warning(f"⚠️  {label}Réponse API {response.status_code}: {response.text}")
+            if response.status_code >= 500 or response.status_code == 429:
+                self.breaker.record_failure()
+            else:
+                # L'API répond: le lot est refusé mais l'endpoint n'est pas hors service
+                self.breaker.record_success()
+            if response.status_code in self.REJECTED_STATUSES:
+                reason = f"HTTP {response.status_code}: {response.text[:200]}"
+                return False, None, len(body), [(att, reason) for att in batch]
+            return False, None, len(body), []
+                
+        except requests.exceptions.ConnectionError as e:
+            self.logger.error(f"🔌 Erreur connexion API: {e}")
+        except requests.exceptions.Timeout as e:
+            self.logger.error(f"⏰ Timeout API: {e}")
+        except Exception as e:
+            self.logger.error(f"💥 Erreur inattendue: {e}")
+        self.breaker.record_failure()
+        return False, None, len(body), []
     
     def test_connection(self) -> bool:
         """Tester la connexion à l'API de manière plus robuste"""
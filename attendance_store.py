@@ -0,0 +1,167 @@
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import List, Optional
+
+from zkteco_device import AttendanceRecord, format_timestamp, to_epoch
+
+# Version du schéma (PRAGMA user_version): une copie d'un format antérieur est reconstruite
+SCHEMA_VERSION = 2
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attendances (
+    device TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    uid TEXT NOT NULL,
+    type INTEGER NOT NULL,
+    state INTEGER NOT NULL,
+    PRIMARY KEY (device, timestamp, uid, type)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS attendances_timestamp ON attendances (timestamp);
+CREATE INDEX IF NOT EXISTS attendances_uid ON attendances (uid, timestamp);
+CREATE TABLE IF NOT EXISTS coverage (
+    device TEXT PRIMARY KEY,
+    complete INTEGER NOT NULL DEFAULT 0,
+    covered_until REAL,
+    updated_at REAL
+);
+"""
+
+
+class AttendanceStore:
+    """
+    Copie locale de tous les pointages lus sur les devices, indexée par device, date et utilisateur.
+
+    Alimentée par la boucle de synchronisation; un device est « complet » dès qu'une lecture
+    intégrale de son log a été enregistrée, et couvert jusqu'au début de sa dernière lecture
+    enregistrée. Les recherches par période ne lisent alors sur le device que la fin du log
+    au-delà de cette couverture.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Simple copie des devices: elle se reconstruit à la prochaine lecture complète
+            self.db.executescript("DROP TABLE IF EXISTS attendances; DROP TABLE IF EXISTS coverage;")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(SCHEMA)
+        if 'covered_until' not in {row[1] for row in self.db.execute("PRAGMA table_info(coverage)")}:
+            # Copie créée par une version précédente
+            self.db.execute("ALTER TABLE coverage ADD COLUMN covered_until REAL")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def add(self, device: str, attendances: List[AttendanceRecord]) -> int:
+        """
+        Enregistrer des pointages lus sur le device (les doublons sont ignorés).
+
+        La couverture n'avance qu'à la fin de la lecture (mark_covered).
+
+        :return: nombre de pointages ajoutés
+        """
+        rows = [(device, att.timestamp, att.user_id, att.punch, att.status) for att in attendances]
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                before = self.db.total_changes
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO attendances (device, timestamp, uid, type, state) VALUES (?, ?, ?, ?, ?)",
+                    rows)
+                added = self.db.total_changes - before
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return added
+
+    def rename_device(self, old: str, new: str) -> int:
+        """Reprendre sous new les pointages et la couverture enregistrés sous old (ancienne clé par numéro de série)"""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                moved = self.db.execute(
+                    "UPDATE OR IGNORE attendances SET device = ? WHERE device = ?", (new, old)).rowcount
+                self.db.execute("DELETE FROM attendances WHERE device = ?", (old,))
+                self.db.execute(
+                    "INSERT INTO coverage (device, complete, covered_until, updated_at) "
+                    "SELECT ?, complete, covered_until, updated_at FROM coverage WHERE device = ? "
+                    "ON CONFLICT (device) DO UPDATE SET complete = MAX(complete, excluded.complete), "
+                    "covered_until = MAX(COALESCE(covered_until, 0), COALESCE(excluded.covered_until, 0))",
+                    (new, old))
+                self.db.execute("DELETE FROM coverage WHERE device = ?", (old,))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return moved
+
+    def mark_covered(self, device: str, until: datetime, complete: bool = False):
+        """
+        Fin d'une lecture enregistrée: tous les pointages du device antérieurs à until sont dans la copie.
+
+        :param until: début de la lecture (un pointage arrivé pendant la lecture n'est pas garanti)
+        :param complete: la lecture a couvert le log intégral du device
+        """
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO coverage (device, complete, covered_until, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (device) DO UPDATE SET complete = MAX(complete, excluded.complete), "
+                "covered_until = MAX(COALESCE(covered_until, 0), excluded.covered_until), "
+                "updated_at = excluded.updated_at",
+                (device, int(complete), until.timestamp(), time.time()))
+
+    def covered_until(self, device: str) -> Optional[datetime]:
+        """Date jusqu'à laquelle la copie contient tous les pointages du device (None si jamais lu en entier)"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT complete, covered_until FROM coverage WHERE device = ?", (device,)).fetchone()
+        if not row or not row[0] or row[1] is None:
+            return None
+        return datetime.fromtimestamp(row[1])
+
+    def is_complete(self, device: str) -> bool:
+        """Vrai si le log intégral du device a déjà été enregistré"""
+        with self.lock:
+            row = self.db.execute("SELECT complete FROM coverage WHERE device = ?", (device,)).fetchone()
+        return bool(row and row[0])
+
+    def query(self, start: datetime = None, end: datetime = None, device: str = None,
+              user_id: str = None) -> List[AttendanceRecord]:
+        """Pointages entre start et end (bornes incluses), triés par date"""
+        clauses, params = ["timestamp BETWEEN ? AND ?"], [
+            to_epoch(start) if start else 0,
+            to_epoch(end) if end else 2 ** 62,
+        ]
+        if device is not None:
+            clauses.append("device = ?")
+            params.append(device)
+        if user_id is not None:
+            clauses.append("uid = ?")
+            params.append(str(user_id))
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT uid, timestamp, state, type FROM attendances WHERE " + " AND ".join(clauses) +
+                " ORDER BY timestamp", params).fetchall()
+        return [AttendanceRecord(*row) for row in rows]
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            count = self.db.execute("SELECT COUNT(*) FROM attendances").fetchone()[0]
+            complete = self.db.execute("SELECT COUNT(*) FROM coverage WHERE complete = 1").fetchone()[0]
+            first, last = self.db.execute("SELECT MIN(timestamp), MAX(timestamp) FROM attendances").fetchone()
+        first, last = (format_timestamp(first), format_timestamp(last)) if count else (None, None)
+        return {
+            'path': self.path,
+            'attendances': count,
+            'complete_devices': complete,
+            'first': first,
+            'last': last,
+        }
@@ -0,0 +1,245 @@
+import mmap
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from zkteco_device import ATTLOG_HEADER_SIZE, AttendanceRecord, UserIndex, decode_records
+
+# En-tête de trame: magic, format, taille d'un enregistrement, offset de début dans le buffer du device,
+# date de capture (epoch), longueur des données, CRC32 des données
+FRAME = struct.Struct('<4sBHIdII')
+FRAME_MAGIC = b'ZKAF'
+FRAME_VERSION = 1
+
+
+def _missing(covered: List[Tuple[int, int]], start: int, end: int, size: int) -> List[Tuple[int, int]]:
+    """Parties de [start, end) absentes des intervalles couverts (alignées sur les enregistrements)"""
+    pieces = []
+    position = start
+    for low, high in covered:
+        if high <= position:
+            continue
+        if low >= end:
+            break
+        if low > position:
+            pieces.append((position, low))
+        position = max(position, high)
+    if position < end:
+        pieces.append((position, end))
+    return [(a + (start - a) % size, b) for a, b in pieces if b - a >= size]
+
+
+def _merge(covered: List[Tuple[int, int]], start: int, end: int) -> List[Tuple[int, int]]:
+    merged = []
+    for low, high in sorted(covered + [(start, end)]):
+        if merged and low <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+class ArchiveFrame(NamedTuple):
+    """Buffer ATTLOG brut tel que lu sur le device (data est une vue sur le fichier, sans copie)"""
+    position: int
+    start: int
+    record_size: int
+    captured_at: float
+    data: memoryview
+
+    @property
+    def log_size(self) -> int:
+        """Taille du log déclarée par l'en-tête d'une lecture complète (0 pour une fin de log)"""
+        if self.start or len(self.data) < ATTLOG_HEADER_SIZE:
+            return 0
+        return struct.unpack_from('<I', self.data)[0]
+
+    @property
+    def body(self) -> memoryview:
+        """Enregistrements seuls (sans l'en-tête de taille d'une lecture complète)"""
+        if self.start:
+            return self.data
+        if len(self.data) < ATTLOG_HEADER_SIZE:
+            return self.data[:0]
+        total_size = struct.unpack_from('<I', self.data)[0]
+        return self.data[ATTLOG_HEADER_SIZE:ATTLOG_HEADER_SIZE + total_size]
+
+
+class AttlogArchive:
+    """
+    Archive locale des buffers ATTLOG bruts, un fichier en ajout seul par device.
+
+    Chaque lot lu (lecture complète ou fin de log depuis le curseur) devient une trame avec son CRC32.
+    La relecture passe par mmap: réenvoi, audit ou reprise après une perte côté API se font
+    depuis le disque, sans dépendre du device ni de ce qu'il contient encore.
+    """
+
+    SUFFIX = '.attlog'
+
+    def __init__(self, directory: str, fsync: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.checked = set()  # Fichiers dont la fin a été vérifiée depuis le démarrage
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.logger = logging.getLogger(__name__)
+
+    def path(self, device: str) -> Path:
+        return self.directory / (re.sub(r'[^A-Za-z0-9_.-]', '_', device) + self.SUFFIX)
+
+    def append(self, device: str, data, start: int, record_size: int, captured_at: float = None) -> int:
+        """
+        Ajouter un buffer ATTLOG brut lu à partir de l'offset start (0 pour une lecture complète).
+
+        :return: position de la trame dans le fichier
+        """
+        data = bytes(data)
+        header = FRAME.pack(FRAME_MAGIC, FRAME_VERSION, record_size, start,
+                            captured_at or time.time(), len(data), zlib.crc32(data))
+        path = self.path(device)
+        with self.lock:
+            if path not in self.checked:
+                self._repair(path)
+                self.checked.add(path)
+            with open(path, 'ab') as f:
+                position = f.tell()
+                f.write(header + data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            self.frames_written += 1
+            self.bytes_written += len(header) + len(data)
+        return position
+
+    def rename(self, old: str, new: str) -> bool:
+        """
+        Reprendre l'archive enregistrée sous old dans celle de new (ancienne archive par numéro de série).
+
+        Les trames de old sont ajoutées à la suite de celles de new: elles sont plus récentes
+        (le numéro de série n'était connu qu'après les premières lectures).
+        """
+        source, target = self.path(old), self.path(new)
+        if source == target or not source.exists():
+            return False
+        with self.lock:
+            self._repair(source)
+            if target.exists():
+                self._repair(target)
+                with open(source, 'rb') as src, open(target, 'ab') as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                source.unlink()
+            else:
+                os.replace(source, target)
+            self.checked.discard(source)
+        self.logger.info(f"🔁 Archive {source.name} reprise dans {target.name}")
+        return True
+
+    def _repair(self, path: Path):
+        """Tronquer une trame incomplète laissée par un arrêt brutal (sinon les suivantes seraient illisibles)"""
+        if not path.exists():
+            return
+        size = path.stat().st_size
+        end = self._valid_end(path, size)
+        if end < size:
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+            self.logger.warning(f"🩹 Archive {path.name}: trame incomplète de {size - end} octets supprimée")
+
+    @staticmethod
+    def _valid_end(path: Path, size: int) -> int:
+        position = 0
+        with open(path, 'rb') as f:
+            while position + FRAME.size <= size:
+                f.seek(position)
+                magic, _, _, _, _, length, _ = FRAME.unpack(f.read(FRAME.size))
+                if magic != FRAME_MAGIC or position + FRAME.size + length > size:
+                    break
+                position += FRAME.size + length
+        return position
+
+    def frames(self, device: str, verify: bool = True) -> Iterator[ArchiveFrame]:
+        """
+        Parcourir les trames d'un device (lecture mmap).
+
+        Une trame corrompue (CRC32 faux) est ignorée; la lecture s'arrête à une trame incomplète.
+        Les vues renvoyées ne sont valides que pendant l'itération.
+        """
+        path = self.path(device)
+        if not path.exists() or path.stat().st_size == 0:
+            return
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                position = 0
+                while position + FRAME.size <= len(view):
+                    magic, _, record_size, start, captured_at, length, crc = FRAME.unpack_from(view, position)
+                    data_start = position + FRAME.size
+                    if magic != FRAME_MAGIC or data_start + length > len(view):
+                        break
+                    data = view[data_start:data_start + length]
+                    if verify and zlib.crc32(data) != crc:
+                        self.logger.warning(f"⚠️ Archive {path.name}: trame corrompue à l'octet {position} ignorée")
+                    else:
+                        yield ArchiveFrame(position, start, record_size, captured_at, data)
+                    data.release()
+                    position = data_start + length
+            finally:
+                view.release()
+
+    def replay(self, device: str, users: UserIndex = None, since: float = None) -> List[AttendanceRecord]:
+        """
+        Redécoder les pointages archivés d'un device, chacun une seule fois.
+
+        Les trames sont replacées par offset dans le log du device: une relecture complète n'apporte
+        que les enregistrements pas encore vus, sauf si son premier enregistrement diffère (log effacé).
+
+        :param users: table utilisateurs (formats 8 et 16 octets); sans elle l'uid tient lieu d'identifiant
+        :param since: ignorer les pointages archivés pour la première fois avant cette date (epoch)
+        """
+        users = users or UserIndex([])
+        attendances = []
+        covered: List[Tuple[int, int]] = []  # Intervalles d'octets déjà restitués du log courant
+        head = None  # Premier enregistrement du log courant
+        for frame in self.frames(device):
+            size = frame.record_size
+            if not size:
+                continue
+            with frame.body as body:
+                base = frame.start - ATTLOG_HEADER_SIZE if frame.start else 0
+                end = base + len(body) - len(body) % size
+                if not frame.start and len(body) >= size:
+                    first = body[:size].tobytes()
+                    # Une lecture complète peut être archivée en plusieurs trames: la taille déclarée fait foi
+                    if head is not None and (first != head or frame.log_size < covered[-1][1]):
+                        covered = []  # Nouveau log sur le device
+                    head = first
+                fresh = b''.join(body[a - base:b - base].tobytes() for a, b in _missing(covered, base, end, size))
+            covered = _merge(covered, base, end)
+            if fresh and (since is None or frame.captured_at >= since):
+                attendances.extend(decode_records(fresh, size, users))
+        return attendances
+
+    def devices(self) -> List[str]:
+        """Noms des fichiers d'archive présents (un par device)"""
+        return sorted(path.name[:-len(self.SUFFIX)] for path in self.directory.glob('*' + self.SUFFIX))
+
+    def get_stats(self) -> Dict[str, object]:
+        sizes = {path.name[:-len(self.SUFFIX)]: path.stat().st_size for path in self.directory.glob('*' + self.SUFFIX)}
+        return {
+            'path': str(self.directory),
+            'devices': len(sizes),
+            'bytes': sum(sizes.values()),
+            'frames_written': self.frames_written,
+            'bytes_written': self.bytes_written,
+        }
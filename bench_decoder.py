@@ -0,0 +1,106 @@
+"""
+Micro-benchmark du décodage ATTLOG: zk.ZK.get_attendance (pyzk) contre ZKDevice.get_attendance.
+
+Les deux versions décodent les mêmes buffers en mémoire (aucun device requis):
+    python bench_decoder.py --records 100000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+from struct import pack
+
+from zk import ZK
+from zkteco_device import ZKDevice
+from zkteco_simulator import encode_time
+
+
+def build_buffers(records: int, users: int, record_size: int):
+    """Construire les buffers ATTLOG et utilisateurs (format zk8, 72 octets)"""
+    rnd = random.Random(42)
+    start = datetime(2024, 1, 1, 8, 0, 0)
+    user_rows = []
+    for uid in range(1, users + 1):
+        user_rows.append(pack('<HB8s24sIx7sx24s', uid, 0, b'', b'User %d' % uid, 0, b'1', str(1000 + uid).encode()))
+    user_body = b''.join(user_rows)
+
+    rows = []
+    for i in range(records):
+        uid = rnd.randint(1, users)
+        t = pack('<I', encode_time(start + timedelta(seconds=37 * i)))
+        if record_size == 8:
+            rows.append(pack('<HB4sB', uid, 1, t, i % 2))
+        elif record_size == 16:
+            rows.append(pack('<I4sBB2sI', 1000 + uid, t, 1, i % 2, b'\x00\x00', 0))
+        else:
+            rows.append(pack('<H24sB4sB8s', uid, str(1000 + uid).encode(), 1, t, i % 2, b''))
+    body = b''.join(rows)
+    return pack('<I', len(body)) + body, pack('<I', len(user_body)) + user_body
+
+
+class _OfflineMixin:
+    """Remplace les échanges réseau par des buffers en mémoire"""
+
+    def load(self, attlog: bytes, userdata: bytes, records: int, users: int):
+        self._attlog = attlog
+        self._userdata = userdata
+        self._records = records
+        self._users = users
+        return self
+
+    def read_sizes(self):
+        self.records = self._records
+        self.users = self._users
+        return True
+
+    def read_with_buffer(self, command, fct=0, ext=0):
+        data = self._userdata if fct else self._attlog
+        return data, len(data)
+
+
+class OfflineZK(_OfflineMixin, ZK):
+    pass
+
+
+class OfflineZKDevice(_OfflineMixin, ZKDevice):
+    pass
+
+
+def measure(device, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = device.get_attendance()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du décodeur ATTLOG")
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--record-size', type=int, nargs='*', default=[8, 16, 40], choices=[8, 16, 40])
+    parser.add_argument('--skip-pyzk', action='store_true', help="Ne mesurer que le nouveau décodeur")
+    args = parser.parse_args()
+
+    print(f"📊 Décodage de {args.records} pointages, {args.users} utilisateurs")
+    for record_size in args.record_size:
+        attlog, userdata = build_buffers(args.records, args.users, record_size)
+        new_time, new_result = measure(
+            OfflineZKDevice('127.0.0.1').load(attlog, userdata, args.records, args.users), args.repeat)
+        line = f"  {record_size:>2} octets: ZKDevice {new_time * 1000:9.1f} ms"
+        if not args.skip_pyzk:
+            old_time, old_result = measure(
+                OfflineZK('127.0.0.1').load(attlog, userdata, args.records, args.users), 1)
+            same = [(a.user_id, a.timestamp, a.status, a.punch, a.uid) for a in old_result] == \
+                   [(a.user_id, a.timestamp, a.status, a.punch, a.uid) for a in new_result]
+            line += f" | pyzk {old_time * 1000:9.1f} ms | x{old_time / new_time:6.1f}"
+            line += " | résultats identiques" if same else " | ❌ RÉSULTATS DIFFÉRENTS"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Benchmark de bout en bout du cycle lecture → filtrage → envoi de ZKTecoService.
+
+Le service tourne dans un processus séparé (mémoire mesurée sans le harnais) contre le simulateur
+de device (zkteco_simulator.py) et l'API locale (mock_api.py). Pour chaque taille de log: synchro
+initiale complète, puis des cycles incrémentaux avec quelques nouveaux pointages.
+
+    python bench_sync.py --sizes 1000 10000 100000 500000 --api-latency 0.02 --error-rate 0.01
+
+Les résultats sont ajoutés à bench_results.json (une entrée par exécution, avec le commit git)
+pour comparer les versions.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from mock_api import DUPLICATE_MODES, MockPointagesAPI
+from zkteco_simulator import RECORD_SIZES, SimulatedDevice, ZKTecoSimulator
+
+# Délai maximal pour vider la file d'envoi après un cycle (secondes)
+FLUSH_TIMEOUT = 600
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Percentile par rang (p entre 0 et 100)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pic de mémoire résidente du processus (None si indisponible, par exemple sous Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_version() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _flush(service, worker) -> int:
+    """Envoyer la file du device jusqu'à la vider (erreurs simulées comprises). :return: pointages restants"""
+    deadline = time.monotonic() + FLUSH_TIMEOUT
+    while service.outbox.pending_count(worker.key) and time.monotonic() < deadline:
+        wait = service._breaker(worker).retry_in()
+        if wait:
+            time.sleep(min(wait, 1.0))
+        service._upload(worker, force=True)
+    return service.outbox.pending_count(worker.key)
+
+
+def _run_service(config_file: str, cycles: int, punches: int, conn):
+    """Processus du service: synchro initiale puis cycles incrémentaux (les pointages sont ajoutés par le parent)"""
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    from config import Config
+    from service import ZKTecoService
+
+    service = ZKTecoService('polling', Config(config_file))
+    worker = service.workers[0]
+    # Tout le log est envoyé lors de la première synchro (pas de fenêtre de 24h)
+    worker.last_successful_sync = datetime(2000, 1, 1)
+    service.fleet.start()
+    try:
+        started = time.perf_counter()
+        service._check_attendance(worker)
+        pending = _flush(service, worker)
+        initial = time.perf_counter() - started
+        durations = []
+        for _ in range(cycles):
+            conn.send(('punch', punches))
+            conn.recv()
+            started = time.perf_counter()
+            service._check_attendance(worker)
+            pending = _flush(service, worker)
+            durations.append(time.perf_counter() - started)
+    finally:
+        service.fleet.stop()
+        service.sessions.close_all()
+    conn.send(('result', {
+        'initial_sync_s': round(initial, 3),
+        'cycle_p50_ms': round(percentile(durations, 50) * 1000, 1) if durations else None,
+        'cycle_p99_ms': round(percentile(durations, 99) * 1000, 1) if durations else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'pending': pending,
+    }))
+
+
+def run_size(size: int, args) -> dict:
+    """Mesurer une taille de log (simulateur et API neufs)"""
+    device = SimulatedDevice(records=size, users=args.users, record_size=args.record_size,
+                             latency=args.device_latency, loss=args.loss, seed=args.seed)
+    workdir = Path(tempfile.mkdtemp(prefix='zkteco_bench_'))
+    try:
+        with ZKTecoSimulator(device) as simulator, \
+                MockPointagesAPI(latency=args.api_latency, error_rate=args.error_rate,
+                                 duplicates=args.duplicates, seed=args.seed) as api:
+            config_file = workdir / 'zkteco_config.json'
+            config_file.write_text(json.dumps({
+                'zkteco_ip': simulator.address[0],
+                'zkteco_port': simulator.address[1],
+                'api_url': api.url,
+                'api_gzip': args.gzip,
+                'attlog_archive': not args.no_archive,
+                'device_ping': False,  # Simulateur local: le ping mesurerait le lancement de ping, pas le device
+            }), encoding='utf-8')
+
+            context = multiprocessing.get_context('spawn')
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=_run_service,
+                                      args=(str(config_file), args.cycles, args.punches, child_conn))
+            process.start()
+            result = None
+            while result is None:
+                if not conn.poll(1):
+                    if not process.is_alive():
+                        raise RuntimeError(f"Le processus du service s'est arrêté (code {process.exitcode})")
+                    continue
+                kind, value = conn.recv()
+                if kind == 'punch':
+                    for _ in range(value):
+                        device.add_punch()
+                    conn.send('ok')
+                else:
+                    result = value
+            process.join()
+
+            api_stats = api.get_stats()
+            # Pointages distincts du device (l'API ignore ceux d'un même utilisateur à la même seconde)
+            expected = len({(user_id, timestamp, punch) for _, user_id, timestamp, _, punch in device.attendances})
+            return {
+                'records': size,
+                'records_per_s': round(size / result['initial_sync_s']) if result['initial_sync_s'] else None,
+                **result,
+                'delivered': api_stats['unique'],
+                'expected': expected,
+                'device_bytes': simulator.bytes_sent + simulator.bytes_received,
+                'api_bytes': api_stats['bytes_received'] + api_stats['bytes_sent'],
+                'api_requests': api_stats['requests'],
+                'api_errors': api_stats['errors'],
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def save_run(path: Path, run: dict) -> Optional[dict]:
+    """Ajouter l'exécution au fichier de résultats. :return: exécution précédente (comparaison)"""
+    data = {'runs': []}
+    if path.exists():
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+        except ValueError:
+            print(f"⚠️ {path} illisible, remplacé")
+    previous = data['runs'][-1] if data['runs'] else None
+    data['runs'].append(run)
+    path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de synchronisation de bout en bout")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 500000])
+    parser.add_argument('--cycles', type=int, default=20, help="Cycles incrémentaux après la synchro initiale")
+    parser.add_argument('--punches', type=int, default=10, help="Nouveaux pointages par cycle")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--record-size', type=int, default=40, choices=RECORD_SIZES)
+    parser.add_argument('--device-latency', type=float, default=0.0, help="Latence du device par réponse (s)")
+    parser.add_argument('--loss', type=float, default=0.0, help="Taux de perte de paquets du device (0-1)")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Latence de l'API par requête (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Proportion de réponses 503 de l'API")
+    parser.add_argument('--duplicates', default='skip', choices=DUPLICATE_MODES)
+    parser.add_argument('--gzip', action='store_true', help="Corps des requêtes compressés (api_gzip)")
+    parser.add_argument('--no-archive', action='store_true', help="Désactiver l'archive ATTLOG")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    run = {
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'version': git_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': [],
+    }
+    print(f"📊 Benchmark de synchronisation ({run['version'] or 'version inconnue'})")
+    for size in args.sizes:
+        result = run_size(size, args)
+        run['results'].append(result)
+        print(
+            f"  {size:>7} pointages: {result['records_per_s'] or 0:>7} pts/s | synchro {result['initial_sync_s']:.2f}s | "
+            f"cycle p50 {result['cycle_p50_ms']} ms p99 {result['cycle_p99_ms']} ms | RSS {result['peak_rss_mb']} Mo | "
+            f"device {result['device_bytes'] / 1e6:.1f} Mo, API {result['api_bytes'] / 1e6:.1f} Mo | "
+            f"{result['delivered']}/{result['expected']} reçus"
+        )
+
+    previous = save_run(Path(args.output), run)
+    if previous:
+        # Exécution précédente désignée par sa version, ou par sa date hors d'un dépôt git
+        reference = previous.get('version') or previous.get('started_at')
+        before = {r['records']: r for r in previous.get('results', [])}
+        for result in run['results']:
+            old = before.get(result['records'])
+            if reference and old and old.get('records_per_s') and result['records_per_s']:
+                change = (result['records_per_s'] / old['records_per_s'] - 1) * 100
+                print(f"  {result['records']:>7}: {change:+.1f}% pts/s par rapport à {reference}")
+    print(f"✅ Résultats ajoutés à {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import random
+import threading
+import time
+import logging
+from typing import Dict
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Délai exponentiel plafonné avec jitter (moitié fixe, moitié aléatoire) pour la tentative n (>= 1)"""
+    delay = min(base_delay * (2 ** max(attempt - 1, 0)), max_delay)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur d'un endpoint: après failure_threshold échecs consécutifs, les envois sont refusés
+    sans accès réseau pendant reset_timeout, puis un seul envoi d'essai est autorisé (semi-ouvert).
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 60, max_reset_timeout: float = 900):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max(reset_timeout, max_reset_timeout)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.open_count = 0
+        self.rejected = 0
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def allow(self) -> bool:
+        """Vrai si un envoi peut être tenté maintenant"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_progress = False
+            if self.state == self.HALF_OPEN and not self.trial_in_progress:
+                self.trial_in_progress = True
+                self.logger.info(f"🟡 Circuit {self.name} semi-ouvert: envoi d'essai")
+                return True
+            self.rejected += 1
+            return False
+
+    def retry_in(self) -> float:
+        """Secondes avant qu'un envoi d'essai soit autorisé (0 si le circuit est fermé)"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                self.logger.info(f"🟢 Circuit {self.name} refermé")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                # Essai raté: réouverture plus longue
+                self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            elif self.state == self.OPEN or self.failures < self.failure_threshold:
+                return
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.open_count += 1
+            self.trial_in_progress = False
+            self.logger.warning(
+                f"🔴 Circuit {self.name} ouvert après {self.failures} échecs: envois suspendus {int(self.reset_timeout)}s"
+            )
+
+    def get_stats(self) -> dict:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'open_count': self.open_count,
+            'rejected': self.rejected,
+            'retry_in': int(self.retry_in()),
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, failure_threshold: int = 5, reset_timeout: float = 60,
+                max_reset_timeout: float = 900) -> CircuitBreaker:
+    """Disjoncteur partagé par tout le processus pour cet endpoint (paramètres lus à la création)"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, failure_threshold, reset_timeout, max_reset_timeout)
+            _breakers[name] = breaker
+        return breaker
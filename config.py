@@ -4,7 +4,7 @@ from pathlib import Path
 import sys
 
 class Config:
-    def __init__(self):
+    def __init__(self, config_file=None):
         # Utiliser le répertoire de l'exécutable pour la portabilité
         if getattr(sys, 'frozen', False):
             # Si on est dans un exécutable PyInstaller
@@ -13,7 +13,8 @@ class Config:
             # Si on est en développement
             base_path = Path(__file__).parent
             
-        self.config_file = base_path / "zkteco_config.json"
+        # Fichier explicite: bases et archive sont créées à côté (benchmarks, instances multiples)
+        self.config_file = Path(config_file) if config_file else base_path / "zkteco_config.json"
         self.default_config = {
             "zkteco_ip": "192.168.41.155",
             "zkteco_port": 4370,
@@ -21,9 +22,89 @@ class Config:
             # CHANGER localhost par l'IP RÉELLE de ton serveur Laravel
             "api_url": "http://192.168.1.100:8000/api/pointages",  # ← IP de ton serveur
             "polling_interval": 300,
+            # Polling adaptatif: plus court quand les pointages s'enchaînent, espacé hors horaires d'ouverture
+            "min_polling_interval": 30,
+            "off_hours_interval": 1800,
+            "target_punches_per_poll": 3,
+            "business_hours": {"start": "07:00", "end": "22:00", "days": [0, 1, 2, 3, 4, 5, 6]},
+            # polling: lecture périodique / realtime: écoute des événements + réconciliation
+            "service_mode": "polling",
+            "reconciliation_interval": 1800,
             "timezone": "Africa/Casablanca",
             "max_retries": 3,
-            "retry_delay": 30
+            # Envoi par lots: taille d'un lot, lots envoyés en parallèle, corps gzip (à activer si l'API le supporte)
+            "api_batch_size": 500,
+            "api_max_in_flight": 2,
+            "api_gzip": False,
+            "api_timeout": 30,
+            # Log du device décodé par lots de api_batch_size pendant le transfert; premiers lots envoyés sans attendre la fin
+            "stream_upload": True,
+            # Connexions HTTP conservées entre les synchros (keep-alive, reprise de session TLS, préchauffage)
+            "api_pool_connections": 4,
+            "api_pool_maxsize": 8,
+            "api_keepalive": True,
+            "api_tls_resumption": True,
+            "api_prewarm": True,
+            # Lots refusés: nouvel essai en arrière-plan (backoff exponentiel avec jitter, en secondes)
+            "api_retry_base_delay": 15,
+            "api_retry_max_delay": 900,
+            # Disjoncteur: envois suspendus après N échecs consécutifs, puis un envoi d'essai
+            "api_circuit_failure_threshold": 5,
+            "api_circuit_reset_timeout": 60,
+            "api_circuit_max_reset_timeout": 900,
+            "retry_delay": 30,
+            "max_backoff": 1800,
+            # Plusieurs terminaux: [{"name": "Salon A", "ip": "...", "port": 4370}, ...]
+            # Si vide, le device unique zkteco_ip/zkteco_port est utilisé
+            "devices": [],
+            "max_concurrent_devices": 4,
+            # Session persistante avec le device (keep-alive entre les polls)
+            "session_keepalive": True,
+            # Ping ICMP avant la connexion au device (à désactiver si l'ICMP est filtré)
+            "device_ping": True,
+            "session_health_interval": 60,
+            "session_idle_timeout": 900,
+            # File d'envoi locale (SQLite): pointages non acquittés et curseurs des devices
+            "outbox_path": "zkteco_outbox.db",
+            "outbox_batch_size": 2000,
+            "outbox_retention_days": 30,
+            # Copie locale indexée des pointages (recherches par période sans télécharger le log du device)
+            "attendance_store_path": "zkteco_attendance.db",
+            # Archive locale des buffers ATTLOG bruts (un fichier en ajout seul par device, relecture sans le device)
+            "attlog_archive": True,
+            "attlog_archive_dir": "attlog_archive",
+            "attlog_archive_fsync": False,
+            # Rotation du log des devices (optionnelle): effacement de l'ATTLOG en heures creuses,
+            # une fois tous les pointages acquittés par l'API et vérifiés (nombre + somme de contrôle)
+            "log_rotation": False,
+            "log_rotation_min_records": 20000,
+            "log_rotation_window": {"start": "02:00", "end": "05:00"},
+            # Index des pointages déjà acquittés (doublons écartés avant l'envoi)
+            "punch_index_path": "zkteco_punch_index.db",
+            "punch_index_retention_days": 90,
+            # Métriques par phase (durées, volumes, nouveaux essais) au format Prometheus sur GET /metrics
+            "metrics_enabled": True,
+            "metrics_host": "127.0.0.1",
+            "metrics_port": 9108,
+            # Journal JSON (une ligne par message) écrit par un thread dédié, rotation à minuit et par taille
+            "log_file": "zkteco_service.log",
+            "log_level": "INFO",
+            "log_format": "json",
+            "log_max_bytes": 10485760,
+            "log_when": "midnight",
+            "log_backup_count": 14,
+            # Découverte des terminaux sur le réseau local: un device injoignable est recherché par son
+            # numéro de série (sous-réseau de l'interface par défaut si discovery_network est vide)
+            "discovery_enabled": True,
+            "discovery_network": "",
+            "discovery_ports": [4370],
+            "discovery_timeout": 1.0,
+            "discovery_interval": 300,
+            # Vérification de santé légère des devices (read_sizes, firmware, numéro de série), 0 pour désactiver;
+            # résultat gardé health_cache_ttl secondes, alerte au-delà de health_records_warning de la capacité
+            "health_check_interval": 300,
+            "health_cache_ttl": 15,
+            "health_records_warning": 0.9
         }
         self.load_config()
     
@@ -0,0 +1,203 @@
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from zk.exception import ZKError
+from metrics import METRICS
+from zkteco_device import ZKDevice
+
+T = TypeVar('T')
+
+
+class DeviceSession:
+    """Connexion authentifiée à un device, réutilisée entre les polls"""
+
+    def __init__(self, ip: str, port: int = 4370, timeout: int = 5,
+                 health_interval: float = 60, idle_timeout: float = 900, ping: bool = True,
+                 metrics_label: str = None):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.ping = ping  # Ping ICMP avant chaque connexion
+        self.metrics_label = metrics_label or f"{ip}:{port}"
+        self.health_interval = health_interval
+        self.idle_timeout = idle_timeout
+        self.conn: Optional[ZKDevice] = None
+        self.lock = threading.RLock()
+        self.waiters = 0
+        self.waiters_lock = threading.Lock()
+        self.last_used = 0.0
+        self.last_health_check = 0.0
+        self.connect_count = 0
+        self.reconnect_count = 0
+        self.logger = logging.getLogger(__name__)
+
+    def _connect(self) -> ZKDevice:
+        zk = ZKDevice(self.ip, port=self.port, timeout=self.timeout, ommit_ping=not self.ping,
+                      metrics_label=self.metrics_label)
+        self.conn = zk.connect()
+        self.connect_count += 1
+        self.last_used = self.last_health_check = time.monotonic()
+        self.logger.info(f"✅ Session ouverte avec le device {self.ip}:{self.port}")
+        return self.conn
+
+    def _drop(self):
+        """Abandonner la connexion courante sans attendre le device"""
+        conn, self.conn = self.conn, None
+        if conn:
+            try:
+                conn.disconnect()
+            except Exception:
+                pass
+
+    def _is_healthy(self) -> bool:
+        """Vérification légère: une seule commande CMD_GET_TIME"""
+        try:
+            self.conn.get_time()
+            self.last_health_check = time.monotonic()
+            return True
+        except (ZKError, OSError) as e:
+            self.logger.warning(f"⚠️ Session {self.ip}:{self.port} inactive ({e}), reconnexion")
+            return False
+
+    def _ensure_connected(self, check_health: bool = True) -> ZKDevice:
+        now = time.monotonic()
+        if self.conn and now - self.last_used > self.idle_timeout:
+            self.logger.info(f"⏳ Session {self.ip}:{self.port} inactive depuis {int(now - self.last_used)}s, fermeture")
+            self.close()
+        if (check_health and self.conn and now - self.last_health_check > self.health_interval
+                and not self._is_healthy()):
+            self._drop()
+            self.reconnect_count += 1
+        if not self.conn:
+            self._connect()
+        return self.conn
+
+    def run(self, operation: Callable[[ZKDevice], T], check_health: bool = True, retry: bool = False) -> T:
+        """
+        Exécuter une opération sur la connexion.
+
+        :param check_health: vérifier d'abord une session inactive depuis health_interval (CMD_GET_TIME);
+            inutile si la première commande de l'opération est elle-même une sonde (read_sizes)
+        :param retry: en cas d'erreur réseau, reconnecter et relancer l'opération une fois; réservé aux
+            opérations qui peuvent être rejouées sans effet de bord (lectures), jamais à un effacement
+        """
+        with self._exclusive():
+            conn = self._ensure_connected(check_health)
+            try:
+                result = operation(conn)
+            except (ZKError, OSError) as e:
+                self._drop()
+                self.reconnect_count += 1
+                if not retry:
+                    raise
+                self.logger.warning(f"🔄 Erreur sur la session {self.ip}:{self.port} ({e}), nouvelle tentative")
+                METRICS.inc('zkteco_retries_total', device=self.metrics_label, kind='session')
+                result = operation(self._connect())
+            self.last_used = time.monotonic()
+            if not check_health:
+                self.last_health_check = self.last_used  # L'opération a prouvé que la session répond
+            return result
+
+    @contextmanager
+    def _exclusive(self):
+        """Accès exclusif à la connexion, en se signalant comme en attente pendant l'acquisition"""
+        with self.waiters_lock:
+            self.waiters += 1
+        try:
+            self.lock.acquire()
+        finally:
+            with self.waiters_lock:
+                self.waiters -= 1
+        try:
+            yield
+        finally:
+            self.lock.release()
+
+    def has_waiters(self) -> bool:
+        """Vrai si une autre opération attend la session (utilisé pour interrompre une écoute longue)"""
+        return self.waiters > 0
+
+    def maintain(self):
+        """Maintenance périodique: fermeture après inactivité et keep-alive"""
+        if not self.lock.acquire(blocking=False):
+            return  # Une opération est en cours, la session est active
+        try:
+            if not self.conn:
+                return
+            now = time.monotonic()
+            if now - self.last_used > self.idle_timeout:
+                self.logger.info(f"⏳ Session {self.ip}:{self.port} inactive, fermeture")
+                self.close()
+            elif now - self.last_health_check > self.health_interval and not self._is_healthy():
+                self._drop()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Fermer proprement la session"""
+        with self._exclusive():
+            if self.conn:
+                try:
+                    self.conn.disconnect()
+                    self.logger.info(f"✅ Session fermée avec le device {self.ip}:{self.port}")
+                except Exception as e:
+                    self.logger.error(f"❌ Erreur déconnexion: {e}")
+                finally:
+                    self.conn = None
+
+    def get_stats(self) -> dict:
+        return {
+            'connected': self.conn is not None,
+            'connect_count': self.connect_count,
+            'reconnect_count': self.reconnect_count,
+            'idle_seconds': int(time.monotonic() - self.last_used) if self.conn else None,
+        }
+
+
+class SessionManager:
+    """Registre des sessions par device avec un thread de maintenance commun"""
+
+    def __init__(self, health_interval: float = 60, idle_timeout: float = 900, ping: bool = True):
+        self.health_interval = health_interval
+        self.idle_timeout = idle_timeout
+        self.ping = ping
+        self.sessions: Dict[Tuple[str, int], DeviceSession] = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def get(self, ip: str, port: int = 4370, timeout: int = 5, metrics_label: str = None) -> DeviceSession:
+        with self.lock:
+            session = self.sessions.get((ip, port))
+            if session is None:
+                session = DeviceSession(ip, port, timeout, self.health_interval, self.idle_timeout, self.ping,
+                                        metrics_label)
+                self.sessions[(ip, port)] = session
+            if self.thread is None or not self.thread.is_alive():
+                self.stop_event.clear()
+                self.thread = threading.Thread(target=self._maintenance_loop, daemon=True)
+                self.thread.start()
+            return session
+
+    def _maintenance_loop(self):
+        interval = max(1.0, min(self.health_interval, self.idle_timeout) / 2)
+        while not self.stop_event.wait(interval):
+            with self.lock:
+                sessions = list(self.sessions.values())
+            for session in sessions:
+                session.maintain()
+
+    def close_all(self):
+        self.stop_event.set()
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {f"{ip}:{port}": s.get_stats() for (ip, port), s in self.sessions.items()}
@@ -0,0 +1,193 @@
+import asyncio
+import ipaddress
+import socket
+import logging
+from struct import unpack
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from zk import const
+
+from zkteco_async import AsyncZKDevice, create_packet
+
+# Port du protocole ZKTeco (TCP et UDP)
+ZK_PORT = 4370
+# Sondes TCP simultanées lors d'un balayage
+MAX_CONCURRENT_PROBES = 128
+
+logger = logging.getLogger(__name__)
+
+
+class DiscoveredDevice:
+    """Terminal trouvé sur le réseau (serial None si le numéro de série n'a pas pu être lu)"""
+
+    def __init__(self, ip: str, port: int = ZK_PORT, serial: Optional[str] = None, protocol: str = 'tcp'):
+        self.ip = ip
+        self.port = port
+        self.serial = serial
+        self.protocol = protocol
+
+    def to_dict(self) -> dict:
+        return {'ip': self.ip, 'port': self.port, 'serial': self.serial, 'protocol': self.protocol}
+
+    def __repr__(self):
+        return f"<DiscoveredDevice {self.ip}:{self.port} serial={self.serial} ({self.protocol})>"
+
+
+def local_network(prefix: int = 24) -> str:
+    """Sous-réseau de l'interface par défaut (ex: 192.168.1.0/24), sans envoyer de paquet"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # connect() d'une socket UDP choisit seulement l'interface de sortie
+        sock.connect(('10.255.255.255', 1))
+        ip = sock.getsockname()[0]
+    except OSError:
+        ip = '127.0.0.1'
+    finally:
+        sock.close()
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+
+def _udp_packet(command: int, session_id: int, reply_id: int, data: bytes = b'') -> bytes:
+    """Paquet UDP: celui du TCP sans l'en-tête 0x5050/0x7282"""
+    return create_packet(command, data, session_id, reply_id)[8:]
+
+
+async def probe_tcp(ip: str, port: int = ZK_PORT, timeout: float = 1.0) -> Optional[DiscoveredDevice]:
+    """
+    Vérifier qu'un terminal ZKTeco répond sur ip:port (poignée de main CMD_CONNECT) et lire son numéro de série.
+
+    :return: None si le port est fermé ou si ce n'est pas un terminal ZKTeco
+    """
+    device = AsyncZKDevice(ip, port, timeout=timeout)
+    try:
+        await device.connect()
+    except Exception as e:
+        if 'Unauthenticated' in str(e):
+            return DiscoveredDevice(ip, port)  # Mot de passe de communication: terminal présent, série illisible
+        return None
+    try:
+        serial = await device.get_serialnumber()
+    except Exception as e:
+        logger.debug("Numéro de série illisible sur %s:%s: %s", ip, port, e)
+        serial = None
+    finally:
+        try:
+            await device.disconnect()
+        except Exception:
+            pass
+    return DiscoveredDevice(ip, port, serial or None)
+
+
+class _DiscoveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.replies: asyncio.Queue = asyncio.Queue()
+
+    def datagram_received(self, data: bytes, address):
+        if len(data) >= 8:
+            command, _, session_id, reply_id = unpack('<4H', data[:8])
+            self.replies.put_nowait((address[:2], command, session_id, reply_id, data[8:]))
+
+
+async def _collect(protocol: _DiscoveryProtocol, timeout: float, expected: int = None):
+    """Réponses reçues pendant timeout secondes (ou jusqu'à expected réponses)"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    replies = []
+    while expected is None or len(replies) < expected:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            replies.append(await asyncio.wait_for(protocol.replies.get(), remaining))
+        except asyncio.TimeoutError:
+            break
+    return replies
+
+
+async def udp_broadcast(broadcast: str, ports: Iterable[int] = (ZK_PORT,), timeout: float = 1.0) -> List[DiscoveredDevice]:
+    """
+    Découverte UDP: CMD_CONNECT diffusé sur le sous-réseau, puis ~SerialNumber et CMD_EXIT
+    dans la session ouverte par chaque terminal qui répond.
+    """
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        _DiscoveryProtocol, local_addr=('0.0.0.0', 0), allow_broadcast=True)
+    try:
+        for port in ports:
+            transport.sendto(_udp_packet(const.CMD_CONNECT, 0, const.USHRT_MAX - 1), (broadcast, port))
+        sessions: Dict[Tuple[str, int], Tuple[int, int]] = {}
+        found: Dict[Tuple[str, int], DiscoveredDevice] = {}
+        for address, command, session_id, reply_id, _ in await _collect(protocol, timeout):
+            if command in (const.CMD_ACK_OK, const.CMD_ACK_UNAUTH) and address not in found:
+                found[address] = DiscoveredDevice(address[0], address[1], protocol='udp')
+                if command == const.CMD_ACK_OK:
+                    sessions[address] = (session_id, reply_id)
+
+        for address, (session_id, reply_id) in sessions.items():
+            transport.sendto(_udp_packet(const.CMD_OPTIONS_RRQ, session_id, reply_id, b'~SerialNumber\x00'), address)
+        for address, command, _, _, data in await _collect(protocol, timeout, len(sessions)):
+            if address in sessions and command == const.CMD_ACK_OK:
+                serial = data.split(b'=', 1)[-1].split(b'\x00')[0].replace(b'=', b'').decode(errors='ignore')
+                found[address].serial = serial or None
+        # Libérer les sessions ouvertes sur les terminaux
+        for address, (session_id, reply_id) in sessions.items():
+            transport.sendto(_udp_packet(const.CMD_EXIT, session_id, reply_id + 1), address)
+        return list(found.values())
+    finally:
+        transport.close()
+
+
+async def discover_async(network: str = None, ports: Iterable[int] = (ZK_PORT,), timeout: float = 1.0,
+                         udp: bool = True, broadcast: str = None,
+                         concurrency: int = MAX_CONCURRENT_PROBES) -> List[DiscoveredDevice]:
+    """
+    Balayer un sous-réseau: sondes TCP simultanées de chaque adresse et port, plus la découverte UDP.
+
+    :param network: sous-réseau CIDR (celui de l'interface par défaut si None)
+    :param broadcast: adresse de diffusion UDP (celle du sous-réseau par défaut)
+    """
+    net = ipaddress.ip_network(network or local_network(), strict=False)
+    hosts = list(net.hosts()) or [net.network_address]
+    ports = list(ports)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(ip: str, port: int):
+        async with semaphore:
+            return await probe_tcp(ip, port, timeout)
+
+    tasks = [bounded(str(ip), port) for ip in hosts for port in ports]
+    if udp:
+        tasks.append(udp_broadcast(broadcast or str(net.broadcast_address), ports, timeout))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    found: List[DiscoveredDevice] = []
+    for result in results:
+        if isinstance(result, BaseException):
+            logger.debug("Sonde de découverte en échec: %s", result)
+            continue
+        for device in (result if isinstance(result, list) else [result] if result else []):
+            # Un terminal trouvé en TCP et en UDP n'apparaît qu'une fois (la sonde TCP d'abord);
+            # sans numéro de série lu (authentification refusée), seul le port identifie le terminal
+            same = next((d for d in found if d.ip == device.ip and (
+                (d.serial is not None and d.serial == device.serial) or d.port == device.port)), None)
+            if same is None:
+                found.append(device)
+            elif same.serial is None:
+                # L'autre sonde a pu lire le numéro de série: il est conservé
+                same.serial = device.serial
+    found.sort(key=lambda d: (ipaddress.ip_address(d.ip), d.port))
+    return found
+
+
+def discover(network: str = None, ports: Iterable[int] = (ZK_PORT,), timeout: float = 1.0,
+             udp: bool = True, broadcast: str = None) -> List[DiscoveredDevice]:
+    """Version bloquante de discover_async (CLI, GUI, service)"""
+    devices = asyncio.run(discover_async(network, ports, timeout, udp, broadcast))
+    logger.info(f"🔎 {len(devices)} terminal(aux) ZKTeco trouvé(s) sur {network or local_network()}")
+    return devices
+
+
+def find_device(serial: str, network: str = None, ports: Iterable[int] = (ZK_PORT,),
+                timeout: float = 1.0) -> Optional[DiscoveredDevice]:
+    """Retrouver un terminal par son numéro de série (après un changement d'adresse DHCP)"""
+    return next((device for device in discover(network, ports, timeout) if device.serial == serial), None)
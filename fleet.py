@@ -0,0 +1,451 @@
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from circuit_breaker import backoff_delay
+
+
+class DeviceWorker:
+    """État de synchronisation propre à un device: curseur, erreurs et backoff"""
+
+    # Délai avant une nouvelle lecture du numéro de série après un échec (secondes)
+    SERIAL_RETRY_INTERVAL = 900
+
+    def __init__(self, ip: str, port: int = 4370, timeout: int = 5, name: str = None, api_url: str = None):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.name = name or f"{ip}:{port}"
+        self.api_url = api_url  # Optionnel: API différente de celle de la configuration globale
+        self.serial = None  # Numéro de série lu sur le device
+        self.next_serial_lookup = 0.0  # time.monotonic() de la prochaine lecture du numéro de série
+        # Adresse de connexion: celle de la configuration, ou celle où la découverte a retrouvé le device
+        self.address = (ip, port)
+        self.last_discovery = None  # time.monotonic() de la dernière recherche sur le réseau
+        self.health = None  # Dernière sonde de santé (read_sizes, firmware, numéro de série)
+        self.health_error = None
+        self.next_health_check = None  # time.monotonic() de la prochaine sonde (None: pas encore planifiée)
+        self.listening = False  # Écoute temps réel en cours sur la session du device
+        self.lock = threading.Lock()
+        self.drain_lock = threading.Lock()  # Un seul envoi de la file du device à la fois
+        self.attendance_cursor = None  # Position de lecture dans l'ATTLOG du device
+        self.initial_since = None  # Fenêtre (epoch) de la première lecture complète, tant qu'elle n'est pas terminée
+        self.error_count = 0
+        self.next_run = 0.0  # time.monotonic() du prochain passage
+        self.interval = None  # Dernier intervalle de polling retenu
+        self.punch_rate = 0.0  # Pointages par heure (moyenne glissante)
+        self.last_activity = None
+        self.force_requested = False
+        self.forced = False  # Passage en cours demandé par une synchro forcée
+        self.waiters: List[Future] = []  # Synchronisations forcées en attente du prochain passage
+        self.running_waiters: List[Future] = []  # ... et celles servies par le passage en cours
+        self.last_check = None
+        self.last_successful_sync = None
+        self.last_error = None
+        # Envoi vers l'API, replanifié indépendamment de la lecture du device
+        self.upload_failures = 0
+        self.next_upload = 0.0  # time.monotonic() du prochain essai d'envoi
+        self.last_upload_error = None
+        self.last_rotation = None  # Dernière rotation du log (résultat)
+        self.rotation_attempted = None  # Date de la dernière tentative: au plus une par jour
+        self.archive_failed = False  # Buffer lu non archivé: pas de rotation avant une lecture complète archivée
+
+    @property
+    def key(self) -> str:
+        return f"{self.ip}:{self.port}"
+
+    def serial_due(self) -> bool:
+        """Vrai si le numéro de série est inconnu et que sa lecture n'attend pas un nouvel essai"""
+        return self.serial is None and time.monotonic() >= self.next_serial_lookup
+
+    def record_activity(self, count: int, alpha: float = 0.3):
+        """Mettre à jour le débit de pointages observé entre deux lectures"""
+        now = time.monotonic()
+        if self.last_activity is not None:
+            rate = count * 3600 / max(now - self.last_activity, 1.0)
+            self.punch_rate = alpha * rate + (1 - alpha) * self.punch_rate
+        self.last_activity = now
+
+    def schedule_success(self, interval: float):
+        self.error_count = 0
+        self.last_error = None
+        self.interval = interval
+        self.next_run = time.monotonic() + interval
+
+    def sync_completed(self):
+        """Signaler la fin de la synchronisation aux demandes forcées servies par ce passage"""
+        waiters, self.running_waiters = self.running_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(True)
+
+    def schedule_failure(self, error: Exception, base_delay: float, max_delay: float):
+        """Backoff exponentiel propre au device"""
+        self.error_count += 1
+        self.last_error = str(error)
+        delay = backoff_delay(self.error_count, base_delay, max_delay)
+        self.next_run = time.monotonic() + delay
+        return delay
+
+    def upload_due(self, now: float = None) -> bool:
+        """Vrai si l'envoi n'attend pas de nouvel essai (ou si son délai est écoulé)"""
+        return not self.upload_failures or self.next_upload <= (now or time.monotonic())
+
+    def schedule_upload_retry(self, error: str, base_delay: float, max_delay: float, not_before: float = 0) -> float:
+        """Replanifier l'envoi en échec (backoff exponentiel avec jitter, au plus tôt dans not_before secondes)"""
+        self.upload_failures += 1
+        self.last_upload_error = error
+        delay = max(backoff_delay(self.upload_failures, base_delay, max_delay), not_before)
+        self.next_upload = time.monotonic() + delay
+        return delay
+
+    def upload_succeeded(self):
+        self.upload_failures = 0
+        self.last_upload_error = None
+        self.next_upload = 0.0
+
+    def get_status(self) -> dict:
+        return {
+            'name': self.name,
+            'serial': self.serial,
+            'ip': self.ip,
+            'port': self.port,
+            'address': f"{self.address[0]}:{self.address[1]}",
+            'last_check': self.last_check.isoformat() if self.last_check else None,
+            'last_successful_sync': self.last_successful_sync.isoformat() if self.last_successful_sync else None,
+            'error_count': self.error_count,
+            'last_error': self.last_error,
+            'polling_interval': int(self.interval) if self.interval is not None else None,
+            'punch_rate': round(self.punch_rate, 1),
+            'next_run_in': max(0, int(self.next_run - time.monotonic())),
+            'upload_failures': self.upload_failures,
+            'last_upload_error': self.last_upload_error,
+            'next_upload_in': max(0, int(self.next_upload - time.monotonic())) if self.upload_failures else None,
+            'last_rotation': self.last_rotation,
+            'archive_failed': self.archive_failed,
+            'health': self.health,
+            'health_error': self.health_error,
+        }
+
+
+def build_workers(config) -> List[DeviceWorker]:
+    """Construire la liste des devices depuis 'devices', ou depuis zkteco_ip/zkteco_port"""
+    default_timeout = config.get('timeout', 5)
+    devices = config.get('devices') or [{
+        'ip': config.get('zkteco_ip', '192.168.43.33'),
+        'port': config.get('zkteco_port', 4370),
+    }]
+    workers = []
+    for device in devices:
+        workers.append(DeviceWorker(
+            device['ip'],
+            device.get('port', 4370),
+            device.get('timeout', default_timeout),
+            device.get('name'),
+            device.get('api_url')
+        ))
+    return workers
+
+
+class PollingPolicy:
+    """Intervalle de polling adapté au débit de pointages observé et aux horaires d'ouverture"""
+
+    def __init__(self, config):
+        self.base_interval = config.get('polling_interval', 300)
+        self.min_interval = min(config.get('min_polling_interval', 30), self.base_interval)
+        self.off_hours_interval = max(config.get('off_hours_interval', 1800), self.base_interval)
+        # Nombre de pointages visé par lecture: plus le débit est élevé, plus l'intervalle raccourcit
+        self.target_punches = config.get('target_punches_per_poll', 3)
+        hours = config.get('business_hours') or {}
+        self.open_time = self._parse_time(hours.get('start', '00:00'))
+        self.close_time = self._parse_time(hours.get('end', '23:59'))
+        self.days = set(hours.get('days', range(7)))  # 0 = lundi
+
+    @staticmethod
+    def _parse_time(value: str):
+        return datetime.strptime(value, '%H:%M').time()
+
+    def is_open(self, now: datetime = None) -> bool:
+        now = now or datetime.now()
+        current = now.time()
+        if self.open_time < self.close_time:
+            return now.weekday() in self.days and self.open_time <= current < self.close_time
+        # Horaires à cheval sur minuit (ex: 20:00-02:00): la nuit appartient au jour d'ouverture
+        if current >= self.open_time:
+            return now.weekday() in self.days
+        return current < self.close_time and (now.weekday() - 1) % 7 in self.days
+
+    def seconds_until_open(self, now: datetime = None) -> float:
+        now = now or datetime.now()
+        if self.is_open(now):
+            return 0.0
+        for day in range(8):
+            opening = datetime.combine((now + timedelta(days=day)).date(), self.open_time)
+            if opening > now and opening.weekday() in self.days:
+                return (opening - now).total_seconds()
+        return self.off_hours_interval
+
+    def next_interval(self, worker: DeviceWorker, now: datetime = None) -> float:
+        now = now or datetime.now()
+        if not self.is_open(now) and worker.punch_rate < 1:
+            # Hors horaires et sans activité: lecture espacée, mais reprise dès l'ouverture
+            return max(self.min_interval, min(self.off_hours_interval, self.seconds_until_open(now)))
+        if worker.punch_rate <= 0:
+            return self.base_interval
+        interval = self.target_punches * 3600 / worker.punch_rate
+        return min(max(interval, self.min_interval), self.base_interval)
+
+
+class RotationPolicy:
+    """Rotation optionnelle du log des devices: seulement en heures creuses, une tentative par jour et par device"""
+
+    def __init__(self, config):
+        self.enabled = config.get('log_rotation', False)
+        self.min_records = config.get('log_rotation_min_records', 20000)
+        window = config.get('log_rotation_window') or {}
+        self.start = PollingPolicy._parse_time(window.get('start', '02:00'))
+        self.end = PollingPolicy._parse_time(window.get('end', '05:00'))
+
+    def in_window(self, now: datetime = None) -> bool:
+        current = (now or datetime.now()).time()
+        if self.start <= self.end:
+            return self.start <= current < self.end
+        return current >= self.start or current < self.end  # Fenêtre à cheval sur minuit
+
+    def is_due(self, worker: DeviceWorker, now: datetime = None) -> bool:
+        now = now or datetime.now()
+        cursor = worker.attendance_cursor
+        return (
+            self.enabled
+            and cursor is not None and cursor.checksum is not None
+            and cursor.records >= self.min_records
+            and worker.rotation_attempted != now.date()
+            and self.in_window(now)
+        )
+
+
+class FleetScheduler:
+    """Planificateur de synchronisation concurrente des devices (pool de threads borné)"""
+
+    # Attente maximale de la boucle entre deux réévaluations des échéances (secondes)
+    MAX_WAIT = 60
+
+    def __init__(self, max_workers: int = 4, max_uploads: int = 2):
+        self.max_workers = max(1, max_workers)
+        self.max_uploads = max(1, max_uploads)
+        self.executor: Optional[ThreadPoolExecutor] = None
+        # Pool séparé pour les nouveaux essais d'envoi: une API lente n'occupe jamais les threads des devices
+        self.upload_executor: Optional[ThreadPoolExecutor] = None
+        # Pool des sondes de santé: elles ne prennent jamais la place d'une synchronisation
+        self.health_executor: Optional[ThreadPoolExecutor] = None
+        # Recherches sur le réseau (balayage du sous-réseau): hors des threads et du verrou des devices
+        self.discovery_executor: Optional[ThreadPoolExecutor] = None
+        self.in_flight: Dict[str, Future] = {}
+        self.uploads: Dict[str, Future] = {}
+        self.health_checks: Dict[str, Future] = {}
+        self.discoveries: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                self._create_executors()
+
+    def _create_executors(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='zkteco-device')
+        self.upload_executor = ThreadPoolExecutor(max_workers=self.max_uploads, thread_name_prefix='zkteco-upload')
+        self.health_executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='zkteco-health')
+        self.discovery_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='zkteco-discovery')
+
+    def resize(self, max_workers: int, max_uploads: int):
+        """
+        Changer la taille des pools sans redémarrer: les nouveaux jobs partent dans de nouveaux pools,
+        ceux en cours (synchronisations, écoutes temps réel, envois) se terminent dans les anciens.
+        """
+        max_workers, max_uploads = max(1, max_workers), max(1, max_uploads)
+        with self.lock:
+            if (max_workers, max_uploads) == (self.max_workers, self.max_uploads):
+                return
+            self.logger.info(f"🔧 Pools redimensionnés: {max_workers} device(s), {max_uploads} envoi(s) simultanés")
+            self.max_workers, self.max_uploads = max_workers, max_uploads
+            if self.executor is None:
+                return  # Pas encore démarré: start() utilisera les nouvelles tailles
+            executors = [self.executor, self.upload_executor, self.health_executor, self.discovery_executor]
+            self._create_executors()
+        self.wake()
+        for executor in executors:
+            executor.shutdown(wait=False)
+
+    def submit_due(self, workers: List[DeviceWorker], job: Callable[[DeviceWorker], None]) -> int:
+        """Lancer le job des devices arrivés à échéance et pas déjà en cours. Ne bloque jamais."""
+        now = time.monotonic()
+        submitted = 0
+        with self.lock:
+            if self.executor is None:
+                return 0
+            for worker in workers:
+                future = self.in_flight.get(worker.key)
+                if future is not None and not future.done():
+                    continue  # Device lent: il ne retarde pas les autres
+                if worker.next_run > now and not worker.force_requested:
+                    continue
+                worker.forced, worker.force_requested = worker.force_requested, False
+                worker.running_waiters += worker.waiters
+                worker.waiters = []
+                self.in_flight[worker.key] = self.executor.submit(self._run, worker, job)
+                submitted += 1
+        return submitted
+
+    def submit_upload_retries(self, workers: List[DeviceWorker], job: Callable[[DeviceWorker], None]) -> int:
+        """Relancer les envois en échec dont le délai est écoulé, sans attendre la prochaine lecture du device"""
+        now = time.monotonic()
+        submitted = 0
+        with self.lock:
+            if self.upload_executor is None:
+                return 0
+            for worker in workers:
+                future = self.uploads.get(worker.key)
+                if not worker.upload_failures or worker.next_upload > now or (future is not None and not future.done()):
+                    continue
+                self.uploads[worker.key] = self.upload_executor.submit(self._run_upload, worker, job)
+                submitted += 1
+        return submitted
+
+    def submit_upload(self, worker: DeviceWorker, job: Callable[[DeviceWorker], None]) -> bool:
+        """Lancer un envoi du device dans le pool d'envoi, s'il n'y en a pas déjà un en cours. Ne bloque jamais."""
+        with self.lock:
+            if self.upload_executor is None:
+                return False
+            future = self.uploads.get(worker.key)
+            if future is not None and not future.done():
+                return False
+            self.uploads[worker.key] = self.upload_executor.submit(self._run_upload, worker, job)
+            return True
+
+    def submit_discovery(self, worker: DeviceWorker, job: Callable[[DeviceWorker], None]) -> bool:
+        """Lancer la recherche d'un device injoignable, s'il n'y en a pas déjà une en cours. Ne bloque jamais."""
+        with self.lock:
+            if self.discovery_executor is None:
+                return False
+            future = self.discoveries.get(worker.key)
+            if future is not None and not future.done():
+                return False
+            self.discoveries[worker.key] = self.discovery_executor.submit(self._run_discovery, worker, job)
+            return True
+
+    def submit_health_checks(self, workers: List[DeviceWorker], job: Callable[[DeviceWorker], None],
+                             interval: float) -> int:
+        """Lancer les sondes de santé arrivées à échéance (toutes les interval secondes, 0: désactivé)"""
+        if not interval or interval <= 0:
+            return 0
+        now = time.monotonic()
+        submitted = 0
+        with self.lock:
+            if self.health_executor is None:
+                return 0
+            for worker in workers:
+                future = self.health_checks.get(worker.key)
+                if (worker.next_health_check is not None and worker.next_health_check > now) or \
+                        (future is not None and not future.done()):
+                    continue
+                worker.next_health_check = now + interval
+                self.health_checks[worker.key] = self.health_executor.submit(self._run_health, worker, job)
+                submitted += 1
+        return submitted
+    
+    def next_due_in(self, workers: List[DeviceWorker]) -> float:
+        """Secondes avant la prochaine échéance (lecture, nouvel essai d'envoi ou sonde de santé) qui n'est pas en cours"""
+        now = time.monotonic()
+        delay = self.MAX_WAIT
+        with self.lock:
+            for worker in workers:
+                upload = self.uploads.get(worker.key)
+                if worker.upload_failures and (upload is None or upload.done()):
+                    delay = min(delay, worker.next_upload - now)
+                if worker.next_health_check is not None:
+                    delay = min(delay, worker.next_health_check - now)
+                future = self.in_flight.get(worker.key)
+                if future is not None and not future.done():
+                    continue  # Sa fin réveillera la boucle
+                if worker.force_requested:
+                    return 0
+                delay = min(delay, worker.next_run - now)
+        return max(0.0, delay)
+
+    def wait(self, timeout: float) -> bool:
+        """Attendre la prochaine échéance ou un réveil (synchro forcée, fin d'un job, configuration, arrêt)"""
+        woken = self.wake_event.wait(timeout)
+        self.wake_event.clear()
+        return woken
+
+    def wake(self):
+        self.wake_event.set()
+
+    def force(self, workers: List[DeviceWorker]) -> List[Future]:
+        """Demander un passage immédiat des devices. Les futures se terminent à la fin de leur synchronisation."""
+        waiters = []
+        with self.lock:
+            for worker in workers:
+                waiter = Future()
+                worker.waiters.append(waiter)
+                worker.force_requested = True
+                waiters.append(waiter)
+        self.wake()
+        return waiters
+
+    def run_all(self, workers: List[DeviceWorker], job: Callable[[DeviceWorker], None], timeout: float = None):
+        """Lancer le job sur tous les devices et attendre la fin (synchronisation forcée)"""
+        # Pool dédié: les threads du planificateur peuvent être occupés par des écoutes temps réel
+        with ThreadPoolExecutor(max_workers=min(max(len(workers), 1), self.max_workers)) as executor:
+            futures = [executor.submit(self._run, worker, job) for worker in workers]
+            for future in futures:
+                future.result(timeout=timeout)
+
+    def _run(self, worker: DeviceWorker, job: Callable[[DeviceWorker], None]):
+        try:
+            job(worker)
+        except Exception as e:
+            self.logger.error(f"💥 Erreur inattendue sur le device {worker.name}: {e}")
+        finally:
+            worker.sync_completed()
+            self.wake()
+
+    def _run_upload(self, worker: DeviceWorker, job: Callable[[DeviceWorker], None]):
+        try:
+            job(worker)
+        except Exception as e:
+            self.logger.error(f"💥 Erreur inattendue lors de l'envoi du device {worker.name}: {e}")
+        finally:
+            self.wake()
+
+    def _run_health(self, worker: DeviceWorker, job: Callable[[DeviceWorker], None]):
+        try:
+            job(worker)
+        except Exception as e:
+            self.logger.error(f"💥 Erreur inattendue lors de la vérification du device {worker.name}: {e}")
+
+    def _run_discovery(self, worker: DeviceWorker, job: Callable[[DeviceWorker], None]):
+        try:
+            job(worker)
+        except Exception as e:
+            self.logger.error(f"💥 Erreur inattendue lors de la recherche du device {worker.name}: {e}")
+        finally:
+            self.wake()
+
+    def stop(self):
+        with self.lock:
+            executors = [self.executor, self.upload_executor, self.health_executor, self.discovery_executor]
+            self.executor = self.upload_executor = self.health_executor = self.discovery_executor = None
+            self.in_flight.clear()
+            self.uploads.clear()
+            self.health_checks.clear()
+            self.discoveries.clear()
+        self.wake()
+        for executor in executors:
+            if executor:
+                executor.shutdown(wait=False, cancel_futures=True)
@@ -4,7 +4,6 @@ import threading
 from datetime import datetime, timedelta
 import json
 from service import ZKTecoService
-from zkteco_client import ZKTecoClient
 from api_client import APIClient
 
 class ZKTecoGUI:
@@ -222,12 +221,8 @@ class ZKTecoGUI:
                 start_date = datetime.strptime(self.start_date_entry.get(), '%Y-%m-%d %H:%M:%S')
                 end_date = datetime.strptime(self.end_date_entry.get(), '%Y-%m-%d %H:%M:%S')
                 
-                zk_client = ZKTecoClient(
-                    self.service.config.get('zkteco_ip'),
-                    self.service.config.get('zkteco_port')
-                )
-                
-                self.attendances_data = zk_client.get_attendance_by_date(start_date, end_date)
+                # Copie locale indexée: seule la fin du log non synchronisée est lue sur le device
+                self.attendances_data = self.service.query_attendance(start_date, end_date)
                 
                 self.root.after(0, self.update_attendance_list)
                 
@@ -244,7 +239,7 @@ class ZKTecoGUI:
         self.attendance_listbox.delete(0, tk.END)
         
         for att in self.attendances_data:
-            display_text = f"{att['timestamp']} - User {att['id']} - Type {att['type']}"
+            display_text = f"{att.time_text} - User {att.user_id} - Type {att.punch}"
             self.attendance_listbox.insert(tk.END, display_text)
         
         self.result_label.config(text=f"📊 {len(self.attendances_data)} pointages récupérés")
@@ -258,7 +253,7 @@ class ZKTecoGUI:
             
             self.detail_text.config(state=tk.NORMAL)
             self.detail_text.delete(1.0, tk.END)
-            self.detail_text.insert(1.0, json.dumps(att, indent=2, ensure_ascii=False))
+            self.detail_text.insert(1.0, json.dumps(att.to_dict(), indent=2, ensure_ascii=False))
             self.detail_text.config(state=tk.DISABLED)
     
     def select_all(self):
@@ -0,0 +1,202 @@
+import socket
+import ssl
+import threading
+import time
+import weakref
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """Contexte TLS qui présente la dernière session de chaque hôte (reprise de session, sans handshake complet)"""
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        # Le protocole est fixé à la création (SSLContext.__new__), pas dans __init__
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.sessions: Dict[str, ssl.SSLSession] = {}
+        self.sockets: Dict[str, weakref.ref] = {}
+        self.lock = threading.Lock()
+        self.handshakes = 0
+        self.resumed = 0
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        self.snapshot()
+        with self.lock:
+            session = session or self.sessions.get(server_hostname)
+        try:
+            ssl_sock = super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+        except ssl.SSLError:
+            if session is not None:
+                # Session refusée: oubliée, la connexion suivante (nouvelle socket) fera un handshake complet
+                with self.lock:
+                    self.sessions.pop(server_hostname, None)
+            raise
+        with self.lock:
+            self.handshakes += 1
+            if ssl_sock.session_reused:
+                self.resumed += 1
+            self.sockets[server_hostname] = weakref.ref(ssl_sock)
+        return ssl_sock
+
+    def snapshot(self):
+        """Mémoriser les sessions des connexions ouvertes (en TLS 1.3 le ticket arrive après le handshake)"""
+        with self.lock:
+            for host, ref in list(self.sockets.items()):
+                ssl_sock = ref()
+                if ssl_sock is None:
+                    del self.sockets[host]
+                    continue
+                try:
+                    session = ssl_sock.session
+                except (OSError, ValueError):
+                    session = None
+                if session is not None and (session.has_ticket or session.id):
+                    self.sessions[host] = session
+
+
+class PooledAdapter(HTTPAdapter):
+    """HTTPAdapter avec keep-alive TCP et contexte TLS partagé"""
+
+    def __init__(self, ssl_context: Optional[ssl.SSLContext] = None, keepalive: bool = True, **kwargs):
+        self.ssl_context = ssl_context
+        self.keepalive = keepalive
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.ssl_context is not None:
+            kwargs['ssl_context'] = self.ssl_context
+        if self.keepalive:
+            options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                options += [(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30), (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10)]
+            kwargs['socket_options'] = options
+        super().init_poolmanager(*args, **kwargs)
+
+
+class APITransport:
+    """Session HTTP unique du processus: pool de connexions conservé entre les synchronisations"""
+
+    def __init__(self, pool_connections: int = 4, pool_maxsize: int = 8, keepalive: bool = True,
+                 tls_resumption: bool = True, verify: bool = False):
+        self.keepalive = keepalive
+        self.requests = 0
+        self.connections = 0
+        self.prewarms = 0
+        self.sockets = weakref.WeakSet()  # Sockets déjà vus: une nouvelle socket = une nouvelle connexion
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-Type': 'application/json',
+            'User-Agent': 'ZKTeco-Service/2.0'
+        })
+        if not keepalive:
+            self.session.headers['Connection'] = 'close'
+        # Désactiver la vérification SSL pour les tests
+        self.session.verify = verify
+        if not verify:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        self.ssl_context = None
+        if tls_resumption:
+            self.ssl_context = ResumingSSLContext()
+            # Vérification du nom d'hôte laissée à urllib3 (qui applique session.verify)
+            self.ssl_context.check_hostname = False
+            if verify:
+                self.ssl_context.load_default_certs()
+        self.adapter = PooledAdapter(
+            self.ssl_context, keepalive,
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0
+        )
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.hooks['response'].append(self._on_response)
+
+    def _on_response(self, response, *args, **kwargs):
+        connection = getattr(response.raw, 'connection', None)
+        sock = getattr(connection, 'sock', None)
+        with self.lock:
+            self.requests += 1
+            if sock is not None and sock not in self.sockets:
+                self.sockets.add(sock)
+                self.connections += 1
+        if self.ssl_context is not None:
+            self.ssl_context.snapshot()
+
+    def prewarm(self, url: str, background: bool = True):
+        """
+        Ouvrir à l'avance une connexion vers l'API (TCP + TLS) par une requête HEAD: elle réutilise une connexion
+        du pool s'il y en a une, sinon la connexion ouverte reste dans le pool pour l'envoi qui suit.
+        """
+        if background:
+            threading.Thread(target=self.prewarm, args=(url, False), daemon=True).start()
+            return
+        try:
+            pool = self.adapter.get_connection(url)
+            self.adapter.cert_verify(pool, url, self.session.verify, None)
+            opened = pool.num_connections
+            started = time.perf_counter()
+            # Le statut importe peu (405 si l'API n'accepte que POST): seule la connexion compte
+            pool.urlopen('HEAD', urlparse(url).path or '/', headers=dict(self.session.headers),
+                         retries=False, redirect=False, timeout=10, release_conn=True)
+            if pool.num_connections > opened:
+                with self.lock:
+                    self.prewarms += 1
+                self.logger.debug(f"🔥 Connexion API préchauffée en {(time.perf_counter() - started) * 1000:.0f} ms")
+        except Exception as e:
+            self.logger.debug(f"⚠️ Préchauffage de la connexion {urlparse(url).netloc} impossible: {e}")
+
+    def get_stats(self) -> dict:
+        """Requêtes envoyées, connexions ouvertes et part des requêtes servies par une connexion réutilisée"""
+        stats = {
+            'requests': self.requests,
+            'connections_opened': self.connections,
+            'prewarmed': self.prewarms,
+            'reuse_ratio': round(1 - self.connections / self.requests, 3) if self.requests else None,
+        }
+        if self.ssl_context is not None:
+            stats['tls_handshakes'] = self.ssl_context.handshakes
+            stats['tls_resumed'] = self.ssl_context.resumed
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_shared_transport: Optional[APITransport] = None
+_shared_lock = threading.Lock()
+
+
+def get_transport(config=None) -> APITransport:
+    """Transport HTTP partagé par tout le processus, créé au premier appel (options lues dans config)"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            options = {}
+            if config is not None:
+                options = {
+                    'pool_connections': config.get('api_pool_connections', 4),
+                    'pool_maxsize': config.get('api_pool_maxsize', 8),
+                    'keepalive': config.get('api_keepalive', True),
+                    'tls_resumption': config.get('api_tls_resumption', True),
+                }
+            _shared_transport = APITransport(**options)
+        return _shared_transport
+
+
+def reset_transport():
+    """Fermer le transport partagé (il sera recréé avec la nouvelle configuration)"""
+    global _shared_transport
+    with _shared_lock:
+        transport, _shared_transport = _shared_transport, None
+    if transport:
+        transport.close()
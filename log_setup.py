@@ -0,0 +1,128 @@
+import atexit
+import json
+import logging
+import os
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from pathlib import Path
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Attributs standard d'un LogRecord: le reste provient de extra={...} et part tel quel dans la ligne JSON
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON par message: date, niveau, logger, thread, message et champs extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RotatingLogHandler(TimedRotatingFileHandler):
+    """
+    Rotation à heure fixe (minuit par défaut) et dès que le fichier dépasse max_bytes.
+
+    Plusieurs rotations dans la même période donnent zkteco_service.log.2024-05-01, .2024-05-01.001...;
+    seules les backup_count plus récentes sont gardées.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = 0, when: str = 'midnight', backup_count: int = 0):
+        super().__init__(filename, when=when, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if not self.max_bytes or self.stream is None:
+            return False
+        return self.stream.tell() >= self.max_bytes
+
+    def rotation_filename(self, default_name: str) -> str:
+        # Rotation par taille dans la période en cours: ne pas écraser l'archive précédente
+        name, index = default_name, 0
+        while os.path.exists(name):
+            index += 1
+            name = f"{default_name}.{index:03d}"  # Ordre alphabétique = ordre chronologique
+        return name
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler sans formatage dans le thread appelant.
+
+    QueueHandler.prepare() fusionne message et arguments avant la mise en file (utile pour une file
+    inter-processus); ici la file reste dans le processus: le formatage et l'écriture se font dans
+    le thread du QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(config=None, console: bool = True) -> Optional[QueueListener]:
+    """
+    Configurer le logging du processus (une seule fois): les messages passent par une file en mémoire,
+    écrits par un thread dédié dans un fichier JSON avec rotation (et la console en texte).
+
+    Comme logging.basicConfig, ne fait rien si le logging racine est déjà configuré.
+
+    :param config: Config du service (options log_*), valeurs par défaut si None
+    :param console: copie des messages sur la console (désactivée pour le service en arrière-plan)
+    """
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return _listener
+
+    get = config.get if config is not None else (lambda key, default=None: default)
+    path = Path(get('log_file', 'zkteco_service.log'))
+    if config is not None and not path.is_absolute():
+        path = config.config_file.parent / path
+
+    file_handler = RotatingLogHandler(
+        str(path), get('log_max_bytes', 10 * 1024 * 1024), get('log_when', 'midnight'), get('log_backup_count', 14)
+    )
+    file_handler.setFormatter(JsonFormatter() if get('log_format', 'json') == 'json' else logging.Formatter(TEXT_FORMAT))
+    handlers = [file_handler]
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(stream_handler)
+
+    # File non bornée: un message n'est jamais perdu ni bloquant, le thread d'écriture suit le débit
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(get('log_level', 'INFO'))
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Écrire les messages en attente et arrêter le thread d'écriture"""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    for handler in [h for h in logging.getLogger().handlers if isinstance(h, DeferredQueueHandler)]:
+        logging.getLogger().removeHandler(handler)
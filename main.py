@@ -1,17 +1,6 @@
 import sys
 import os
-import logging
-
-def setup_logging():
-    """Configurer le logging"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('zkteco_service.log', encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+from log_setup import setup_logging
 
 def main():
     if len(sys.argv) > 1:
@@ -21,8 +10,10 @@ def main():
             # Mode service uniquement (sans GUI)
             from service import ZKTecoService
             setup_logging()
+            # Mode optionnel: polling ou realtime (sinon celui de zkteco_config.json)
+            mode = sys.argv[2].lower() if len(sys.argv) > 2 else None
             print("🚀 Démarrage du service ZKTeco en mode service...")
-            service = ZKTecoService()
+            service = ZKTecoService(mode)
             service.start()
             
             # Garder le programme actif
@@ -54,6 +45,46 @@ def main():
                 for key, value in results['device_info'].items():
                     print(f"  {key}: {value}")
             
+        elif command == "query":
+            # Pointages d'une période depuis la copie locale indexée
+            from datetime import datetime, timedelta
+            from service import ZKTecoService
+            setup_logging()
+            start = datetime.strptime(sys.argv[2], '%Y-%m-%d') if len(sys.argv) > 2 else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            end = datetime.strptime(sys.argv[3], '%Y-%m-%d') + timedelta(days=1, seconds=-1) if len(sys.argv) > 3 else datetime.now()
+            user_id = sys.argv[4] if len(sys.argv) > 4 else None
+            
+            service = ZKTecoService()
+            attendances = service.query_attendance(start, end, user_id)
+            for att in attendances:
+                print(f"{att.time_text}  user {att.user_id:>6}  type {att.punch}  état {att.status}")
+            print(f"\n📊 {len(attendances)} pointages")
+            
+        elif command == "backfill":
+            # Réenvoi à l'API des pointages archivés (après une perte de données côté API)
+            from datetime import datetime, timedelta
+            from service import ZKTecoService
+            setup_logging()
+            since = datetime.strptime(sys.argv[2], '%Y-%m-%d') if len(sys.argv) > 2 else None
+            until = datetime.strptime(sys.argv[3], '%Y-%m-%d') + timedelta(days=1, seconds=-1) if len(sys.argv) > 3 else None
+            
+            service = ZKTecoService()
+            print(f"📼 Réenvoi des pointages archivés{f' depuis le {since:%Y-%m-%d}' if since else ''}...")
+            sent = service.backfill_from_archive(since, until)
+            print(f"\n📊 {sent} pointages acquittés par l'API")
+            
+        elif command == "discover":
+            # Terminaux ZKTeco du réseau local (sondes TCP simultanées + diffusion UDP)
+            from discovery import discover, local_network
+            setup_logging()
+            network = sys.argv[2] if len(sys.argv) > 2 else local_network()
+            ports = [int(port) for port in sys.argv[3].split(',')] if len(sys.argv) > 3 else [4370]
+            print(f"🔎 Recherche des terminaux sur {network} (ports {', '.join(map(str, ports))})...")
+            devices = discover(network, ports)
+            for device in devices:
+                print(f"  {device.ip}:{device.port}  série {device.serial or '?'}  ({device.protocol})")
+            print(f"\n📊 {len(devices)} terminal(aux) trouvé(s)")
+            
         elif command == "simple":
             # Test simple
             from test_simple import test_simple
@@ -62,8 +93,13 @@ def main():
         else:
             print("Commandes disponibles:")
             print("  start  - Démarrer le service en mode console")
+            print("           start realtime : pointages transmis en temps réel")
+            print("           start polling  : lecture périodique du device")
             print("  gui    - Interface graphique (recommandé)")
             print("  test   - Tester la connexion")
+            print("  query [début] [fin] [user] - Pointages d'une période (dates YYYY-MM-DD)")
+            print("  backfill [début] [fin] - Renvoyer à l'API les pointages de l'archive ATTLOG")
+            print("  discover [réseau] [ports] - Terminaux du réseau local (ex: 192.168.1.0/24 4370)")
             print("  simple - Test simple de connexion")
     else:
         # PAR DÉFAUT: Lancer le GUI
@@ -4,17 +4,7 @@ import time
 import threading
 from service import ZKTecoService
 import logging
-
-def setup_logging():
-    """Configurer le logging pour l'app portable"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('zkteco_service.log', encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+from log_setup import setup_logging
 
 def run_service_in_background():
     """Lancer le service en arrière-plan"""
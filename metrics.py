@@ -0,0 +1,204 @@
+import bisect
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+# Durées des phases: connexion, read_sizes, lectures par buffer, décodage, envoi HTTP...
+PHASE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Délai pointage → acquittement: de quelques secondes (temps réel) à plusieurs jours (reprise)
+ACK_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 3600, 4 * 3600, 86400, 7 * 86400)
+
+# Nom: (type, description, bornes de l'histogramme)
+DEFINITIONS = {
+    'zkteco_phase_duration_seconds': ('histogram', "Durée de chaque phase de synchronisation", PHASE_BUCKETS),
+    'zkteco_punch_ack_latency_seconds': (
+        'histogram', "Délai entre l'heure du pointage sur le device et son acquittement par l'API", ACK_BUCKETS),
+    'zkteco_records_fetched_total': ('counter', "Pointages lus sur le device", None),
+    'zkteco_records_sent_total': ('counter', "Pointages acquittés par l'API", None),
+    'zkteco_records_rejected_total': ('counter', "Pointages refusés définitivement par l'API (quarantaine)", None),
+    'zkteco_bytes_read_total': ('counter', "Octets de buffers lus sur le device", None),
+    'zkteco_api_bytes_sent_total': ('counter', "Octets de corps de requêtes envoyés à l'API", None),
+    'zkteco_duplicates_skipped_total': ('counter', "Doublons écartés (index local ou API)", None),
+    'zkteco_retries_total': ('counter', "Nouveaux essais (session device, lecture, envoi)", None),
+    'zkteco_live_events_total': ('counter', "Pointages reçus en temps réel", None),
+    'zkteco_idle_polls_total': ('counter', "Lectures terminées après read_sizes (aucun nouveau pointage)", None),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Histogramme à bornes fixes (cumulé au format Prometheus à l'export)"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimation par interpolation dans le bucket (comme histogram_quantile)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]  # Au-delà de la dernière borne
+                low = self.buckets[index - 1] if index else 0.0
+                return low + (self.buckets[index] - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Compteurs et histogrammes du processus, par nom et étiquettes (device, phase...)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not value:
+            return
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(DEFINITIONS.get(name, ('histogram', '', PHASE_BUCKETS))[2])
+            histogram.observe(value)
+
+    @contextmanager
+    def phase(self, phase: str, device: str):
+        """Mesurer la durée d'une phase (enregistrée même si elle échoue)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('zkteco_phase_duration_seconds', time.perf_counter() - started, device=device, phase=phase)
+
+    def snapshot(self) -> dict:
+        """Valeurs courantes pour get_status: compteurs, et nombre/somme/p50/p99 des histogrammes"""
+        with self.lock:
+            result = {
+                name: {_label_text(key): value for key, value in series.items()}
+                for name, series in self.counters.items()
+            }
+            for name, series in self.histograms.items():
+                result[name] = {
+                    _label_text(key): {
+                        'count': histogram.count,
+                        'sum': round(histogram.sum, 6),
+                        'p50': histogram.quantile(0.5),
+                        'p99': histogram.quantile(0.99),
+                    }
+                    for key, histogram in series.items()
+                }
+        return result
+
+    def render(self) -> str:
+        """Export au format texte Prometheus (0.0.4)"""
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.counters.items()):
+                lines.extend(_header(name, 'counter'))
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(key)} {_number(value)}")
+            for name, series in sorted(self.histograms.items()):
+                lines.extend(_header(name, 'histogram'))
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(key, le=_number(bound))} {cumulative}")
+                    lines.append(f"{name}_bucket{_labels(key, le='+Inf')} {histogram.count}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(histogram.sum)}")
+                    lines.append(f"{name}_count{_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+def _header(name: str, kind: str):
+    description = DEFINITIONS.get(name, (kind, name, None))[1]
+    return [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(key: LabelKey, **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _label_text(key: LabelKey) -> str:
+    return ','.join(f"{k}={v}" for k, v in key)
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+METRICS = MetricsRegistry()
+
+
+class MetricsServer:
+    """Endpoint HTTP local GET /metrics (format Prometheus)"""
+
+    def __init__(self, registry: MetricsRegistry = METRICS, host: str = '127.0.0.1', port: int = 9108):
+        self.registry = registry
+        self.logger = logging.getLogger(__name__)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = server.registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self) -> 'MetricsServer':
+        self.thread = threading.Thread(target=self.server.serve_forever, name='zkteco-metrics', daemon=True)
+        self.thread.start()
+        self.logger.info(f"📈 Métriques disponibles sur {self.url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
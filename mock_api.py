@@ -0,0 +1,170 @@
+"""
+API locale remplaçant l'endpoint Laravel /api/pointages (tests et benchmarks sans serveur).
+
+Reçoit les lots JSON (gzip accepté) et répond comme l'API: message, saved_count, duplicates_skipped.
+Latence, taux d'erreur et traitement des doublons sont configurables.
+
+    python mock_api.py --port 8000 --latency 0.05 --error-rate 0.02 --duplicates skip
+"""
+import argparse
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+# skip: doublons ignorés (200, duplicates_skipped) / insert: tout est enregistré / reject: lot refusé (422)
+DUPLICATE_MODES = ('skip', 'insert', 'reject')
+
+
+class MockPointagesAPI:
+    """
+    Serveur HTTP local pour POST /api/pointages.
+
+    :param latency: délai ajouté à chaque réponse (secondes)
+    :param error_rate: proportion de requêtes répondues en 503
+    :param duplicates: traitement d'un pointage déjà reçu (même uid, horodatage et type), voir DUPLICATE_MODES
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, duplicates: str = 'skip', seed: int = None):
+        if duplicates not in DUPLICATE_MODES:
+            raise ValueError(f"duplicates doit être dans {DUPLICATE_MODES}")
+        self.latency = latency
+        self.error_rate = error_rate
+        self.duplicates = duplicates
+        self.random = random.Random(seed)
+        self.keys = set()
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+        self.thread = None
+        self.reset_stats()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, comme un serveur web réel
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                received = len(body) + sum(len(k) + len(v) + 4 for k, v in self.headers.items())
+                status, payload = api.handle(body, self.headers.get('Content-Encoding'))
+                out = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+                api._count(received, len(out))
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/pointages"
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.saved = 0
+            self.duplicate_count = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def handle(self, body: bytes, encoding: str = None) -> Tuple[int, dict]:
+        """Traiter un lot: (statut HTTP, réponse JSON)"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return 503, {'message': 'Service indisponible'}
+        try:
+            if encoding == 'gzip':
+                body = gzip.decompress(body)
+            batch = json.loads(body)
+            keys = [(str(att['uid']), att['timestamp'], int(att['type'])) for att in batch]
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            return 422, {'message': f'Lot invalide: {e}'}
+        with self.lock:
+            known = [key for key in keys if key in self.keys]
+            if known and self.duplicates == 'reject':
+                self.duplicate_count += len(known)
+                return 422, {'message': f'{len(known)} pointages déjà enregistrés'}
+            fresh = set(keys) - self.keys
+            if self.duplicates == 'insert':
+                saved, skipped = len(keys), 0
+            else:
+                saved, skipped = len(fresh), len(keys) - len(fresh)
+            self.keys.update(fresh)
+            self.saved += saved
+            self.duplicate_count += len(keys) - len(fresh)
+        return 200, {'message': 'Pointages enregistrés', 'saved_count': saved, 'duplicates_skipped': skipped}
+
+    def _count(self, received: int, sent: int):
+        with self.lock:
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'saved': self.saved,
+                'unique': len(self.keys),
+                'duplicates': self.duplicate_count,
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+            }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.logger.info(f"🧪 API locale sur {self.url} (doublons: {self.duplicates})")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API locale /api/pointages")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence par requête (s)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Proportion de réponses 503 (0-1)")
+    parser.add_argument('--duplicates', default='skip', choices=DUPLICATE_MODES)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    api = MockPointagesAPI(args.host, args.port, args.latency, args.error_rate, args.duplicates, args.seed).start()
+    try:
+        while True:
+            time.sleep(60)
+            api.logger.info(f"📊 {api.get_stats()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
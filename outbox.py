@@ -0,0 +1,348 @@
+import json
+import sqlite3
+import threading
+import time
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from zkteco_device import AttendanceCursor, AttendanceRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device TEXT NOT NULL,
+    uid TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    type INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    batch_id INTEGER,
+    sent_at REAL,
+    rejected_at REAL,
+    rejection TEXT,
+    UNIQUE (device, uid, timestamp, type)
+);
+CREATE INDEX IF NOT EXISTS records_pending ON records (device, id) WHERE sent_at IS NULL;
+CREATE INDEX IF NOT EXISTS records_sent_at ON records (sent_at);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL,
+    acked_at REAL NOT NULL,
+    response TEXT
+);
+CREATE TABLE IF NOT EXISTS devices (
+    device TEXT PRIMARY KEY,
+    records INTEGER NOT NULL DEFAULT 0,
+    offset INTEGER NOT NULL DEFAULT 0,
+    record_size INTEGER NOT NULL DEFAULT 0,
+    checksum INTEGER,
+    last_record INTEGER,
+    last_successful_sync TEXT,
+    rotation_attempted TEXT,
+    initial_since INTEGER,
+    archive_failed INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS rotations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device TEXT NOT NULL,
+    rotated_at REAL NOT NULL,
+    records INTEGER NOT NULL,
+    checksum INTEGER,
+    status TEXT NOT NULL,
+    detail TEXT
+);
+CREATE TABLE IF NOT EXISTS endpoints (
+    serial TEXT PRIMARY KEY,
+    device TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS endpoints_device ON endpoints (device);
+"""
+
+
+class Outbox:
+    """
+    File d'envoi locale (SQLite en mode WAL).
+
+    Les pointages lus et le curseur ATTLOG du device sont enregistrés dans la même
+    transaction: après un arrêt brutal, rien n'est perdu et rien n'est relu deux fois.
+    Un pointage n'est marqué envoyé qu'après l'accusé de réception de l'API.
+    """
+
+    # Intervalle minimum entre deux purges des pointages envoyés (secondes)
+    PURGE_INTERVAL = 3600
+
+    def __init__(self, path: str, retention_days: float = 30):
+        self.path = str(path)
+        self.retention_days = retention_days
+        self.lock = threading.Lock()
+        self.last_purge = 0.0
+        self.logger = logging.getLogger(__name__)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL reste sûr en cas d'arrêt du processus (seule une coupure de courant peut perdre la dernière transaction)
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA busy_timeout=5000")
+        self.db.executescript(SCHEMA)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(devices)")}
+        if 'checksum' not in columns:
+            # File créée par une version précédente
+            self.db.execute("ALTER TABLE devices ADD COLUMN checksum INTEGER")
+        if 'last_record' not in columns:
+            self.db.execute("ALTER TABLE devices ADD COLUMN last_record INTEGER")
+        if 'rotation_attempted' not in columns:
+            self.db.execute("ALTER TABLE devices ADD COLUMN rotation_attempted TEXT")
+        if 'initial_since' not in columns:
+            self.db.execute("ALTER TABLE devices ADD COLUMN initial_since INTEGER")
+        if 'archive_failed' not in columns:
+            self.db.execute("ALTER TABLE devices ADD COLUMN archive_failed INTEGER NOT NULL DEFAULT 0")
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(records)")}
+        if 'rejected_at' not in columns:
+            self.db.execute("ALTER TABLE records ADD COLUMN rejected_at REAL")
+            self.db.execute("ALTER TABLE records ADD COLUMN rejection TEXT")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def enqueue(self, device: str, attendances: List[AttendanceRecord],
+                cursor: Optional[AttendanceCursor] = None) -> int:
+        """
+        Enregistrer des pointages (et le nouveau curseur) de façon atomique.
+
+        Les pointages déjà présents (même device, utilisateur, heure et type) sont ignorés.
+
+        :return: nombre de pointages réellement ajoutés
+        """
+        now = time.time()
+        rows = []
+        for att in attendances:
+            payload = att.to_dict()  # Format de l'API, figé au moment de la mise en file
+            rows.append((device, att.user_id, payload['timestamp'], att.punch, json.dumps(payload), now))
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                before = self.db.total_changes
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO records (device, uid, timestamp, type, payload, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", rows)
+                added = self.db.total_changes - before
+                if cursor is not None:
+                    self.db.execute(
+                        "INSERT INTO devices (device, records, offset, record_size, checksum, last_record, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (device) DO UPDATE SET records = excluded.records, offset = excluded.offset, "
+                        "record_size = excluded.record_size, checksum = excluded.checksum, "
+                        "last_record = excluded.last_record, updated_at = excluded.updated_at",
+                        (device, cursor.records, cursor.offset, cursor.record_size, cursor.checksum, cursor.last_record, now))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return added
+
+    def pending(self, device: str, limit: int) -> List[Tuple[int, AttendanceRecord]]:
+        """Prochain lot de pointages non acquittés (ni refusés) d'un device, dans l'ordre de lecture"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, payload FROM records WHERE device = ? AND sent_at IS NULL AND rejected_at IS NULL "
+                "ORDER BY id LIMIT ?",
+                (device, limit)).fetchall()
+        return [(row_id, AttendanceRecord.from_dict(json.loads(payload))) for row_id, payload in rows]
+
+    def acknowledge(self, device: str, ids: List[int], response: dict = None) -> int:
+        """Marquer un lot comme acquitté par l'API"""
+        if not ids:
+            return 0
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                batch_id = self.db.execute(
+                    "INSERT INTO batches (device, count, first_id, last_id, acked_at, response) VALUES (?, ?, ?, ?, ?, ?)",
+                    (device, len(ids), min(ids), max(ids), now, json.dumps(response) if response else None)).lastrowid
+                self.db.executemany(
+                    "UPDATE records SET batch_id = ?, sent_at = ? WHERE id = ?",
+                    [(batch_id, now, row_id) for row_id in ids])
+                self.db.execute(
+                    "INSERT INTO devices (device, last_successful_sync, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (device) DO UPDATE SET last_successful_sync = excluded.last_successful_sync",
+                    (device, datetime.now().isoformat(), now))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+        return batch_id
+
+    def reject(self, device: str, ids: List[int], reason: str) -> int:
+        """
+        Mettre en quarantaine des pointages refusés définitivement par l'API (400/422): ils ne bloquent
+        plus la file du device et restent conservés (jamais purgés) pour examen.
+        """
+        if not ids:
+            return 0
+        now = time.time()
+        with self.lock:
+            return self.db.executemany(
+                "UPDATE records SET rejected_at = ?, rejection = ? WHERE device = ? AND id = ? AND sent_at IS NULL",
+                [(now, reason, device, row_id) for row_id in ids]).rowcount
+
+    def get_cursor(self, device: str) -> Optional[AttendanceCursor]:
+        """Curseur ATTLOG enregistré pour ce device (None si jamais lu)"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT records, offset, record_size, checksum, last_record FROM devices WHERE device = ?",
+                (device,)).fetchone()
+        if row is None or not row[2]:
+            return None
+        return AttendanceCursor(*row)
+
+    def reset_cursor(self, device: str, cursor: AttendanceCursor):
+        """Remplacer le curseur après l'effacement du log du device"""
+        with self.lock:
+            self.db.execute(
+                "UPDATE devices SET records = ?, offset = ?, record_size = ?, checksum = ?, last_record = ?, updated_at = ? "
+                "WHERE device = ?",
+                (cursor.records, cursor.offset, cursor.record_size, cursor.checksum, cursor.last_record, time.time(), device))
+
+    def record_rotation(self, device: str, records: int, checksum: Optional[int], status: str, detail: str = None):
+        """Journaliser une rotation du log d'un device (réussie, refusée ou en échec)"""
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO rotations (device, rotated_at, records, checksum, status, detail) VALUES (?, ?, ?, ?, ?, ?)",
+                (device, time.time(), records, checksum, status, detail))
+
+    def save_initial_window(self, device: str, since: Optional[int]):
+        """
+        Début de la fenêtre de la première lecture complète (epoch), None une fois cette lecture terminée.
+
+        Une première lecture interrompue reprend au curseur avec la même fenêtre: l'historique
+        plus ancien n'est jamais mis en file.
+        """
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO devices (device, initial_since, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (device) DO UPDATE SET initial_since = excluded.initial_since",
+                (device, since, time.time()))
+
+    def get_initial_window(self, device: str) -> Optional[int]:
+        with self.lock:
+            row = self.db.execute("SELECT initial_since FROM devices WHERE device = ?", (device,)).fetchone()
+        return row[0] if row else None
+
+    def mark_rotation_attempt(self, device: str, day: date):
+        """Mémoriser le jour de la dernière tentative de rotation (au plus une par jour, même après un redémarrage)"""
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO devices (device, rotation_attempted, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (device) DO UPDATE SET rotation_attempted = excluded.rotation_attempted",
+                (device, day.isoformat(), time.time()))
+
+    def get_rotation_attempt(self, device: str) -> Optional[date]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT rotation_attempted FROM devices WHERE device = ?", (device,)).fetchone()
+        return date.fromisoformat(row[0]) if row and row[0] else None
+
+    def save_archive_failure(self, device: str, failed: bool):
+        """
+        Mémoriser qu'un buffer lu n'a pas pu être archivé: la rotation du log reste bloquée
+        (même après un redémarrage) jusqu'à une lecture complète archivée sans erreur.
+        """
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO devices (device, archive_failed, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (device) DO UPDATE SET archive_failed = excluded.archive_failed",
+                (device, int(failed), time.time()))
+
+    def get_archive_failure(self, device: str) -> bool:
+        with self.lock:
+            row = self.db.execute("SELECT archive_failed FROM devices WHERE device = ?", (device,)).fetchone()
+        return bool(row and row[0])
+
+    def get_rotations(self, device: str = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Dernières rotations, les plus récentes d'abord"""
+        query = "SELECT device, rotated_at, records, checksum, status, detail FROM rotations"
+        params: tuple = ()
+        if device is not None:
+            query += " WHERE device = ?"
+            params = (device,)
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY id DESC LIMIT ?", params + (limit,)).fetchall()
+        return [
+            {'device': row[0], 'rotated_at': datetime.fromtimestamp(row[1]).isoformat(), 'records': row[2],
+             'checksum': row[3], 'status': row[4], 'detail': row[5]}
+            for row in rows
+        ]
+
+    def save_endpoint(self, device: str, serial: str, ip: str, port: int):
+        """Mémoriser l'adresse à laquelle le device (numéro de série) a répondu"""
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO endpoints (serial, device, ip, port, seen_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (serial) DO UPDATE SET device = excluded.device, ip = excluded.ip, "
+                "port = excluded.port, seen_at = excluded.seen_at",
+                (serial, device, ip, port, time.time()))
+
+    def get_endpoint(self, device: str) -> Optional[Tuple[str, str, int]]:
+        """Dernière adresse connue du device configuré: (numéro de série, ip, port), None si inconnue"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT serial, ip, port FROM endpoints WHERE device = ? ORDER BY seen_at DESC LIMIT 1",
+                (device,)).fetchone()
+        return tuple(row) if row else None
+
+    def get_last_successful_sync(self, device: str) -> Optional[datetime]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT last_successful_sync FROM devices WHERE device = ?", (device,)).fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+    def pending_count(self, device: str = None) -> int:
+        with self.lock:
+            if device is None:
+                return self.db.execute(
+                    "SELECT COUNT(*) FROM records WHERE sent_at IS NULL AND rejected_at IS NULL").fetchone()[0]
+            return self.db.execute(
+                "SELECT COUNT(*) FROM records WHERE device = ? AND sent_at IS NULL AND rejected_at IS NULL",
+                (device,)).fetchone()[0]
+
+    def purge(self, force: bool = False) -> int:
+        """Supprimer les pointages envoyés depuis plus de retention_days (au plus une fois par heure)"""
+        now = time.time()
+        if not force and now - self.last_purge < self.PURGE_INTERVAL:
+            return 0
+        self.last_purge = now
+        limit = now - self.retention_days * 86400
+        with self.lock:
+            deleted = self.db.execute("DELETE FROM records WHERE sent_at IS NOT NULL AND sent_at < ?", (limit,)).rowcount
+            self.db.execute("DELETE FROM batches WHERE acked_at < ?", (limit,))
+        if deleted:
+            self.logger.info(f"🧹 {deleted} pointages envoyés purgés de la file d'envoi")
+        return deleted
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            pending = dict(self.db.execute(
+                "SELECT device, COUNT(*) FROM records WHERE sent_at IS NULL AND rejected_at IS NULL "
+                "GROUP BY device").fetchall())
+            sent = self.db.execute("SELECT COUNT(*) FROM records WHERE sent_at IS NOT NULL").fetchone()[0]
+            rejected = self.db.execute("SELECT COUNT(*) FROM records WHERE rejected_at IS NOT NULL").fetchone()[0]
+            batches = self.db.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+            rotations = self.db.execute("SELECT COUNT(*) FROM rotations WHERE status = 'done'").fetchone()[0]
+        return {
+            'path': self.path,
+            'pending': sum(pending.values()),
+            'pending_by_device': pending,
+            'sent': sent,
+            'rejected': rejected,
+            'batches': batches,
+            'log_rotations': rotations,
+        }
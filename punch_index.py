@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+import logging
+from datetime import datetime, timedelta
+from hashlib import blake2b
+from typing import Dict, List, Set, Tuple
+
+from zkteco_device import AttendanceRecord, format_date, format_timestamp
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS punches (
+    key TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    fingerprint INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS punches_day ON punches (day, fingerprint);
+"""
+
+
+def punch_key(device: str, attendance: AttendanceRecord) -> str:
+    """Clé exacte d'un pointage: device (adresse configurée ip:port), utilisateur, horodatage et type"""
+    return f"{device}|{attendance.user_id}|{format_timestamp(attendance.timestamp)}|{attendance.punch}"
+
+
+def fingerprint(key: str) -> int:
+    """Empreinte 64 bits (entier signé, stockable tel quel dans SQLite)"""
+    return int.from_bytes(blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+class PunchIndex:
+    """
+    Index persistant des pointages déjà acquittés par l'API.
+
+    Les empreintes sont gardées en mémoire par jour de pointage (partitions chargées à la demande):
+    le test est en O(1) par pointage, et seule une empreinte connue est confirmée par la clé exacte
+    en base. Les partitions plus anciennes que retention_days sont supprimées.
+    """
+
+    def __init__(self, path: str, retention_days: int = 90):
+        self.path = str(path)
+        self.retention_days = retention_days
+        self.partitions: Dict[str, Set[int]] = {}
+        self.lock = threading.Lock()
+        self.filtered = 0
+        self.logger = logging.getLogger(__name__)
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.last_eviction = None
+        self.cutoff = ''
+        self.evict()
+
+    def _partition(self, day: str) -> Set[int]:
+        partition = self.partitions.get(day)
+        if partition is None:
+            partition = {row[0] for row in self.db.execute("SELECT fingerprint FROM punches WHERE day = ?", (day,))}
+            self.partitions[day] = partition
+        return partition
+
+    def filter(self, device: str, attendances: List[AttendanceRecord]) -> Tuple[List[AttendanceRecord], List[AttendanceRecord]]:
+        """
+        Séparer les pointages jamais acquittés des doublons connus.
+
+        :return: (pointages à envoyer, doublons déjà acquittés)
+        """
+        fresh, duplicates = [], []
+        with self.lock:
+            for att in attendances:
+                key = punch_key(device, att)
+                day = format_date(att.timestamp)
+                if day >= self.cutoff and fingerprint(key) in self._partition(day) and self._confirm(key):
+                    duplicates.append(att)
+                else:
+                    fresh.append(att)
+            self.filtered += len(duplicates)
+        return fresh, duplicates
+
+    def _confirm(self, key: str) -> bool:
+        """Confirmation exacte (écarte une éventuelle collision d'empreintes)"""
+        return self.db.execute("SELECT 1 FROM punches WHERE key = ?", (key,)).fetchone() is not None
+
+    def add(self, device: str, attendances: List[AttendanceRecord]):
+        """Enregistrer des pointages acquittés par l'API"""
+        rows = []
+        for att in attendances:
+            day = format_date(att.timestamp)
+            if day >= self.cutoff:
+                key = punch_key(device, att)
+                rows.append((key, day, fingerprint(key)))
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany("INSERT OR IGNORE INTO punches (key, day, fingerprint) VALUES (?, ?, ?)", rows)
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            for _, day, value in rows:
+                partition = self.partitions.get(day)
+                if partition is not None:
+                    partition.add(value)
+        self.evict()
+
+    def rename_device(self, old: str, new: str) -> int:
+        """Reprendre sous la clé new les pointages indexés sous old (ancien index par numéro de série)"""
+        with self.lock:
+            # Bornes de la plage des clés "old|...": recherche par la clé primaire
+            rows = self.db.execute(
+                "SELECT key, day FROM punches WHERE key >= ? AND key < ?", (f"{old}|", f"{old}}}")
+            ).fetchall()
+            if not rows:
+                return 0
+            renamed = [(new + key[len(old):], day) for key, day in rows]
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(
+                    "INSERT OR IGNORE INTO punches (key, day, fingerprint) VALUES (?, ?, ?)",
+                    [(key, day, fingerprint(key)) for key, day in renamed]
+                )
+                self.db.execute("DELETE FROM punches WHERE key >= ? AND key < ?", (f"{old}|", f"{old}}}"))
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+            self.partitions.clear()  # Rechargées à la demande avec les nouvelles empreintes
+        self.logger.info(f"🔁 {len(rows)} pointages acquittés de {old} repris sous {new}")
+        return len(rows)
+
+    def evict(self):
+        """Supprimer les partitions plus anciennes que retention_days (au plus une fois par jour)"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if self.last_eviction == today:
+            return
+        self.last_eviction = today
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        with self.lock:
+            self.cutoff = cutoff
+            deleted = self.db.execute("DELETE FROM punches WHERE day < ?", (cutoff,)).rowcount
+            for day in [day for day in self.partitions if day < cutoff]:
+                del self.partitions[day]
+        if deleted:
+            self.logger.info(f"🧹 {deleted} empreintes de pointages de plus de {self.retention_days} jours supprimées")
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                'loaded_partitions': len(self.partitions),
+                'loaded_fingerprints': sum(len(p) for p in self.partitions.values()),
+                'filtered_duplicates': self.filtered,
+            }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -1,31 +1,90 @@
 import time
 import threading
 import logging
+from concurrent.futures import wait as wait_futures
 from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from zk.exception import ZKError
 from config import Config
 from zkteco_client import ZKTecoClient
 from api_client import APIClient
+from outbox import Outbox
+from punch_index import PunchIndex
+from attlog_archive import AttlogArchive
+from attendance_store import AttendanceStore
+from http_transport import get_transport, reset_transport
+from circuit_breaker import CircuitBreaker, backoff_delay, get_breaker
+from device_session import SessionManager
+from fleet import DeviceWorker, FleetScheduler, PollingPolicy, RotationPolicy, build_workers
+from metrics import METRICS, MetricsServer
+from log_setup import setup_logging
+from discovery import find_device, local_network
+from zkteco_device import AttendanceCursor, AttendanceRecord, RotationUnverified, to_epoch
 
 class ZKTecoService:
-    def __init__(self):
-        self.config = Config()
+    MODES = ('polling', 'realtime')
+    
+    def __init__(self, mode: str = None, config: Config = None):
+        self.config = config or Config()
+        # polling: lecture périodique / realtime: écoute live_capture + réconciliation périodique
+        self.mode = mode or self.config.get('service_mode', 'polling')
+        if self.mode not in self.MODES:
+            raise ValueError(f"Mode de service inconnu: {self.mode}")
         self.is_running = False
         self.thread = None
         self.last_check = None
         self.last_successful_sync = None
+        self.live_events = 0
+        self.last_live_event = None
         self.error_count = 0
-        self.max_errors = 5
-        
-        # Configuration du logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('zkteco_service.log', encoding='utf-8'),
-                logging.StreamHandler()
-            ]
+        self.sessions = SessionManager(
+            self.config.get('session_health_interval', 60),
+            self.config.get('session_idle_timeout', 900),
+            self.config.get('device_ping', True)
+        )
+        # Transport HTTP unique du processus (pool de connexions keep-alive vers l'API)
+        self.transport = get_transport(self.config)
+        # File d'envoi persistante: pointages non acquittés et curseur de chaque device
+        self.outbox = Outbox(
+            self.config.config_file.parent / self.config.get('outbox_path', 'zkteco_outbox.db'),
+            self.config.get('outbox_retention_days', 30)
+        )
+        # Empreintes des pointages déjà acquittés, par numéro de série du device
+        self.punch_index = PunchIndex(
+            self.config.config_file.parent / self.config.get('punch_index_path', 'zkteco_punch_index.db'),
+            self.config.get('punch_index_retention_days', 90)
+        )
+        # Tous les pointages lus, indexés par device, date et utilisateur (recherches du GUI et de la CLI)
+        self.store = AttendanceStore(
+            self.config.config_file.parent / self.config.get('attendance_store_path', 'zkteco_attendance.db')
         )
+        # Buffers ATTLOG bruts de chaque lecture, par numéro de série (réenvoi et audit sans le device)
+        self.archive = None
+        if self.config.get('attlog_archive', True):
+            self.archive = AttlogArchive(
+                self.config.config_file.parent / self.config.get('attlog_archive_dir', 'attlog_archive'),
+                self.config.get('attlog_archive_fsync', False)
+            )
+        # Un worker par device: curseur, compteur d'erreurs et backoff indépendants
+        self.workers = build_workers(self.config)
+        self.fleet = FleetScheduler(self._pool_size(), self.config.get('api_max_in_flight', 2))
+        self.policy = PollingPolicy(self.config)
+        self.rotation = RotationPolicy(self.config)
+        self.metrics_server = None
+        
+        # Configuration du logging (sans effet si le programme appelant l'a déjà configuré)
+        setup_logging(self.config)
         self.logger = logging.getLogger(__name__)
+        for worker in self.workers:
+            self._restore_worker(worker)
+    
+    def _pool_size(self) -> int:
+        """Threads du pool des devices"""
+        max_workers = self.config.get('max_concurrent_devices', 4)
+        if self.mode == 'realtime':
+            # Chaque device garde un thread pour son écoute temps réel
+            max_workers = max(max_workers, len(self.workers))
+        return max_workers
     
     def start(self):
         """Démarrer le service"""
@@ -34,86 +93,512 @@ class ZKTecoService:
             return
         
         self.is_running = True
+        self.fleet.start()
         self.thread = threading.Thread(target=self._run_loop, daemon=True)
         self.thread.start()
-        self.logger.info("🚀 Service ZKTeco démarré")
+        if self.config.get('metrics_enabled', True) and self.metrics_server is None:
+            try:
+                self.metrics_server = MetricsServer(
+                    METRICS, self.config.get('metrics_host', '127.0.0.1'), self.config.get('metrics_port', 9108)
+                ).start()
+            except OSError as e:
+                # Port occupé (autre instance): le service tourne sans endpoint
+                self.logger.warning(f"⚠️ Endpoint /metrics indisponible: {e}")
+        self.logger.info(f"🚀 Service ZKTeco démarré (mode {self.mode}, {len(self.workers)} device(s))")
     
     def stop(self):
         """Arrêter le service"""
         self.is_running = False
-        if self.thread:
-            self.thread.join(timeout=10)
+        self.fleet.wake()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()  # La boucle attend sur un événement: elle se termine aussitôt
+        self.fleet.stop()
+        self.sessions.close_all()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
         self.logger.info("🛑 Service ZKTeco arrêté")
     
     def _run_loop(self):
-        """Boucle principale du service"""
+        """Boucle principale du service: lance les devices arrivés à échéance, puis dort jusqu'à la prochaine"""
         self.logger.info("🔄 Démarrage de la boucle de surveillance")
         
         while self.is_running:
             try:
-                self._check_attendance()
-                
-                # Attendre l'intervalle configuré
-                sleep_time = self.config.get('polling_interval', 300)
-                self.logger.debug(f"⏰ Attente de {sleep_time} secondes")
-                
-                # Vérifier toutes les secondes si on doit s'arrêter
-                for _ in range(sleep_time):
-                    if not self.is_running:
-                        break
-                    time.sleep(1)
+                self.fleet.submit_due(self.workers, self._device_job)
+                # Nouveaux essais d'envoi dans leur propre pool: la lecture des devices continue
+                self.fleet.submit_upload_retries(self.workers, self._retry_upload)
+                self.fleet.submit_health_checks(self.workers, self._check_health, self.config.get('health_check_interval', 300))
+                self.error_count = 0
+                # Réveil anticipé: synchro forcée, fin d'un job, changement de configuration ou arrêt
+                self.fleet.wait(self.fleet.next_due_in(self.workers))
                     
             except Exception as e:
+                # Le service ne s'arrête jamais de lui-même: la boucle reprend après un court backoff
                 self.error_count += 1
-                self.logger.error(f"💥 Erreur dans la boucle principale: {e}")
-                
-                if self.error_count >= self.max_errors:
-                    self.logger.error("🔴 Trop d'erreurs, arrêt du service")
-                    self.stop()
+                delay = backoff_delay(self.error_count, 1, self.fleet.MAX_WAIT)
+                self.logger.error(f"💥 Erreur dans la boucle principale: {e} (reprise dans {delay:.0f}s)")
+                self.fleet.wait(delay)
+    
+    def _device_job(self, worker: DeviceWorker):
+        """Cycle d'un device: synchronisation puis, en mode realtime, écoute jusqu'à la réconciliation"""
+        self._check_attendance(worker)
+        worker.sync_completed()
+        if self.mode != 'realtime' or worker.error_count:
+            return
+        try:
+            self._listen_live(worker, self.config.get('reconciliation_interval', 1800))
+        except Exception as e:
+            delay = worker.schedule_failure(e, self.config.get('retry_delay', 30), self.config.get('max_backoff', 1800))
+            self.logger.error(f"💥 [{worker.name}] Écoute temps réel interrompue: {e} (nouvel essai dans {int(delay)}s)")
+    
+    def _listen_live(self, worker: DeviceWorker, duration: float):
+        """Transmettre les pointages temps réel à l'API pendant duration secondes"""
+        deadline = time.monotonic() + duration
+        zk_client = self.create_zk_client(*worker.address, worker.timeout, worker.key)
+        
+        def should_stop():
+            # Une synchro forcée interrompt l'écoute: le device repasse aussitôt par la réconciliation
+            return not self.is_running or worker.force_requested or time.monotonic() >= deadline
+        
+        worker.listening = True
+        try:
+            while not should_stop():
+                zk_client.live_capture(lambda attendance: self._forward_live_event(worker, attendance), should_stop)
+                # L'écoute a pu céder la session à une autre opération (test de connexion)
+                time.sleep(0.1)
+        finally:
+            worker.listening = False
+    
+    def _forward_live_event(self, worker: DeviceWorker, attendance: AttendanceRecord):
+        """Enregistrer puis envoyer immédiatement un pointage reçu en temps réel"""
+        self.live_events += 1
+        self.last_live_event = datetime.now()
+        METRICS.inc('zkteco_live_events_total', device=worker.key)
+        self.logger.info(f"📡 [{worker.name}] Pointage temps réel: user {attendance.user_id} à {attendance.time_text}")
+        
+        # La réconciliation relira ce pointage: la file d'envoi l'ignorera
+        self.outbox.enqueue(worker.key, [attendance])
+        if not self._upload(worker):
+            self.logger.warning(f"⚠️ [{worker.name}] Pointage temps réel non transmis, il reste dans la file d'envoi")
+    
+    def _restore_worker(self, worker: DeviceWorker):
+        """Reprendre le curseur et la dernière synchro enregistrés avant le redémarrage"""
+        worker.attendance_cursor = self.outbox.get_cursor(worker.key)
+        worker.last_successful_sync = self.outbox.get_last_successful_sync(worker.key)
+        worker.rotation_attempted = self.outbox.get_rotation_attempt(worker.key)
+        worker.initial_since = self.outbox.get_initial_window(worker.key)
+        worker.archive_failed = self.outbox.get_archive_failure(worker.key)
+        endpoint = self.outbox.get_endpoint(worker.key)
+        if endpoint:
+            # Dernière adresse où le device a répondu (elle a pu changer depuis la configuration)
+            worker.serial, ip, port = endpoint
+            if worker.serial:
+                # Index, copie locale et archive autrefois tenus par numéro de série: repris sous la clé du worker
+                self.punch_index.rename_device(worker.serial, worker.key)
+                self.store.rename_device(worker.serial, worker.key)
+                if self.archive is not None:
+                    self.archive.rename(worker.serial, worker.key)
+            if (ip, port) != worker.address:
+                worker.address = (ip, port)
+                self.logger.info(f"📍 [{worker.name}] Device {worker.serial} joint à sa dernière adresse {ip}:{port}")
+        if worker.attendance_cursor:
+            self.logger.info(f"📌 [{worker.name}] Reprise à l'enregistrement {worker.attendance_cursor.records}")
+    
+    def _upload(self, worker: DeviceWorker, force: bool = False) -> bool:
+        """
+        Envoyer la file du device, sauf s'il attend un nouvel essai (une synchro forcée passe outre).
+        En cas d'échec, l'envoi est replanifié avec backoff: aucun thread n'attend le nouvel essai.
+        """
+        if not force and not worker.upload_due():
+            return False
+        if self._drain_outbox(worker):
+            if worker.upload_failures:
+                self.logger.info(f"🟢 [{worker.name}] Envoi rétabli après {worker.upload_failures} échec(s)")
+            worker.upload_succeeded()
+            return True
+        METRICS.inc('zkteco_retries_total', device=worker.key, kind='upload')
+        breaker = self._breaker(worker)
+        delay = worker.schedule_upload_retry(
+            "Échec de l'envoi des pointages",
+            self.config.get('api_retry_base_delay', 15), self.config.get('api_retry_max_delay', 900),
+            not_before=breaker.retry_in()
+        )
+        self.logger.error(
+            f"❌ [{worker.name}] Échec de l'envoi, {self.outbox.pending_count(worker.key)} pointages "
+            f"conservés en file (nouvel essai dans {int(delay)}s)"
+        )
+        self.fleet.wake()
+        return False
+    
+    def _retry_upload(self, worker: DeviceWorker):
+        """Nouvel essai d'envoi planifié (pool d'envoi, indépendant de la lecture du device)"""
+        if worker.drain_lock.locked():
+            return  # Un envoi est déjà en cours pour ce device
+        self._upload(worker)
+    
+    def _drain_outbox(self, worker: DeviceWorker) -> bool:
+        """Envoyer par lots les pointages en attente du device, jusqu'à vider la file ou échouer"""
+        window = self.config.get('outbox_batch_size', 2000)
+        with worker.drain_lock:
+            api_client = self._api_client(worker)
+            sent = 0
+            while True:
+                rows = self.outbox.pending(worker.key, window)
+                if not rows:
                     break
+                ids = {id(att): row_id for row_id, att in rows}
+                
+                def acknowledge(batch):
+                    nonlocal sent
+                    # Chaque lot acquitté est enregistré aussitôt: il ne sera jamais renvoyé
+                    self.outbox.acknowledge(worker.key, [ids[id(att)] for att in batch])
+                    sent += len(batch)
+                    worker.last_successful_sync = self.last_successful_sync = datetime.now()
+                    METRICS.inc('zkteco_records_sent_total', len(batch), device=worker.key)
+                    # Horloge du device assimilée à l'heure locale, comme les horodatages des pointages
+                    now = to_epoch(worker.last_successful_sync)
+                    for att in batch:
+                        METRICS.observe('zkteco_punch_ack_latency_seconds', max(0, now - att.timestamp), device=worker.key)
+                
+                def reject(batch, reason):
+                    # Refus définitif (400/422): en quarantaine, les pointages suivants continuent de partir
+                    self.outbox.reject(worker.key, [ids[id(att)] for att in batch], reason)
+                    METRICS.inc('zkteco_records_rejected_total', len(batch), device=worker.key)
+                    for att in batch:
+                        self.logger.warning(
+                            f"🚫 [{worker.name}] Pointage user {att.user_id} à {att.time_text} refusé par l'API, "
+                            f"mis en quarantaine: {reason}"
+                        )
                 
-                time.sleep(60)  # Attendre 1 minute en cas d'erreur
+                attendances = [att for _, att in rows]
+                if not api_client.send_attendance(attendances, on_ack=acknowledge, device=worker.key, on_reject=reject):
+                    return False
+            if sent:
+                self.logger.info(f"✅ [{worker.name}] {sent} pointages envoyés et acquittés")
+                self.outbox.purge()
+            return True
     
-    def _check_attendance(self):
-        """Vérifier et envoyer les pointages"""
-        self.logger.info("🔍 Vérification des pointages...")
+    def _api_url(self, worker: DeviceWorker) -> str:
+        return worker.api_url or self.config.get('api_url', 'http://localhost:8000/api/pointages')
+    
+    def _breaker(self, worker: DeviceWorker) -> CircuitBreaker:
+        return get_breaker(
+            self._api_url(worker),
+            self.config.get('api_circuit_failure_threshold', 5),
+            self.config.get('api_circuit_reset_timeout', 60),
+            self.config.get('api_circuit_max_reset_timeout', 900)
+        )
+    
+    def _api_client(self, worker: DeviceWorker, deduplicate: bool = True) -> APIClient:
+        return APIClient(
+            self._api_url(worker),
+            batch_size=self.config.get('api_batch_size', 500),
+            max_in_flight=self.config.get('api_max_in_flight', 2),
+            compress=self.config.get('api_gzip', False),
+            timeout=self.config.get('api_timeout', 30),
+            transport=self.transport,
+            index=self.punch_index if deduplicate else None,
+            breaker=self._breaker(worker),
+            metrics_label=worker.key
+        )
+    
+    def _check_attendance(self, worker: DeviceWorker):
+        """Vérifier et envoyer les pointages d'un device"""
+        with worker.lock, METRICS.phase('cycle', worker.key):
+            self._sync_attendance(worker)
+    
+    def _sync_attendance(self, worker: DeviceWorker):
+        self.logger.info(f"🔍 [{worker.name}] Vérification des pointages...")
         
         try:
-            # Récupérer les pointages depuis la dernière synchronisation
-            since_date = self.last_successful_sync or (
-                datetime.now() - timedelta(hours=24)  # Par défaut, dernières 24h
-            )
+            zk_client = self.create_zk_client(*worker.address, worker.timeout, worker.key)
+            prewarm = self.config.get('api_prewarm', True)
             
-            # CORRECTION : Utiliser seulement ip et port (pas de timeout en 4ème argument)
-            zk_client = ZKTecoClient(
-                self.config.get('zkteco_ip', '192.168.43.33'),
-                self.config.get('zkteco_port', 4370)
-            )
+            if worker.serial_due():
+                # Identifie le device pour le retrouver sur le réseau si son adresse IP change
+                worker.serial = zk_client.get_serial_number()
+                if worker.serial:
+                    self.outbox.save_endpoint(worker.key, worker.serial, *worker.address)
+                else:
+                    worker.next_serial_lookup = time.monotonic() + worker.SERIAL_RETRY_INTERVAL
+            # Clé stable (adresse configurée) de la copie locale et de l'archive, connue dès la première lecture
+            device = worker.key
+            on_buffer = None
+            archived = True
+            if self.archive is not None:
+                def on_buffer(data, start, record_size):
+                    nonlocal archived
+                    try:
+                        self.archive.append(device, data, start, record_size)
+                    except Exception as e:
+                        # L'archive ne bloque jamais la synchronisation, mais la rotation attendra
+                        archived = False
+                        if not worker.archive_failed:
+                            worker.archive_failed = True
+                            self.outbox.save_archive_failure(worker.key, True)
+                        self.logger.error(f"❌ [{worker.name}] Archivage du buffer ATTLOG impossible: {e}")
             
-            attendances = zk_client.get_attendance_since(since_date)
+            if worker.attendance_cursor is None and worker.initial_since is None:
+                # Première lecture complète: ne garder que la fenêtre depuis la dernière synchro (24h par défaut).
+                # Enregistrée avant la lecture: une reprise après interruption applique la même fenêtre
+                worker.initial_since = to_epoch(worker.last_successful_sync or (datetime.now() - timedelta(hours=24)))
+                self.outbox.save_initial_window(worker.key, worker.initial_since)
+            since = worker.initial_since
+            initial = since is not None
+            batch_size = self.config.get('api_batch_size', 500)
+            stream_upload = self.config.get('stream_upload', True)
+            added = queued = 0
+            stored = False
+            full = worker.attendance_cursor is None
             
-            if attendances:
-                self.logger.info(f"📥 {len(attendances)} nouveaux pointages à envoyer")
-                
-                # Envoyer à l'API
-                api_client = APIClient(self.config.get('api_url', 'http://localhost:8000/api/pointages'))
-                success = api_client.send_attendance(attendances)
-                
-                if success:
-                    self.last_successful_sync = datetime.now()
-                    self.last_check = datetime.now()
-                    self.error_count = 0  # Réinitialiser le compteur d'erreurs
-                    self.logger.info("✅ Pointages envoyés avec succès")
-                else:
-                    self.error_count += 1
-                    self.logger.error("❌ Échec de l'envoi des pointages")
+            def on_batch(attendances, cursor, full_read):
+                nonlocal added, queued, prewarm, stored, full
+                full = full or full_read
+                if not attendances and cursor is worker.attendance_cursor:
+                    return  # Cycle à vide: ni écriture SQLite ni trafic vers l'API
+                if prewarm:
+                    # La connexion à l'API s'établit pendant la suite de la lecture du device
+                    self.transport.prewarm(self._api_url(worker))
+                    prewarm = False
+                METRICS.inc('zkteco_records_fetched_total', len(attendances), device=worker.key)
+                with METRICS.phase('store', worker.key):
+                    self.store.add(device, attendances)
+                stored = True
+                if since is not None:
+                    attendances = [att for att in attendances if att.timestamp >= since]
+                # Pointages et curseur enregistrés ensemble, lot par lot: une lecture interrompue reprend au dernier lot
+                with METRICS.phase('enqueue', worker.key):
+                    count = self.outbox.enqueue(worker.key, attendances, cursor)
+                worker.attendance_cursor = cursor
+                added += count
+                queued += count
+                if (stream_upload and queued >= batch_size and worker.upload_due()
+                        and self.fleet.submit_upload(worker, self._retry_upload)):
+                    # Les premiers lots partent vers l'API pendant la suite du transfert
+                    queued = 0
+            
+            # Lecture incrémentale: seuls les enregistrements après le curseur sont transférés, décodés par lots
+            read_started = datetime.now()
+            zk_client.stream_new_attendance(worker.attendance_cursor, on_batch, on_buffer, batch_size)
+            if initial or stored:
+                # Copie locale complète seulement à la fin de la première lecture (reprises comprises)
+                self.store.mark_covered(device, read_started, complete=initial)
+            if initial:
+                worker.initial_since = None
+                self.outbox.save_initial_window(worker.key, None)
+            if worker.archive_failed and full and archived:
+                # Tout le log du device vient d'être archivé: la rotation est de nouveau possible
+                worker.archive_failed = False
+                self.outbox.save_archive_failure(worker.key, False)
+                self.logger.info(f"🗄️ [{worker.name}] Log complet archivé, rotation de nouveau autorisée")
+            # Début de la lecture: tout pointage antérieur est dans la copie locale (cycle à vide compris)
+            worker.last_check = self.last_check = read_started
+            worker.record_activity(added)
+            interval = 0 if self.mode == 'realtime' else self.policy.next_interval(worker)
+            if added:
+                self.logger.info(f"📥 [{worker.name}] {added} nouveaux pointages mis en file d'envoi")
+            
+            # Lecture réussie: la prochaine est planifiée quel que soit le sort de l'envoi
+            worker.schedule_success(interval)
+            if not self.outbox.pending_count(worker.key):
+                self.logger.info(f"📭 [{worker.name}] Aucun nouveau pointage")
+            elif not worker.forced and not worker.upload_due():
+                self.logger.info(
+                    f"⏳ [{worker.name}] Envoi en attente de son nouvel essai "
+                    f"({max(0, int(worker.next_upload - time.monotonic()))}s)"
+                )
             else:
-                self.last_check = datetime.now()
-                self.logger.info("📭 Aucun nouveau pointage")
+                self._upload(worker, force=worker.forced)
+            
+            if (self.rotation.is_due(worker) and self.archive is not None
+                    and not worker.upload_failures and not self.outbox.pending_count(worker.key)):
+                if worker.archive_failed:
+                    # Des pointages du device manquent à l'archive: l'effacement les perdrait
+                    self.logger.warning(
+                        f"⚠️ [{worker.name}] Rotation du log reportée: un buffer ATTLOG n'a pas pu être archivé "
+                        f"(attente d'une lecture complète archivée sans erreur)"
+                    )
+                else:
+                    # Tous les pointages lus sont acquittés par l'API et leurs buffers bruts archivés
+                    self._rotate_log(worker, zk_client)
         
         except Exception as e:
-            self.error_count += 1
-            self.logger.error(f"💥 Erreur lors de la vérification: {e}")
+            METRICS.inc('zkteco_retries_total', device=worker.key, kind='device')
+            delay = worker.schedule_failure(e, self.config.get('retry_delay', 30), self.config.get('max_backoff', 1800))
+            self.logger.error(f"💥 [{worker.name}] Erreur lors de la vérification: {e} (nouvel essai dans {int(delay)}s)")
+            if isinstance(e, (ZKError, OSError)):
+                self._request_relocation(worker)
+    
+    def _check_health(self, worker: DeviceWorker):
+        """Vérification périodique légère du device (occupation mémoire), sans lecture de l'ATTLOG"""
+        if worker.listening:
+            # La sonde attendrait la session de l'écoute temps réel et l'interromprait (has_waiters);
+            # l'écoute prouve déjà que le device répond
+            return
+        try:
+            health = self.create_zk_client(*worker.address, worker.timeout, worker.key).get_health(self.config.get('health_cache_ttl', 15))
+        except Exception as e:
+            worker.health_error = str(e)
+            self.logger.warning(f"⚠️ [{worker.name}] Vérification de santé échouée: {e}")
+            return
+        worker.health, worker.health_error = health, None
+        if health['records_cap'] and health['records'] >= health['records_cap'] * self.config.get('health_records_warning', 0.9):
+            self.logger.warning(
+                f"⚠️ [{worker.name}] Mémoire de pointages presque pleine: {health['records']}/{health['records_cap']}"
+            )
+    
+    def _request_relocation(self, worker: DeviceWorker):
+        """
+        Planifier la recherche sur le réseau d'un device injoignable (adresse DHCP changée).
+
+        Au plus une recherche par discovery_interval, dans le pool de découverte: le balayage du sous-réseau
+        ne garde ni un thread device ni le verrou du device.
+        """
+        if not worker.serial or not self.config.get('discovery_enabled', True):
+            return
+        now = time.monotonic()
+        if worker.last_discovery is not None and now - worker.last_discovery < self.config.get('discovery_interval', 300):
+            return
+        if self.fleet.submit_discovery(worker, self._relocate):
+            worker.last_discovery = now
+    
+    def _relocate(self, worker: DeviceWorker) -> bool:
+        """
+        Rechercher le device par son numéro de série; la nouvelle adresse est mémorisée dans la file d'envoi.
+        :return: True si le device répond à une autre adresse (nouvel essai immédiat)
+        """
+        network = self.config.get('discovery_network') or local_network()
+        ports = sorted(set(self.config.get('discovery_ports', [4370])) | {worker.port})
+        self.logger.info(f"🔎 [{worker.name}] Recherche du device {worker.serial} sur {network}...")
+        try:
+            found = find_device(worker.serial, network, ports, self.config.get('discovery_timeout', 1.0))
+        except Exception as e:
+            self.logger.warning(f"⚠️ [{worker.name}] Recherche sur le réseau impossible: {e}")
+            return False
+        if found is None or (found.ip, found.port) == worker.address:
+            return False
+        worker.address = (found.ip, found.port)
+        self.outbox.save_endpoint(worker.key, worker.serial, found.ip, found.port)
+        self.logger.info(f"📍 [{worker.name}] Device {worker.serial} retrouvé à {found.ip}:{found.port}")
+        worker.next_run = time.monotonic()
+        return True
+    
+    def _rotate_log(self, worker: DeviceWorker, zk_client: ZKTecoClient):
+        """Effacer le log du device (vérifié sous disable_device) et repartir d'un curseur vide"""
+        cursor = worker.attendance_cursor
+        worker.rotation_attempted = datetime.now().date()
+        self.outbox.mark_rotation_attempt(worker.key, worker.rotation_attempted)
+        self.logger.info(f"🔄 [{worker.name}] Rotation du log: {cursor.records} enregistrements acquittés")
+        try:
+            zk_client.rotate_attendance(cursor)
+            status, detail = 'done', None
+        except RotationUnverified as e:
+            # La commande d'effacement est partie: le log a pu être effacé
+            status, detail = 'cleared_unverified', str(e)
+        except ValueError as e:
+            # Vérification refusée: rien n'a été effacé, nouvel essai à la prochaine fenêtre
+            status, detail = 'refused', str(e)
+        except Exception as e:
+            # Erreur avant l'effacement (désactivation, lecture de vérification): rien n'a été effacé
+            status, detail = 'failed', str(e)
+        
+        if status in ('done', 'cleared_unverified'):
+            # Le curseur ne correspond plus au log: la lecture suivante repart du début
+            # (une relecture éventuelle est écartée par l'index des pointages acquittés)
+            worker.attendance_cursor = AttendanceCursor()
+            self.outbox.reset_cursor(worker.key, worker.attendance_cursor)
+        if status == 'done':
+            self.logger.info(f"✅ [{worker.name}] Log du device effacé ({cursor.records} enregistrements)")
+        elif status == 'cleared_unverified':
+            self.logger.error(f"❌ [{worker.name}] Rotation du log non vérifiée: {detail}")
+        else:
+            self.logger.warning(f"⚠️ [{worker.name}] Rotation du log annulée: {detail}")
+        self.outbox.record_rotation(worker.key, cursor.records, cursor.checksum, status, detail)
+        worker.last_rotation = {
+            'at': datetime.now().isoformat(), 'records': cursor.records, 'status': status, 'detail': detail
+        }
+    
+    def query_attendance(self, start_date: datetime, end_date: datetime = None, user_id: str = None) -> List[Dict[str, Any]]:
+        """
+        Pointages de tous les devices entre deux dates, depuis la copie locale indexée.
+
+        Le device n'est lu que si la période dépasse la couverture de la copie: seule la fin du log
+        après le curseur de la synchronisation est alors transférée (sans avancer ce curseur).
+        Le log complet n'est téléchargé qu'une fois par device.
+        """
+        end_date = end_date or datetime.now()
+        attendances = []
+        for worker in self.workers:
+            device = worker.key
+            covered = self.store.covered_until(device)
+            if covered is not None and worker.last_check is not None:
+                # Cycles à vide: rien à enregistrer, la couverture avance seulement en mémoire
+                covered = max(covered, worker.last_check)
+            if covered is None or end_date > covered:
+                read_started = datetime.now()
+                try:
+                    zk_client = self.create_zk_client(*worker.address, worker.timeout, worker.key)
+                    cursor = worker.attendance_cursor if covered is not None else None
+                    tail, _ = zk_client.get_new_attendance(cursor)
+                    self.store.add(device, tail)
+                    self.store.mark_covered(device, read_started, complete=cursor is None)
+                except Exception as e:
+                    self.logger.warning(f"⚠️ [{worker.name}] Device injoignable, réponse depuis la copie locale: {e}")
+            attendances += self.store.query(start_date, end_date, device, user_id)
+        attendances.sort(key=lambda att: att.timestamp)
+        self.logger.info(f"📅 {len(attendances)} pointages entre {start_date} et {end_date}")
+        return attendances
+    
+    def backfill_from_archive(self, since: datetime = None, until: datetime = None) -> int:
+        """
+        Renvoyer à l'API les pointages archivés entre since et until (après une perte de données côté API).
+
+        Les pointages sont relus depuis l'archive locale, pas depuis le device, et envoyés sans le
+        filtre des doublons déjà acquittés.
+
+        :return: nombre de pointages acquittés
+        """
+        if self.archive is None:
+            self.logger.error("❌ Archive ATTLOG désactivée (attlog_archive)")
+            return 0
+        low = to_epoch(since) if since else 0
+        high = to_epoch(until) if until else 2 ** 62
+        sent = 0
+        for name in self.archive.devices():
+            worker = next((w for w in self.workers if self.archive.path(w.key) == self.archive.path(name)), None)
+            if worker is None:
+                # Ni la table utilisateurs ni l'API d'un autre device ne conviennent
+                self.logger.warning(f"⚠️ Archive {name} ignorée: aucun device configuré ne lui correspond")
+                continue
+            users = None
+            try:
+                # Table utilisateurs nécessaire aux formats ATTLOG courts (8 et 16 octets)
+                users = self.create_zk_client(*worker.address, worker.timeout, worker.key)._run(lambda conn: conn.get_user_index(), retry=True)
+            except Exception as e:
+                self.logger.warning(f"⚠️ [{name}] Utilisateurs illisibles, uid utilisé comme identifiant: {e}")
+            attendances = [att for att in self.archive.replay(name, users) if low <= att.timestamp <= high]
+            self.logger.info(f"📼 [{name}] {len(attendances)} pointages relus depuis l'archive")
+            acked = []
+            self._api_client(worker, deduplicate=False).send_attendance(attendances, on_ack=acked.extend)
+            sent += len(acked)
+        return sent
+    
+    def create_zk_client(self, ip: str = None, port: int = None, timeout: int = None,
+                         metrics_label: str = None) -> ZKTecoClient:
+        """
+        Client ZKTeco utilisant la session persistante du device si activée
+
+        :param metrics_label: étiquette des métriques (worker.key), inchangée si le device est retrouvé ailleurs
+        """
+        ip = ip or self.config.get('zkteco_ip', '192.168.43.33')
+        port = port or self.config.get('zkteco_port', 4370)
+        timeout = timeout or self.config.get('timeout', 5)
+        session = None
+        if self.config.get('session_keepalive', True):
+            session = self.sessions.get(ip, port, timeout, metrics_label)
+        return ZKTecoClient(ip, port, timeout, session=session, ping=self.config.get('device_ping', True),
+                            metrics_label=metrics_label)
     
     def test_connection(self, ip: str = None) -> dict:
         """Tester la connectivité complète"""
@@ -127,23 +612,20 @@ class ZKTecoService:
         }
         
         try:
-            # CORRECTION : Utiliser seulement ip et port
-            zk_client = ZKTecoClient(
-                test_ip, 
-                self.config.get('zkteco_port', 4370)
-            )
+            zk_client = self.create_zk_client(test_ip)
             
             try:
-                results['zkteco'] = zk_client.test_connection()
-                
-                # Récupérer les informations de base du device si connecté
-                if results['zkteco']:
-                    results['device_info'] = {
-                        'ip_address': test_ip,
-                        'port': self.config.get('zkteco_port', 4370),
-                        'status': 'Connecté avec succès',
-                        'test_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    }
+                # Sonde légère (read_sizes, firmware, numéro de série): aucune table n'est téléchargée.
+                # Test explicite: toujours un aller-retour avec le device, jamais une sonde en cache
+                health = zk_client.get_health(ttl=0)
+                results['zkteco'] = True
+                results['device_info'] = {
+                    'ip_address': test_ip,
+                    'port': self.config.get('zkteco_port', 4370),
+                    'status': 'Connecté avec succès',
+                    'test_time': datetime.fromisoformat(health['checked_at']).strftime('%Y-%m-%d %H:%M:%S'),
+                    **health
+                }
                     
             except Exception as e:
                 results['zkteco_error'] = str(e)
@@ -151,7 +633,7 @@ class ZKTecoService:
             
             # Test connexion API
             try:
-                api_client = APIClient(self.config.get('api_url', 'http://localhost:8000/api/pointages'))
+                api_client = APIClient(self.config.get('api_url', 'http://localhost:8000/api/pointages'), transport=self.transport)
                 results['api'] = api_client.test_connection()
             except Exception as e:
                 results['api_error'] = str(e)
@@ -166,6 +648,34 @@ class ZKTecoService:
         """Mettre à jour la configuration"""
         success = self.config.save_config(new_config)
         if success:
+            # L'adresse du device a pu changer: les sessions seront rouvertes au prochain poll
+            self.sessions.close_all()
+            self.sessions.ping = self.config.get('device_ping', True)
+            # Options du pool HTTP éventuellement modifiées
+            reset_transport()
+            self.transport = get_transport(self.config)
+            # Conserver l'état (curseur, erreurs) des devices toujours présents
+            current = {worker.key: worker for worker in self.workers}
+            workers = []
+            for worker in build_workers(self.config):
+                existing = current.get(worker.key)
+                if existing:
+                    existing.name, existing.timeout, existing.api_url = worker.name, worker.timeout, worker.api_url
+                    worker = existing
+                else:
+                    self._restore_worker(worker)
+                workers.append(worker)
+            self.workers = workers
+            # max_concurrent_devices, api_max_in_flight ou nombre de devices (écoutes temps réel) modifiés
+            self.fleet.resize(self._pool_size(), self.config.get('api_max_in_flight', 2))
+            # Nouveaux intervalles pris en compte tout de suite
+            self.policy = PollingPolicy(self.config)
+            self.rotation = RotationPolicy(self.config)
+            if self.mode != 'realtime':
+                now = time.monotonic()
+                for worker in self.workers:
+                    worker.next_run = min(worker.next_run, now + self.policy.next_interval(worker))
+            self.fleet.wake()
             self.logger.info("✅ Configuration mise à jour")
         else:
             self.logger.error("❌ Erreur mise à jour configuration")
@@ -175,14 +685,41 @@ class ZKTecoService:
         """Obtenir le statut détaillé du service"""
         return {
             'running': self.is_running,
+            'mode': self.mode,
+            'live_events': self.live_events,
+            'last_live_event': self.last_live_event.isoformat() if self.last_live_event else None,
             'last_check': self.last_check.isoformat() if self.last_check else None,
             'last_successful_sync': self.last_successful_sync.isoformat() if self.last_successful_sync else None,
-            'error_count': self.error_count,
+            'error_count': self.error_count + sum(worker.error_count for worker in self.workers),
+            'devices': [worker.get_status() for worker in self.workers],
+            'device_sessions': self.sessions.get_stats(),
+            'outbox': self.outbox.get_stats(),
+            'api_transport': self.transport.get_stats(),
+            'api_circuits': {
+                url: self._breaker(worker).get_stats()
+                for url, worker in {self._api_url(worker): worker for worker in self.workers}.items()
+            },
+            'punch_index': self.punch_index.get_stats(),
+            'log_rotations': self.outbox.get_rotations(limit=10),
+            'attendance_store': self.store.get_stats(),
+            'attlog_archive': self.archive.get_stats() if self.archive else None,
+            'metrics': METRICS.snapshot(),
             'config': self.config.get_all()
         }
     
-    def force_sync(self) -> bool:
-        """Forcer une synchronisation immédiate"""
+    def force_sync(self, timeout: float = None) -> bool:
+        """Forcer une synchronisation immédiate (réveille la boucle du service et attend le résultat)"""
         self.logger.info("🔀 Synchronisation forcée demandée")
-        self._check_attendance()
-        return self.error_count == 0
\ No newline at end of file
+        if not self.is_running:
+            # Service arrêté: synchronisation directe
+            for worker in self.workers:
+                worker.forced = True
+            self.fleet.run_all(self.workers, self._check_attendance)
+        else:
+            waiters = self.fleet.force(self.workers)
+            deadline = time.monotonic() + timeout if timeout else None
+            while self.is_running and not all(waiter.done() for waiter in waiters):
+                if deadline and time.monotonic() >= deadline:
+                    return False
+                wait_futures(waiters, timeout=1)
+        return all(worker.error_count == 0 and worker.upload_failures == 0 for worker in self.workers)
\ No newline at end of file
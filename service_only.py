@@ -3,21 +3,12 @@ import os
 import time
 import logging
 from service import ZKTecoService
-
-def setup_logging():
-    """Configurer le logging sans console"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('zkteco_service.log', encoding='utf-8')
-            # Pas de StreamHandler pour éviter la console
-        ]
-    )
+from log_setup import setup_logging
 
 def main():
     """Lancement silencieux du service"""
-    setup_logging()
+    # Pas de console: fichier seulement
+    setup_logging(console=False)
     logger = logging.getLogger(__name__)
     
     try:
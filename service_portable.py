@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from config import Config
 from zkteco_client import ZKTecoClient
 from api_client import APIClient
+from log_setup import setup_logging
 
 class ZKTecoPortableService:
     def __init__(self):
@@ -17,14 +18,7 @@ class ZKTecoPortableService:
         self.max_errors = 5
         
         # Configuration du logging pour portable
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - ZKTecoService - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('zkteco_service.log', encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        setup_logging(self.config)
         self.logger = logging.getLogger(__name__)
         
         # Log de démarrage
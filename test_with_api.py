@@ -29,7 +29,7 @@ def test_with_api():
             # Afficher les 3 premiers pour vérifier le format
             print("\n📝 Format des données (3 premiers):")
             for i, att in enumerate(attendances[:3]):
-                print(f"  {i+1}. UID: {att['uid']}, ID: {att['id']}, Time: {att['timestamp']}")
+                print(f"  {i+1}. UID: {att.user_id}, Time: {att.time_text}, Type: {att.punch}")
             
             # Envoyer à l'API
             api_client = APIClient(config.get('api_url'))
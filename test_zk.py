@@ -1,7 +1,10 @@
+import sys
+
 from zk import ZK
 
-ip = '192.168.43.33'  # l’adresse IP de ton device
-port = 4370            # port par défaut ZKTeco
+# Adresse et port en arguments pour tester un autre device ou le simulateur (zkteco_simulator.py)
+ip = sys.argv[1] if len(sys.argv) > 1 else '192.168.43.33'  # l’adresse IP de ton device
+port = int(sys.argv[2]) if len(sys.argv) > 2 else 4370      # port par défaut ZKTeco
 
 try:
     print(f"Connexion à {ip}:{port} ...")
@@ -0,0 +1,482 @@
+import asyncio
+import logging
+import zlib
+from struct import pack, unpack
+from typing import AsyncIterator, List, Optional, Tuple
+
+from zk import const
+from zk.attendance import Attendance
+from zk.base import make_commkey
+from zk.exception import ZKErrorConnection, ZKErrorResponse, ZKNetworkError
+from zk.user import User
+
+from zkteco_device import (
+    ATTLOG_HEADER_SIZE, AttendanceCursor, AttendanceRecord, UserIndex, cached_user_index, store_user_index,
+    decode_attlog_full, decode_attlog_tail, decode_attendance_records, decode_live_events, decode_records,
+    decode_user_records, verify_start,
+)
+
+# Taille maximale d'un chunk 1504 en TCP (identique à zk.base.ZK)
+MAX_CHUNK = 0xFFc0
+ACK_CODES = (const.CMD_ACK_OK, const.CMD_PREPARE_DATA, const.CMD_DATA)
+
+
+def create_checksum(packet: bytes) -> int:
+    """Checksum d'un paquet (zkemsdk.c, équivalent à ZK.__create_checksum)"""
+    checksum = 0
+    size = len(packet)
+    for i in range(0, size - 1, 2):
+        checksum += packet[i] | (packet[i + 1] << 8)
+        if checksum > const.USHRT_MAX:
+            checksum -= const.USHRT_MAX
+    if size % 2:
+        checksum += packet[-1]
+    while checksum > const.USHRT_MAX:
+        checksum -= const.USHRT_MAX
+    checksum = ~checksum
+    while checksum < 0:
+        checksum += const.USHRT_MAX
+    return checksum
+
+
+def create_packet(command: int, command_string: bytes, session_id: int, reply_id: int) -> bytes:
+    """Paquet TCP complet (en-tête 0x5050/0x7282 + en-tête de commande), reply_id déjà incrémenté"""
+    checksum = create_checksum(pack('<4H', command, 0, session_id, reply_id) + command_string)
+    reply_id += 1
+    if reply_id >= const.USHRT_MAX:
+        reply_id -= const.USHRT_MAX
+    packet = pack('<4H', command, checksum, session_id, reply_id) + command_string
+    return pack('<HHI', const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2, len(packet)) + packet
+
+
+class AsyncZKDevice:
+    """
+    Client asyncio du protocole ZKTeco (TCP), équivalent non bloquant de ZKDevice.
+
+    Chaque opération est bornée par timeout: un device muet ne bloque que sa propre coroutine.
+    """
+
+    # Durée maximale de validité de la table utilisateurs en cache (secondes)
+    USER_CACHE_TTL = 3600
+
+    def __init__(self, ip: str, port: int = 4370, timeout: float = 5, password: int = 0, encoding: str = 'UTF-8'):
+        self.ip = ip
+        self.port = port
+        self.address = (ip, port)
+        self.timeout = timeout
+        self.password = password
+        self.encoding = encoding
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.lock = asyncio.Lock()  # Une seule commande en vol par connexion
+        self.session_id = 0
+        self.reply_id = const.USHRT_MAX - 1
+        self.is_connect = False
+        self.is_enabled = True
+        self.end_live_capture = False
+        self.pending_events: List[bytes] = []  # Événements reçus pendant l'attente d'une réponse
+        self.user_packet_size = 72
+        self.users = self.fingers = self.records = self.cards = self.faces = 0
+        self.users_cap = self.fingers_cap = self.rec_cap = self.faces_cap = 0
+        self.users_av = self.fingers_av = self.rec_av = 0
+        self.next_uid = 1
+        self.next_user_id = '1'
+        self.logger = logging.getLogger(__name__)
+
+    async def __aenter__(self) -> 'AsyncZKDevice':
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    async def connect(self) -> 'AsyncZKDevice':
+        """Ouvrir la connexion TCP et la session (authentification si le device l'exige)"""
+        self.end_live_capture = False
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.ip, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ZKNetworkError(f"can't reach device {self.ip}:{self.port} ({e})")
+        self.session_id = 0
+        self.reply_id = const.USHRT_MAX - 1
+        self.pending_events = []
+        code, _ = await self.send_command(const.CMD_CONNECT)
+        if code == const.CMD_ACK_UNAUTH:
+            code, _ = await self.send_command(const.CMD_AUTH, make_commkey(self.password, self.session_id))
+        if code not in ACK_CODES:
+            self._close_transport()
+            if code == const.CMD_ACK_UNAUTH:
+                raise ZKErrorResponse("Unauthenticated")
+            raise ZKErrorResponse("Invalid response: Can't connect")
+        self.is_connect = True
+        return self
+
+    async def disconnect(self):
+        """Fermer la session puis la connexion TCP"""
+        try:
+            if self.is_connect:
+                await self.send_command(const.CMD_EXIT)
+        finally:
+            self._close_transport()
+
+    def _close_transport(self):
+        self.is_connect = False
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def _read_packet(self, wait: float = None) -> Tuple[Tuple[int, int, int, int], bytes]:
+        """
+        Lire un paquet TCP complet.
+
+        wait borne l'attente du début du paquet (aucun octet consommé si elle expire),
+        la suite du paquet est bornée par timeout.
+        """
+        top = await asyncio.wait_for(self.reader.readexactly(8), self.timeout if wait is None else wait)
+        magic1, magic2, length = unpack('<HHI', top)
+        if magic1 != const.MACHINE_PREPARE_DATA_1 or magic2 != const.MACHINE_PREPARE_DATA_2 or length < 8:
+            raise ZKNetworkError("TCP packet invalid")
+        packet = await asyncio.wait_for(self.reader.readexactly(length), self.timeout)
+        return unpack('<4H', packet[:8]), packet[8:]
+
+    async def _read_response(self) -> Tuple[int, bytes]:
+        """Réponse à la dernière commande, en mettant de côté les événements temps réel reçus entre-temps"""
+        while True:
+            header, data = await self._read_packet()
+            if header[0] == const.CMD_REG_EVENT:
+                await self._ack_ok()
+                self.pending_events.append(data)
+                continue
+            self.reply_id = header[3]
+            if self.session_id == 0:
+                self.session_id = header[2]
+            return header[0], data
+
+    async def _ack_ok(self):
+        self.writer.write(create_packet(const.CMD_ACK_OK, b'', self.session_id, const.USHRT_MAX - 1))
+        await self.writer.drain()
+
+    async def _exchange(self, command: int, command_string: bytes) -> Tuple[int, bytes]:
+        self.writer.write(create_packet(command, command_string, self.session_id, self.reply_id))
+        await self.writer.drain()
+        return await self._read_response()
+
+    async def send_command(self, command: int, command_string: bytes = b'') -> Tuple[int, bytes]:
+        """
+        Envoyer une commande et attendre sa réponse (au plus timeout secondes).
+
+        :return: (code de réponse, données)
+        """
+        if command not in (const.CMD_CONNECT, const.CMD_AUTH) and not self.is_connect:
+            raise ZKErrorConnection("instance are not connected.")
+        if self.writer is None:
+            raise ZKErrorConnection("instance are not connected.")
+        async with self.lock:
+            try:
+                return await asyncio.wait_for(self._exchange(command, command_string), self.timeout)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError) as e:
+                # Flux désynchronisé: la connexion n'est plus utilisable
+                self._close_transport()
+                raise ZKNetworkError(f"{self.ip}:{self.port} commande {command}: {str(e) or 'timeout'}")
+
+    async def _command(self, command: int, command_string: bytes = b'', error: str = None) -> bytes:
+        code, data = await self.send_command(command, command_string)
+        if code not in ACK_CODES:
+            raise ZKErrorResponse(error or f"command {command} failed ({code})")
+        return data
+
+    async def enable_device(self):
+        await self._command(const.CMD_ENABLEDEVICE, error="Can't enable device")
+        self.is_enabled = True
+
+    async def disable_device(self):
+        await self._command(const.CMD_DISABLEDEVICE, error="Can't disable device")
+        self.is_enabled = False
+
+    async def free_data(self):
+        await self._command(const.CMD_FREE_DATA, error="can't free data")
+
+    async def get_serialnumber(self) -> str:
+        """Numéro de série (CMD_OPTIONS_RRQ ~SerialNumber, comme ZK.get_serialnumber)"""
+        data = await self._command(const.CMD_OPTIONS_RRQ, b'~SerialNumber\x00', error="Can't read serial number")
+        return data.split(b'=', 1)[-1].split(b'\x00')[0].replace(b'=', b'').decode()
+
+    async def read_sizes(self) -> bool:
+        """Lire l'occupation mémoire (mêmes attributs que ZK.read_sizes)"""
+        data = await self._command(const.CMD_GET_FREE_SIZES, error="can't read sizes")
+        if len(data) >= 80:
+            fields = unpack('20i', data[:80])
+            self.users = fields[4]
+            self.fingers = fields[6]
+            self.records = fields[8]
+            self.cards = fields[12]
+            self.fingers_cap = fields[14]
+            self.users_cap = fields[15]
+            self.rec_cap = fields[16]
+            self.fingers_av = fields[17]
+            self.users_av = fields[18]
+            self.rec_av = fields[19]
+            data = data[80:]
+        if len(data) >= 12:
+            fields = unpack('3i', data[:12])
+            self.faces = fields[0]
+            self.faces_cap = fields[2]
+        return True
+
+    async def _read_chunk(self, start: int, size: int) -> bytes:
+        """Lire un chunk du buffer préparé (1504), renvoyé directement ou en paquets CMD_DATA"""
+        async with self.lock:
+            try:
+                return await asyncio.wait_for(self._receive_chunk(start, size), self.timeout)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError) as e:
+                self._close_transport()
+                raise ZKNetworkError(f"{self.ip}:{self.port} lecture du chunk {start}:[{size}]: {str(e) or 'timeout'}")
+
+    async def _receive_chunk(self, start: int, size: int) -> bytes:
+        code, data = await self._exchange(1504, pack('<ii', start, size))
+        if code == const.CMD_DATA:
+            return data
+        if code != const.CMD_PREPARE_DATA:
+            raise ZKErrorResponse(f"can't read chunk {start}:[{size}]")
+        remaining = unpack('I', data[:4])[0]
+        parts = []
+        while True:
+            code, data = await self._read_response()
+            if code == const.CMD_DATA:
+                parts.append(data)
+                remaining -= len(data)
+            elif code == const.CMD_ACK_OK:
+                break
+            else:
+                raise ZKErrorResponse(f"can't read chunk {start}:[{size}]")
+        if remaining > 0:
+            raise ZKErrorResponse(f"incomplete chunk {start}:[{size}]")
+        return b''.join(parts)
+
+    async def read_buffer_from(self, command: int, start: int = 0, fct: int = 0, ext: int = 0) -> Tuple[bytes, int]:
+        """
+        Préparer un buffer côté device (1503) et ne transférer que les octets à partir de start (1504).
+
+        :return: (données lues depuis start, taille totale du buffer)
+        """
+        code, data = await self.send_command(1503, pack('<bhii', 1, command, fct, ext))
+        if code not in ACK_CODES:
+            raise ZKErrorResponse("RWB Not supported")
+        if code == const.CMD_DATA:
+            # Petit buffer renvoyé directement dans la réponse
+            return data[start:], len(data)
+        size = unpack('I', data[1:5])[0]
+        parts = []
+        position = start
+        while position < size:
+            chunk_size = min(MAX_CHUNK, size - position)
+            parts.append(await self._read_chunk(position, chunk_size))
+            position += chunk_size
+        await self.free_data()
+        return b''.join(parts), size
+
+    async def read_with_buffer(self, command: int, fct: int = 0, ext: int = 0) -> Tuple[bytes, int]:
+        """Lire un buffer complet (équivalent à ZK.read_with_buffer)"""
+        return await self.read_buffer_from(command, 0, fct, ext)
+
+    async def get_users(self) -> List[User]:
+        """Liste des utilisateurs"""
+        await self.read_sizes()
+        if self.users == 0:
+            self.next_uid = 1
+            self.next_user_id = '1'
+            return []
+        userdata, size = await self.read_with_buffer(const.CMD_USERTEMP_RRQ, const.FCT_USER)
+        if size <= 4:
+            return []
+        total_size = unpack('I', userdata[:4])[0]
+        self.user_packet_size = total_size / self.users
+        users = decode_user_records(memoryview(userdata)[4:], 28 if self.user_packet_size == 28 else 72, self.encoding)
+        max_uid = max((u.uid for u in users), default=0) + 1
+        self.next_uid = max_uid
+        user_ids = {u.user_id for u in users}
+        while str(max_uid) in user_ids:
+            max_uid += 1
+        self.next_user_id = str(max_uid)
+        return users
+
+    async def get_user_index(self, refresh_sizes: bool = True) -> UserIndex:
+        """Table utilisateurs indexée, partagée avec ZKDevice (même cache par adresse)"""
+        if refresh_sizes:
+            await self.read_sizes()
+        fingerprint = (self.users, self.users_av, self.fingers, self.cards, self.faces)
+        index = cached_user_index(self.address, fingerprint, self.USER_CACHE_TTL)
+        if index is None:
+            index = UserIndex(await self.get_users(), fingerprint)
+            store_user_index(self.address, index)
+        return index
+
+    async def get_attendance(self) -> List[Attendance]:
+        """Liste complète des pointages"""
+        await self.read_sizes()
+        if self.records == 0:
+            return []
+        users = await self.get_user_index(refresh_sizes=False)
+        data, size = await self.read_with_buffer(const.CMD_ATTLOG_RRQ)
+        if size < ATTLOG_HEADER_SIZE:
+            return []
+        total_size = unpack('I', data[:4])[0]
+        return decode_attendance_records(memoryview(data)[ATTLOG_HEADER_SIZE:], total_size // self.records, users)
+
+    async def get_attendance_since_cursor(self, cursor: Optional[AttendanceCursor] = None,
+                                          decode=decode_attendance_records) -> Tuple[list, AttendanceCursor, bool]:
+        """
+        Lire uniquement les enregistrements ATTLOG ajoutés depuis le curseur (voir ZKDevice).
+
+        :return: (nouveaux pointages, nouveau curseur, lecture complète effectuée)
+        """
+        await self.read_sizes()
+        records = self.records
+        if records == 0:
+            if cursor is not None and cursor.records == 0:
+                return [], cursor, False  # Device toujours vide: curseur inchangé
+            return [], AttendanceCursor(), cursor is not None
+
+        incremental = cursor is not None and cursor.record_size > 0 and records >= cursor.records
+        if incremental and records == cursor.records:
+            return [], cursor, False
+
+        users = await self.get_user_index(refresh_sizes=False)
+        if incremental:
+            # Le dernier enregistrement déjà lu est relu avec la suite et vérifié par son empreinte
+            start = verify_start(cursor)
+            data, size = await self.read_buffer_from(const.CMD_ATTLOG_RRQ, cursor.offset if start is None else start)
+            if start is not None:
+                previous, data = data[:cursor.record_size], data[cursor.record_size:]
+                if zlib.crc32(previous) != cursor.last_record:
+                    self.logger.warning(f"⚠️ Log du device {self.ip}:{self.port} remplacé depuis la dernière lecture: relecture complète")
+                    data = None
+            tail = decode_attlog_tail(data, size, cursor, users, decode) if data is not None else None
+            if tail is not None:
+                return tail[0], tail[1], False
+
+        data, size = await self.read_buffer_from(const.CMD_ATTLOG_RRQ)
+        attendances, new_cursor = decode_attlog_full(data, records, users, decode)
+        return attendances, new_cursor, True
+
+    async def live_capture(self, new_timeout: float = 10) -> AsyncIterator[Optional[Attendance]]:
+        """
+        Capture des événements temps réel (même comportement que ZK.live_capture).
+
+        Produit None après new_timeout secondes sans événement pour rendre la main.
+        """
+        was_enabled = self.is_enabled
+        users = await self.get_user_index()
+        await self.send_command(const.CMD_CANCELCAPTURE)
+        await self._command(const.CMD_STARTVERIFY, error="Cant Verify")
+        if not self.is_enabled:
+            await self.enable_device()
+        await self._command(const.CMD_REG_EVENT, pack('I', const.EF_ATTLOG), error="cant' reg events")
+        self.end_live_capture = False
+        try:
+            while not self.end_live_capture:
+                if self.pending_events:
+                    data = self.pending_events.pop(0)
+                else:
+                    async with self.lock:
+                        try:
+                            header, data = await self._read_packet(wait=new_timeout)
+                        except asyncio.TimeoutError:
+                            data = None
+                        except (asyncio.IncompleteReadError, OSError) as e:
+                            self._close_transport()
+                            raise ZKNetworkError(f"{self.ip}:{self.port} écoute temps réel: {e}")
+                        else:
+                            await self._ack_ok()
+                            if header[0] != const.CMD_REG_EVENT:
+                                continue
+                if data is None:
+                    yield None  # rendre la main pour continuer la surveillance
+                    continue
+                for attendance in decode_live_events(data, users):
+                    yield attendance
+        finally:
+            if self.is_connect:
+                await self._command(const.CMD_REG_EVENT, pack('I', 0), error="cant' reg events")
+                if not was_enabled:
+                    await self.disable_device()
+
+
+class AsyncZKTecoClient:
+    """Variante asyncio de ZKTecoClient: une coroutine par device au lieu d'un thread"""
+
+    def __init__(self, ip: str, port: int = 4370, timeout: float = 5):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.zk = AsyncZKDevice(ip, port=port, timeout=timeout)
+        self.logger = logging.getLogger(__name__)
+
+    async def __aenter__(self) -> 'AsyncZKTecoClient':
+        if not await self.connect():
+            raise ConnectionError(f"Connexion impossible au device {self.ip}:{self.port}")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    async def connect(self) -> bool:
+        """Établir la connexion avec le device ZKTeco"""
+        try:
+            await self.zk.connect()
+            self.logger.info(f"✅ Connecté au device ZKTeco {self.ip}")
+            return True
+        except Exception as e:
+            self.logger.error(f"❌ Erreur connexion ZKTeco {self.ip}: {e}")
+            return False
+
+    async def disconnect(self):
+        """Fermer la connexion"""
+        try:
+            await self.zk.disconnect()
+            self.logger.info(f"✅ Déconnecté du device ZKTeco {self.ip}")
+        except Exception as e:
+            self.logger.error(f"❌ Erreur déconnexion: {e}")
+
+    async def _run(self, operation):
+        """Exécuter une opération sur la connexion courante, ou sur une connexion ouverte pour l'occasion"""
+        if self.zk.is_connect:
+            return await operation(self.zk)
+        async with self:
+            return await operation(self.zk)
+
+    async def get_attendance(self) -> List[AttendanceRecord]:
+        """Récupérer tous les pointages du device"""
+        try:
+            attendances = (await self._run(lambda zk: zk.get_attendance_since_cursor(None, decode_records)))[0]
+            self.logger.info(f"📊 {len(attendances)} pointages récupérés ({self.ip})")
+            return attendances
+        except Exception as e:
+            self.logger.error(f"❌ Erreur lors de la récupération ({self.ip}): {e}")
+            return []
+
+    async def get_new_attendance(self, cursor: Optional[AttendanceCursor] = None) -> Tuple[List[AttendanceRecord], AttendanceCursor]:
+        """Récupérer uniquement les pointages ajoutés depuis le curseur"""
+        attendances, new_cursor, full_read = await self._run(lambda zk: zk.get_attendance_since_cursor(cursor, decode_records))
+        if full_read:
+            self.logger.info(f"📊 {len(attendances)} pointages récupérés (lecture complète, {self.ip})")
+        else:
+            self.logger.info(f"📊 {len(attendances)} nouveaux pointages lus depuis l'enregistrement {cursor.records} ({self.ip})")
+        return attendances, new_cursor
+
+    async def live_capture(self, timeout: float = 1) -> AsyncIterator[Optional[AttendanceRecord]]:
+        """Pointages temps réel (None à chaque période d'inactivité)"""
+        self.logger.info(f"📡 Écoute temps réel du device {self.ip}:{self.port}")
+        async for att in self.zk.live_capture(new_timeout=timeout):
+            yield AttendanceRecord.from_attendance(att) if att is not None else None
+
+    def stop_live_capture(self):
+        self.zk.end_live_capture = True
+
+    async def test_connection(self) -> bool:
+        """Tester la connexion au device"""
+        try:
+            return await self._run(lambda zk: zk.read_sizes())
+        except Exception as e:
+            self.logger.error(f"❌ Test connexion échoué ({self.ip}): {e}")
+            return False
@@ -1,13 +1,22 @@
-from zk import ZK
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Callable
 import logging
+from zkteco_device import ZKDevice, AttendanceCursor, AttendanceRecord, cached_health, store_health, to_epoch
+from device_session import DeviceSession
+
+def format_attendance(att) -> Dict[str, Any]:
+    """Format SIMPLIFIÉ d'un pointage pour l'API Laravel"""
+    return AttendanceRecord.from_attendance(att).to_dict()
 
 class ZKTecoClient:
-    def __init__(self, ip: str, timeout: int = 5):
+    def __init__(self, ip: str, port: int = 4370, timeout: int = 5, session: DeviceSession = None,
+                 ping: bool = True, metrics_label: str = None):
         self.ip = ip
+        self.port = port
         self.timeout = timeout
-        self.zk = ZK(ip, timeout=timeout)
+        self.session = session
+        # ping: ping ICMP avant la connexion (comportement de pyzk), à désactiver si l'ICMP est filtré
+        self.zk = ZKDevice(ip, port=port, timeout=timeout, ommit_ping=not ping, metrics_label=metrics_label)
         self.conn = None
         self.logger = logging.getLogger(__name__)
     
@@ -32,82 +41,156 @@ class ZKTecoClient:
             finally:
                 self.conn = None
     
-    def get_attendance(self) -> List[Dict[str, Any]]:
-        """Récupérer les pointages depuis le device et formater pour l'API"""
+    def _run(self, operation: Callable[[ZKDevice], Any], check_health: bool = True, retry: bool = False) -> Any:
+        """
+        Exécuter une opération sur la session persistante, ou sur une connexion ouverte pour l'occasion.
+
+        retry=True (lectures seulement): relance après reconnexion si la session persistante est coupée.
+        """
+        if self.session:
+            return self.session.run(operation, check_health, retry)
         if not self.connect():
-            return []
-        
+            raise ConnectionError(f"Connexion impossible au device {self.ip}:{self.port}")
+        try:
+            return operation(self.conn)
+        finally:
+            self.disconnect()
+    
+    def get_attendance(self) -> List[AttendanceRecord]:
+        """Récupérer tous les pointages du device"""
         try:
-            attendances = self.conn.get_attendance()
+            attendances = self._run(lambda conn: conn.get_records_since_cursor(None), retry=True)[0]
             self.logger.info(f"📊 {len(attendances)} pointages récupérés")
-            
-            formatted_attendances = []
-            for att in attendances:
-                # Format SIMPLIFIÉ pour l'API Laravel
-                attendance_data = {
-                    'uid': str(att.user_id),
-                    'id': int(att.user_id),
-                    'state': int(att.status) if att.status is not None else 0,
-                    'timestamp': att.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-                    'type': int(att.punch) if att.punch is not None else 0
-                }
-                formatted_attendances.append(attendance_data)
-                
-                # Log détaillé
-                self.logger.debug(
-                    f"👤 User: {att.user_id} | "
-                    f"Time: {att.timestamp.strftime('%Y-%m-%d %H:%M:%S')} | "
-                    f"Status: {att.status} | "
-                    f"Punch: {att.punch}"
-                )
-            
-            return formatted_attendances
+            self._log_attendances(attendances)
+            return attendances
             
         except Exception as e:
             self.logger.error(f"❌ Erreur lors de la récupération: {e}")
             return []
-        finally:
-            self.disconnect()
     
-    def get_attendance_since(self, since_date: datetime) -> List[Dict[str, Any]]:
+    def get_new_attendance(self, cursor: Optional[AttendanceCursor] = None,
+                           on_buffer: Callable[[bytes, int, int], None] = None) -> Tuple[List[AttendanceRecord], AttendanceCursor]:
+        """Récupérer uniquement les pointages ajoutés depuis le curseur (lecture de la fin de l'ATTLOG)"""
+        attendances, new_cursor, full_read = self._run(
+            lambda conn: conn.get_records_since_cursor(cursor, on_buffer), retry=True)
+        if full_read or cursor is None:
+            self.logger.info(f"📊 {len(attendances)} pointages récupérés (lecture complète)")
+        else:
+            self.logger.info(f"📊 {len(attendances)} nouveaux pointages lus depuis l'enregistrement {cursor.records}")
+        self._log_attendances(attendances)
+        return attendances, new_cursor
+    
+    def stream_new_attendance(self, cursor: Optional[AttendanceCursor],
+                              on_batch: Callable[[List[AttendanceRecord], AttendanceCursor, bool], None],
+                              on_buffer: Callable[[bytes, int, int], None] = None,
+                              batch_size: int = None) -> AttendanceCursor:
+        """
+        Lire les pointages ajoutés depuis le curseur et les passer à on_batch lot par lot, pendant le transfert.
+
+        on_batch reçoit (pointages, curseur après le lot, lecture complète). Si la session relance la lecture
+        après une coupure, elle reprend après le dernier lot transmis.
+
+        :return: curseur final
+        """
+        progress = {'cursor': cursor, 'count': 0, 'full_read': False}
+        
+        def read(conn):
+            for batch, new_cursor, full_read in conn.iter_attendance_since_cursor(progress['cursor'], on_buffer, batch_size):
+                on_batch(batch, new_cursor, full_read)
+                progress['cursor'] = new_cursor
+                progress['count'] += len(batch)
+                progress['full_read'] = progress['full_read'] or full_read
+        
+        # read_sizes, première commande de la lecture, vérifie déjà la session: un cycle à vide
+        # se limite à cet échange (en cas d'erreur, la session se reconnecte et la lecture reprend)
+        self._run(read, check_health=False, retry=True)
+        if progress['full_read'] or cursor is None:
+            self.logger.info(f"📊 {progress['count']} pointages récupérés (lecture complète)")
+        else:
+            self.logger.info(f"📊 {progress['count']} nouveaux pointages lus depuis l'enregistrement {cursor.records}")
+        return progress['cursor']
+    
+    def get_serial_number(self) -> Optional[str]:
+        """Numéro de série du device (None si illisible)"""
+        try:
+            return self._run(lambda conn: conn.get_serialnumber(), retry=True) or None
+        except Exception as e:
+            self.logger.warning(f"⚠️ Numéro de série illisible ({self.ip}): {e}")
+            return None
+    
+    def get_health(self, ttl: float = 15) -> dict:
+        """
+        État du device sans télécharger ses tables: utilisateurs, pointages, capacités, firmware, numéro de série.
+
+        Le résultat est gardé ttl secondes (vérifications de plusieurs sources); ttl=0 interroge toujours le device.
+        Lève une exception si le device est injoignable.
+        """
+        health = cached_health((self.ip, self.port), ttl) if ttl > 0 else None
+        if health is None:
+            health = self._run(lambda conn: conn.read_health(), check_health=False, retry=True)
+            store_health((self.ip, self.port), health)
+        return health
+    
+    def rotate_attendance(self, cursor: AttendanceCursor) -> int:
+        """Effacer l'ATTLOG du device après vérification (nombre et somme de contrôle) sous disable_device"""
+        # Pas de nouvel essai automatique: l'effacement ne doit jamais être rejoué
+        cleared = self._run(lambda conn: conn.rotate_attendance(cursor))
+        self.logger.info(f"🗑️ ATTLOG effacé sur {self.ip}: {cleared} enregistrements")
+        return cleared
+    
+    def live_capture(self, on_event: Callable[[AttendanceRecord], None], should_stop: Callable[[], bool], timeout: int = 1):
+        """
+        Écouter les pointages en temps réel (CMD_REG_EVENT / EF_ATTLOG) jusqu'à ce que should_stop() soit vrai.
+
+        L'écoute rend aussi la main dès qu'une autre opération attend la session persistante.
+        """
+        def capture(conn):
+            self.logger.info(f"📡 Écoute temps réel du device {self.ip}:{self.port}")
+            for att in conn.live_capture(new_timeout=timeout):
+                if att is not None:
+                    on_event(AttendanceRecord.from_attendance(att))
+                if should_stop() or (self.session and self.session.has_waiters()):
+                    conn.end_live_capture = True
+        
+        self._run(capture, retry=True)
+    
+    def _log_attendances(self, attendances: List[AttendanceRecord]):
+        """Log détaillé de chaque pointage (formaté seulement si le niveau DEBUG est actif)"""
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        for att in attendances:
+            # Arguments à la %: le message n'est assemblé que dans le thread d'écriture du logging
+            self.logger.debug("👤 User: %s | Time: %s | Status: %s | Punch: %s",
+                              att.user_id, att.time_text, att.status, att.punch)
+    
+    def get_attendance_since(self, since_date: datetime) -> List[AttendanceRecord]:
         """Récupérer les pointages depuis une date spécifique"""
         all_attendances = self.get_attendance()
         if not since_date:
             return all_attendances
         
-        filtered_attendances = []
-        for att in all_attendances:
-            att_timestamp = datetime.strptime(att['timestamp'], '%Y-%m-%d %H:%M:%S')
-            if att_timestamp >= since_date:
-                filtered_attendances.append(att)
+        since = to_epoch(since_date)
+        filtered_attendances = [att for att in all_attendances if att.timestamp >= since]
         
         self.logger.info(f"📅 {len(filtered_attendances)} pointages depuis {since_date}")
         return filtered_attendances
     
-    def get_attendance_by_date(self, start_date: datetime, end_date: datetime = None) -> List[Dict[str, Any]]:
+    def get_attendance_by_date(self, start_date: datetime, end_date: datetime = None) -> List[AttendanceRecord]:
         """Récupérer les pointages entre deux dates"""
         if end_date is None:
             end_date = datetime.now()
             
         all_attendances = self.get_attendance()
-        filtered_attendances = []
-        
-        for att in all_attendances:
-            att_timestamp = datetime.strptime(att['timestamp'], '%Y-%m-%d %H:%M:%S')
-            if start_date <= att_timestamp <= end_date:
-                filtered_attendances.append(att)
+        start, end = to_epoch(start_date), to_epoch(end_date)
+        filtered_attendances = [att for att in all_attendances if start <= att.timestamp <= end]
         
         self.logger.info(f"📅 {len(filtered_attendances)} pointages entre {start_date} et {end_date}")
         return filtered_attendances
     
     def test_connection(self) -> bool:
-        """Tester la connexion au device"""
+        """Tester la connexion au device (un aller-retour réel: read_sizes)"""
         try:
-            if self.connect():
-                return True
-            return False
+            return bool(self._run(lambda conn: conn.read_sizes(), check_health=False, retry=True))
         except Exception as e:
             self.logger.error(f"❌ Test connexion échoué: {e}")
-            return False
-        finally:
-            self.disconnect()
\ No newline at end of file
+            return False
\ No newline at end of file
@@ -2,7 +2,7 @@ from zk import ZK
 from datetime import datetime
 from typing import List, Dict, Any, Tuple
 import logging
-import socket
+from discovery import discover
 
 class ZKTecoClient:
     def __init__(self, ip: str, port: int = None, timeout: int = 10):
@@ -17,22 +17,15 @@ class ZKTecoClient:
         self.common_ports = [4370, 80, 8080, 5000, 3000, 22]
     
     def detect_port(self) -> int:
-        """Détecter automatiquement le port du device"""
+        """Détecter automatiquement le port du device (tous les ports sondés en même temps)"""
         self.logger.info(f"🔍 Détection automatique du port pour {self.ip}...")
         
-        for port in self.common_ports:
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(2)
-                result = sock.connect_ex((self.ip, port))
-                sock.close()
-                
-                if result == 0:
-                    self.logger.info(f"✅ Port {port} détecté comme ouvert")
-                    return port
-                    
-            except Exception:
-                continue
+        # Poignée de main ZKTeco sur chaque port: un port ouvert par un autre service est écarté
+        devices = discover(f"{self.ip}/32", self.common_ports, timeout=2, udp=False)
+        if devices:
+            port = min(devices, key=lambda d: self.common_ports.index(d.port)).port
+            self.logger.info(f"✅ Port {port} détecté (terminal ZKTeco)")
+            return port
         
         self.logger.warning("❌ Aucun port standard détecté, utilisation du port 4370 par défaut")
         return 4370
@@ -97,44 +90,48 @@ class ZKTecoClient:
             return {}
         
         try:
-            info = {}
-            
-            # Informations de base
-            info['ip_address'] = self.ip
-            info['port'] = self.port
-            info['connected'] = True
-            
-            # Informations spécifiques au device
-            try:
-                info['device_name'] = self.conn.get_device_name()
-            except:
-                info['device_name'] = 'N/A'
-            
-            try:
-                info['firmware_version'] = self.conn.get_firmware_version()
-            except:
-                info['firmware_version'] = 'N/A'
-            
-            try:
-                users = self.conn.get_users()
-                info['users_count'] = len(users)
-            except:
-                info['users_count'] = 'N/A'
-            
-            try:
-                attendances = self.conn.get_attendance()
-                info['attendances_count'] = len(attendances)
-            except:
-                info['attendances_count'] = 'N/A'
-            
-            return info
-            
+            return self._read_device_info()
         except Exception as e:
             self.logger.error(f"❌ Erreur récupération info device: {e}")
             return {}
         finally:
             self.disconnect()
     
+    def _read_device_info(self) -> Dict[str, Any]:
+        """Informations du device sur la connexion ouverte (compteurs de read_sizes: aucune table téléchargée)"""
+        info = {}
+        
+        # Informations de base
+        info['ip_address'] = self.ip
+        info['port'] = self.port
+        info['connected'] = True
+        
+        # Informations spécifiques au device
+        try:
+            info['device_name'] = self.conn.get_device_name()
+        except:
+            info['device_name'] = 'N/A'
+        
+        try:
+            info['firmware_version'] = self.conn.get_firmware_version()
+        except:
+            info['firmware_version'] = 'N/A'
+        
+        try:
+            info['serial_number'] = self.conn.get_serialnumber()
+        except:
+            info['serial_number'] = 'N/A'
+        
+        try:
+            self.conn.read_sizes()
+            info['users_count'] = self.conn.users
+            info['attendances_count'] = self.conn.records
+            info['attendances_capacity'] = self.conn.rec_cap
+        except:
+            info['users_count'] = info['attendances_count'] = 'N/A'
+        
+        return info
+    
     def get_attendance(self, port: int = None) -> List[Dict[str, Any]]:
         """Récupérer les pointages depuis le device"""
         if not self.connect(port):
@@ -159,11 +156,8 @@ class ZKTecoClient:
                 
                 # Log détaillé pour les premiers pointages
                 if len(formatted_attendances) <= 3:
-                    self.logger.debug(
-                        f"👤 User: {att.user_id} | "
-                        f"Time: {att.timestamp.strftime('%Y-%m-%d %H:%M:%S')} | "
-                        f"Status: {att.status}"
-                    )
+                    self.logger.debug("👤 User: %s | Time: %s | Status: %s",
+                                      att.user_id, attendance_data['timestamp'], att.status)
             
             return formatted_attendances
             
@@ -202,7 +196,11 @@ class ZKTecoClient:
             if self.connect(port):
                 result['success'] = True
                 result['port'] = self.port  # Port réel utilisé
-                result['device_info'] = self.get_device_info()
+                try:
+                    # Même connexion que le test: pas de seconde poignée de main
+                    result['device_info'] = self._read_device_info()
+                finally:
+                    self.disconnect()
             else:
                 result['error'] = "Connexion impossible"
                 
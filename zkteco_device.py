@@ -0,0 +1,933 @@
+import calendar
+import struct
+import threading
+import time
+import zlib
+import logging
+from socket import timeout as SocketTimeout
+from struct import pack, unpack
+from datetime import datetime
+from functools import lru_cache
+from itertools import chain
+from typing import Callable, Iterable, Iterator, List, Tuple, Optional
+
+from zk import ZK, const
+from zk.attendance import Attendance
+from zk.exception import ZKErrorResponse, ZKNetworkError
+from zk.user import User
+
+from metrics import METRICS
+
+
+class AttendanceCursor:
+    """
+    Position de lecture dans l'ATTLOG d'un device (index d'enregistrement et offset octet).
+
+    checksum est le CRC32 de tous les enregistrements bruts lus jusqu'à offset
+    (None si la lecture n'a pas commencé par une lecture complète), last_record celui du
+    dernier enregistrement lu: relu avec la suite du log, il vérifie que le log n'a pas été remplacé.
+    """
+
+    def __init__(self, records: int = 0, offset: int = 0, record_size: int = 0, checksum: Optional[int] = 0,
+                 last_record: Optional[int] = None):
+        self.records = records
+        self.offset = offset
+        self.record_size = record_size
+        self.checksum = checksum
+        self.last_record = last_record
+
+    def to_dict(self) -> dict:
+        return {'records': self.records, 'offset': self.offset, 'record_size': self.record_size,
+                'checksum': self.checksum, 'last_record': self.last_record}
+
+    @staticmethod
+    def from_dict(data: dict) -> 'AttendanceCursor':
+        return AttendanceCursor(data.get('records', 0), data.get('offset', 0), data.get('record_size', 0),
+                                data.get('checksum'), data.get('last_record'))
+
+    def __repr__(self):
+        return (f"<AttendanceCursor records={self.records} offset={self.offset} record_size={self.record_size} "
+                f"checksum={self.checksum} last_record={self.last_record}>")
+
+
+# Formats des enregistrements ATTLOG et utilisateurs (équivalents aux formats de zk.base.ZK)
+ATTLOG_FORMATS = {
+    8: struct.Struct('<HBIB'),          # uid, status, timestamp, punch
+    16: struct.Struct('<IIBB2xI'),      # user_id, timestamp, status, punch, workcode
+    40: struct.Struct('<H24sBIB8x'),    # uid, user_id, status, timestamp, punch
+}
+USER_FORMATS = {
+    28: struct.Struct('<HB5s8sIxBhI'),  # uid, privilege, password, name, card, group_id, timezone, user_id
+    72: struct.Struct('<HB8s24sIx7sx24s'),  # uid, privilege, password, name, card, group_id, user_id
+}
+
+
+class UserIndex:
+    """Table utilisateurs d'un device indexée par uid et par user_id"""
+
+    def __init__(self, users: List[User], fingerprint: tuple = None):
+        self.users = users
+        self.fingerprint = fingerprint
+        self.loaded_at = time.monotonic()
+        self.by_uid = {}
+        self.by_user_id = {}
+        # Premier utilisateur trouvé, comme list(filter(...))[0] dans zk.base
+        for user in users:
+            self.by_uid.setdefault(user.uid, user)
+            self.by_user_id.setdefault(user.user_id, user)
+
+    def is_stale(self, fingerprint: tuple, ttl: float) -> bool:
+        return self.fingerprint != fingerprint or time.monotonic() - self.loaded_at > ttl
+
+    def __len__(self):
+        return len(self.users)
+
+
+# Cache des tables utilisateurs entre deux polls, par adresse de device
+_user_indexes = {}
+_user_indexes_lock = threading.Lock()
+
+# En-tête du buffer ATTLOG: taille totale (uint32)
+ATTLOG_HEADER_SIZE = 4
+
+
+def cached_user_index(address: tuple, fingerprint: tuple, ttl: float) -> Optional[UserIndex]:
+    """Table utilisateurs en cache pour ce device, si elle est toujours valide"""
+    with _user_indexes_lock:
+        index = _user_indexes.get(address)
+    if index is None or index.is_stale(fingerprint, ttl):
+        return None
+    return index
+
+
+def store_user_index(address: tuple, index: UserIndex):
+    with _user_indexes_lock:
+        _user_indexes[address] = index
+
+
+# Dernière sonde de santé par adresse de device: (time.monotonic(), état)
+_health = {}
+_health_lock = threading.Lock()
+
+
+def cached_health(address: tuple, ttl: float) -> Optional[dict]:
+    """État du device lu il y a moins de ttl secondes (None sinon)"""
+    with _health_lock:
+        entry = _health.get(address)
+    if entry is None or time.monotonic() - entry[0] > ttl:
+        return None
+    return dict(entry[1])
+
+
+def store_health(address: tuple, health: dict):
+    with _health_lock:
+        _health[address] = (time.monotonic(), dict(health))
+
+
+def decode_time(t: int) -> datetime:
+    """Décoder un horodatage ZKTeco (copié de zkemsdk.c - DecodeTime)"""
+    second = t % 60
+    t = t // 60
+    minute = t % 60
+    t = t // 60
+    hour = t % 24
+    t = t // 24
+    day = t % 31 + 1
+    t = t // 31
+    month = t % 12 + 1
+    t = t // 12
+    return datetime(t + 2000, month, day, hour, minute, second)
+
+
+def decode_times(values) -> List[datetime]:
+    """Décoder une série d'horodatages ZKTeco en une passe (date calculée une fois par jour)"""
+    days = {}
+    result = []
+    append = result.append
+    for t in values:
+        day_index, seconds = divmod(t, 86400)
+        date = days.get(day_index)
+        if date is None:
+            months, day = divmod(day_index, 31)
+            years, month = divmod(months, 12)
+            date = days[day_index] = (years + 2000, month + 1, day + 1)
+        hour, seconds = divmod(seconds, 3600)
+        minute, second = divmod(seconds, 60)
+        append(datetime(date[0], date[1], date[2], hour, minute, second))
+    return result
+
+
+@lru_cache(maxsize=4096)
+def _day_text(day: int) -> str:
+    return datetime.utcfromtimestamp(day * 86400).strftime('%Y-%m-%d')
+
+
+def format_date(timestamp: int) -> str:
+    """Date ('%Y-%m-%d') d'un horodatage epoch"""
+    return _day_text(timestamp // 86400)
+
+
+def format_timestamp(timestamp: int) -> str:
+    """Horodatage epoch (heure locale du device) au format de l'API: '%Y-%m-%d %H:%M:%S'"""
+    day, seconds = divmod(timestamp, 86400)
+    hour, seconds = divmod(seconds, 3600)
+    minute, second = divmod(seconds, 60)
+    return f"{_day_text(day)} {hour:02d}:{minute:02d}:{second:02d}"
+
+
+def parse_timestamp(text: str) -> int:
+    """Inverse de format_timestamp (sans strptime)"""
+    return calendar.timegm((int(text[0:4]), int(text[5:7]), int(text[8:10]), int(text[11:13]), int(text[14:16]), int(text[17:19])))
+
+
+def to_epoch(value: datetime) -> int:
+    """datetime naïf (heure locale du device) vers l'epoch utilisé par AttendanceRecord"""
+    return calendar.timegm(value.timetuple())
+
+
+class AttendanceRecord:
+    """
+    Pointage compact: identifiant utilisateur, horodatage epoch entier, statut et type.
+
+    L'epoch représente l'heure affichée par le device, sans fuseau (comparaisons et tris en entiers).
+    Le format JSON de l'API n'est produit qu'à la sérialisation (to_dict).
+    """
+
+    __slots__ = ('user_id', 'timestamp', 'status', 'punch')
+
+    def __init__(self, user_id: str, timestamp: int, status: int = 0, punch: int = 0):
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.status = status
+        self.punch = punch
+
+    @staticmethod
+    def from_attendance(att: Attendance) -> 'AttendanceRecord':
+        return AttendanceRecord(
+            str(att.user_id), to_epoch(att.timestamp),
+            int(att.status) if att.status is not None else 0,
+            int(att.punch) if att.punch is not None else 0
+        )
+
+    @staticmethod
+    def from_dict(data: dict) -> 'AttendanceRecord':
+        return AttendanceRecord(str(data['uid']), parse_timestamp(data['timestamp']), int(data.get('state', 0)), int(data.get('type', 0)))
+
+    @property
+    def time_text(self) -> str:
+        return format_timestamp(self.timestamp)
+
+    @property
+    def datetime(self) -> datetime:
+        return datetime.utcfromtimestamp(self.timestamp)
+
+    def to_dict(self) -> dict:
+        """Format SIMPLIFIÉ d'un pointage pour l'API Laravel"""
+        return {
+            'uid': self.user_id,
+            'id': int(self.user_id),
+            'state': self.status,
+            'timestamp': format_timestamp(self.timestamp),
+            'type': self.punch
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, AttendanceRecord) and (
+            self.user_id, self.timestamp, self.status, self.punch) == (other.user_id, other.timestamp, other.status, other.punch)
+
+    def __hash__(self):
+        return hash((self.user_id, self.timestamp, self.status, self.punch))
+
+    def __repr__(self):
+        return f"<AttendanceRecord {self.user_id} {format_timestamp(self.timestamp)} status={self.status} punch={self.punch}>"
+
+
+def serialize_records(records) -> List[dict]:
+    """Lot de pointages au format JSON de l'API (les dictionnaires déjà formatés sont repris tels quels)"""
+    return [record.to_dict() if isinstance(record, AttendanceRecord) else record for record in records]
+
+
+def decode_epochs(values) -> List[int]:
+    """Décoder une série d'horodatages ZKTeco en epochs (date calculée une fois par jour, sans datetime)"""
+    days = {}
+    result = []
+    append = result.append
+    for t in values:
+        day_index, seconds = divmod(t, 86400)
+        base = days.get(day_index)
+        if base is None:
+            months, day = divmod(day_index, 31)
+            years, month = divmod(months, 12)
+            base = days[day_index] = calendar.timegm((years + 2000, month + 1, day + 1, 0, 0, 0))
+        append(base + seconds)
+    return result
+
+
+def _iter_records(data, record_format: struct.Struct):
+    """Itérer sur les enregistrements complets d'un buffer sans copie"""
+    view = memoryview(data)
+    return record_format.iter_unpack(view[:len(view) - len(view) % record_format.size])
+
+
+def decode_attendance_records(data, record_size: int, users: UserIndex) -> List[Attendance]:
+    """Décoder des enregistrements ATTLOG bruts (même résultat que ZK.get_attendance)"""
+    if record_size not in ATTLOG_FORMATS:
+        record_size = 40
+    rows = list(_iter_records(data, ATTLOG_FORMATS[record_size]))
+    if record_size == 8:
+        by_uid = users.by_uid
+        timestamps = decode_times([row[2] for row in rows])
+        attendances = []
+        for (uid, status, _t, punch), timestamp in zip(rows, timestamps):
+            user = by_uid.get(uid)
+            attendances.append(Attendance(user.user_id if user else str(uid), timestamp, status, punch, uid))
+        return attendances
+    if record_size == 16:
+        by_user_id = users.by_user_id
+        timestamps = decode_times([row[1] for row in rows])
+        attendances = []
+        for (user_id, _t, status, punch, _workcode), timestamp in zip(rows, timestamps):
+            user_id = str(user_id)
+            user = by_user_id.get(user_id)
+            attendances.append(Attendance(user_id, timestamp, status, punch, user.uid if user else user_id))
+        return attendances
+    timestamps = decode_times([row[3] for row in rows])
+    return [
+        Attendance(user_id.split(b'\x00')[0].decode(errors='ignore'), timestamp, status, punch, uid)
+        for (uid, user_id, status, _t, punch), timestamp in zip(rows, timestamps)
+    ]
+
+
+def decode_records(data, record_size: int, users: UserIndex) -> List[AttendanceRecord]:
+    """Décoder des enregistrements ATTLOG bruts en AttendanceRecord (mêmes valeurs que decode_attendance_records)"""
+    if record_size not in ATTLOG_FORMATS:
+        record_size = 40
+    rows = list(_iter_records(data, ATTLOG_FORMATS[record_size]))
+    if record_size == 8:
+        by_uid = users.by_uid
+        timestamps = decode_epochs([row[2] for row in rows])
+        records = []
+        for (uid, status, _t, punch), timestamp in zip(rows, timestamps):
+            user = by_uid.get(uid)
+            records.append(AttendanceRecord(user.user_id if user else str(uid), timestamp, status, punch))
+        return records
+    if record_size == 16:
+        timestamps = decode_epochs([row[1] for row in rows])
+        return [
+            AttendanceRecord(str(user_id), timestamp, status, punch)
+            for (user_id, _t, status, punch, _workcode), timestamp in zip(rows, timestamps)
+        ]
+    timestamps = decode_epochs([row[3] for row in rows])
+    return [
+        AttendanceRecord(user_id.split(b'\x00')[0].decode(errors='ignore'), timestamp, status, punch)
+        for (_uid, user_id, status, _t, punch), timestamp in zip(rows, timestamps)
+    ]
+
+
+def decode_user_records(data, packet_size: int, encoding: str = 'UTF-8') -> List[User]:
+    """Décoder la table utilisateurs brute (même résultat que ZK.get_users)"""
+    users = []
+    if packet_size == 28:
+        for uid, privilege, password, name, card, group_id, _timezone, user_id in _iter_records(data, USER_FORMATS[28]):
+            password = password.split(b'\x00')[0].decode(encoding, errors='ignore')
+            name = name.split(b'\x00')[0].decode(encoding, errors='ignore').strip()
+            user_id = str(user_id)
+            users.append(User(uid, name or "NN-%s" % user_id, privilege, password, str(group_id), user_id, card))
+    else:
+        for uid, privilege, password, name, card, group_id, user_id in _iter_records(data, USER_FORMATS[72]):
+            password = password.split(b'\x00')[0].decode(encoding, errors='ignore')
+            name = name.split(b'\x00')[0].decode(encoding, errors='ignore').strip()
+            group_id = group_id.split(b'\x00')[0].decode(encoding, errors='ignore').strip()
+            user_id = user_id.split(b'\x00')[0].decode(encoding, errors='ignore')
+            users.append(User(uid, name or "NN-%s" % user_id, privilege, password, group_id, user_id, card))
+    return users
+
+
+def last_record_fingerprint(data, record_size: int) -> Optional[int]:
+    """CRC32 du dernier enregistrement d'un bloc ATTLOG (None si le bloc est vide)"""
+    if len(data) < record_size or not record_size:
+        return None
+    return zlib.crc32(memoryview(data)[len(data) - record_size:])
+
+
+def verify_start(cursor: Optional[AttendanceCursor]) -> Optional[int]:
+    """
+    Offset de relecture incluant le dernier enregistrement déjà lu (vérifié par son empreinte),
+    ou None si le curseur n'a pas d'empreinte.
+    """
+    if cursor is None or cursor.last_record is None or cursor.offset - cursor.record_size < ATTLOG_HEADER_SIZE:
+        return None
+    return cursor.offset - cursor.record_size
+
+
+def decode_attlog_tail(data, size: int, cursor: AttendanceCursor, users: UserIndex,
+                       decode: Callable = decode_attendance_records) -> Optional[Tuple[list, AttendanceCursor]]:
+    """
+    Décoder la fin d'un ATTLOG lue à partir de cursor.offset.
+
+    :return: (pointages, nouveau curseur), ou None si la taille du buffer ne correspond plus au curseur
+    """
+    body_size = size - ATTLOG_HEADER_SIZE
+    if size < cursor.offset or body_size % cursor.record_size:
+        return None
+    # Des pointages ont pu arriver entre read_sizes et la préparation du buffer
+    attendances = decode(data, cursor.record_size, users)
+    body = memoryview(data)[:size - cursor.offset]
+    checksum = None if cursor.checksum is None else zlib.crc32(body, cursor.checksum)
+    last_record = last_record_fingerprint(body, cursor.record_size)
+    return attendances, AttendanceCursor(body_size // cursor.record_size, size, cursor.record_size, checksum,
+                                         cursor.last_record if last_record is None else last_record)
+
+
+def decode_attlog_full(data, records: int, users: UserIndex,
+                       decode: Callable = decode_attendance_records) -> Tuple[list, AttendanceCursor]:
+    """Décoder un buffer ATTLOG complet (en-tête de taille inclus)"""
+    if len(data) < ATTLOG_HEADER_SIZE or not records:
+        return [], AttendanceCursor()
+    total_size = unpack('I', data[:4])[0]
+    record_size = total_size // records
+    body = memoryview(data)[ATTLOG_HEADER_SIZE:ATTLOG_HEADER_SIZE + total_size]
+    attendances = decode(body, record_size, users)
+    return attendances, AttendanceCursor(total_size // record_size, ATTLOG_HEADER_SIZE + total_size, record_size,
+                                         zlib.crc32(body), last_record_fingerprint(body, record_size))
+
+
+def iter_attlog_batches(chunks: Iterable[bytes], limit: int, cursor: AttendanceCursor, users: UserIndex,
+                        batch_size: int, decode: Callable = decode_records,
+                        on_buffer: Callable[[bytes, int, int], None] = None,
+                        header: bytes = b'') -> Iterator[Tuple[list, AttendanceCursor]]:
+    """
+    Décoder des enregistrements ATTLOG au fil des blocs reçus, par lots d'au plus batch_size.
+
+    :param chunks: blocs bruts lus à partir de cursor.offset (seuls les limit premiers octets sont utilisés)
+    :param on_buffer: reçoit les octets de chaque lot, leur offset de début et la taille d'un enregistrement
+    :param header: en-tête de taille d'une lecture complète, passé à on_buffer avec le premier lot (offset 0)
+    :return: itérateur de (pointages du lot, curseur après le lot); chaque curseur est un point de reprise
+    """
+    record_size = cursor.record_size
+    step = max(1, batch_size) * record_size
+    records, offset, checksum = cursor.records, cursor.offset, cursor.checksum
+    pending = bytearray()
+    chunks = iter(chunks)
+    exhausted = False
+    while not exhausted:
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+        elif limit > 0:
+            pending += chunk[:limit]
+            limit -= len(chunk)
+        while len(pending) >= step or (exhausted and len(pending) >= record_size):
+            size = min(len(pending), step)
+            size -= size % record_size
+            data = bytes(pending[:size])
+            del pending[:size]
+            if on_buffer and header:
+                on_buffer(header + data, 0, record_size)
+            elif on_buffer:
+                on_buffer(data, offset, record_size)
+            header = b''
+            checksum = None if checksum is None else zlib.crc32(data, checksum)
+            records += size // record_size
+            offset += size
+            yield decode(data, record_size, users), AttendanceCursor(records, offset, record_size, checksum,
+                                                                     last_record_fingerprint(data, record_size))
+
+
+def _take(chunks: Iterable[bytes], size: int) -> Tuple[bytes, Iterator[bytes]]:
+    """Les size premiers octets d'une suite de blocs, et la suite des blocs après eux"""
+    chunks = iter(chunks)
+    head = b''
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= size:
+            break
+    return head[:size], chain([head[size:]], chunks)
+
+
+def _at_least_one(batches: Iterator[Tuple[list, AttendanceCursor]], cursor: AttendanceCursor,
+                  full_read: bool) -> Iterator[Tuple[list, AttendanceCursor, bool]]:
+    produced = False
+    for batch, new_cursor in batches:
+        produced = True
+        yield batch, new_cursor, full_read
+    if not produced:
+        yield [], cursor, full_read
+
+
+def attlog_checksum(data) -> Tuple[int, int]:
+    """Taille des enregistrements et CRC32 d'un buffer ATTLOG complet (en-tête de taille inclus)"""
+    if len(data) < ATTLOG_HEADER_SIZE:
+        return 0, 0
+    total_size = unpack('I', data[:4])[0]
+    return total_size, zlib.crc32(memoryview(data)[ATTLOG_HEADER_SIZE:ATTLOG_HEADER_SIZE + total_size])
+
+
+def decode_live_events(data: bytes, users: UserIndex) -> List[Attendance]:
+    """Décoder les pointages d'un paquet CMD_REG_EVENT (formats 12, 32, 36 et 52 octets)"""
+    attendances = []
+    while len(data) >= 12:
+        if len(data) == 12:
+            user_id, status, punch, timehex = unpack('<IBB6s', data)
+            data = data[12:]
+        elif len(data) == 32:
+            user_id, status, punch, timehex = unpack('<24sBB6s', data[:32])
+            data = data[32:]
+        elif len(data) == 36:
+            user_id, status, punch, timehex, _other = unpack('<24sBB6s4s', data[:36])
+            data = data[36:]
+        elif len(data) >= 52:
+            user_id, status, punch, timehex, _other = unpack('<24sBB6s20s', data[:52])
+            data = data[52:]
+        else:
+            break
+        if isinstance(user_id, int):
+            user_id = str(user_id)
+        else:
+            user_id = (user_id.split(b'\x00')[0]).decode(errors='ignore')
+        year, month, day, hour, minute, second = unpack('6B', timehex)
+        timestamp = datetime(year + 2000, month, day, hour, minute, second)
+        user = users.by_user_id.get(user_id)
+        uid = user.uid if user else int(user_id)
+        attendances.append(Attendance(user_id, timestamp, status, punch, uid))
+    return attendances
+
+
+def split_tcp_packets(buffer: bytes) -> Tuple[List[bytes], bytes]:
+    """
+    Découper un flux TCP en paquets complets (sans l'en-tête 0x5050/0x7282).
+
+    :return: (paquets complets, octets restants d'un paquet incomplet)
+    """
+    packets = []
+    while len(buffer) >= 8:
+        magic1, magic2, length = unpack('<HHI', buffer[:8])
+        if magic1 != const.MACHINE_PREPARE_DATA_1 or magic2 != const.MACHINE_PREPARE_DATA_2:
+            raise ZKNetworkError("TCP packet invalid")
+        if len(buffer) < 8 + length:
+            break
+        packets.append(buffer[8:8 + length])
+        buffer = buffer[8 + length:]
+    return packets, buffer
+
+
+class RotationUnverified(Exception):
+    """L'ATTLOG a été effacé (ou a pu l'être) mais l'effacement n'a pas pu être vérifié"""
+
+
+class ZKDevice(ZK):
+    """Extension de zk.ZK avec lecture incrémentale de l'ATTLOG et cache des utilisateurs"""
+
+    ATTLOG_HEADER_SIZE = ATTLOG_HEADER_SIZE
+    # Durée maximale de validité de la table utilisateurs en cache (secondes)
+    USER_CACHE_TTL = 3600
+    # Nombre de pointages par lot décodé pendant le transfert de l'ATTLOG
+    BATCH_SIZE = 2000
+
+    def __init__(self, *args, metrics_label: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Étiquette device des métriques: l'adresse configurée, stable si le device change d'adresse
+        self.metrics_label = metrics_label or f"{self.helper.ip}:{self.helper.port}"
+        self.identity: Optional[Tuple[str, str]] = None  # (firmware, numéro de série), lus une fois par connexion
+        self.logger = logging.getLogger(__name__)
+        self.pending_events: List[bytes] = []  # Événements reçus pendant l'attente d'une réponse
+
+    def _ZK__send_command(self, command, command_string=b'', response_size=8):
+        """
+        Envoi d'une commande (ZK.__send_command) en mettant de côté les événements temps réel
+        que le device intercale avant la réponse.
+        """
+        result = ZK._ZK__send_command(self, command, command_string, response_size)
+        if self._ZK__response != const.CMD_REG_EVENT:
+            return result
+        try:
+            if self.tcp:
+                self._skip_tcp_events(response_size)
+            else:
+                while self._ZK__response == const.CMD_REG_EVENT:
+                    self.pending_events.append(self._ZK__data)
+                    self._ZK__ack_ok()
+                    # Taille minimale d'un datagramme d'événement: un recv plus court le tronquerait
+                    self._set_response(self._ZK__sock.recv(max(response_size, 1032)))
+        except OSError as e:
+            raise ZKNetworkError(str(e))
+        code = self._ZK__response
+        return {'status': code in (const.CMD_ACK_OK, const.CMD_PREPARE_DATA, const.CMD_DATA), 'code': code}
+
+    def connect(self):
+        with METRICS.phase('connect', self.metrics_label):
+            return super().connect()
+
+    def read_sizes(self):
+        with METRICS.phase('read_sizes', self.metrics_label):
+            return super().read_sizes()
+
+    def read_health(self) -> dict:
+        """
+        Sonde légère: occupation mémoire (read_sizes, un seul aller-retour), firmware et numéro de série.
+
+        Firmware et numéro de série ne sont lus qu'à la première sonde de la connexion; aucune table
+        (utilisateurs, ATTLOG) n'est téléchargée.
+        """
+        if self.identity is None:
+            self.identity = (self.get_firmware_version(), self.get_serialnumber())
+        started = time.perf_counter()
+        self.read_sizes()
+        return {
+            'serial': self.identity[1],
+            'firmware': self.identity[0],
+            'users': self.users,
+            'users_cap': self.users_cap,
+            'records': self.records,
+            'records_cap': self.rec_cap,
+            'records_free': self.rec_av,
+            'fingers': self.fingers,
+            'fingers_cap': self.fingers_cap,
+            'faces': self.faces,
+            'faces_cap': self.faces_cap,
+            'cards': self.cards,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'checked_at': datetime.now().isoformat(timespec='seconds'),
+        }
+
+    def reg_event(self, flags):
+        """Abonnement aux événements (ZK.reg_event), avec un tampon de réception qui ne tronque pas un événement UDP"""
+        cmd_response = self._ZK__send_command(const.CMD_REG_EVENT, pack("I", flags), 1032)
+        if not cmd_response.get('status'):
+            raise ZKErrorResponse("cant' reg events %i" % flags)
+
+    def _set_response(self, packet: bytes):
+        """Mettre à jour l'état de ZK à partir d'un paquet de réponse (sans en-tête TCP)"""
+        self._ZK__data_recv = packet
+        self._ZK__header = unpack('<4H', packet[:8])
+        self._ZK__response = self._ZK__header[0]
+        self._ZK__reply_id = self._ZK__header[3]
+        self._ZK__data = packet[8:]
+
+    def _recv_exact(self, buffer: bytes, size: int) -> bytes:
+        while len(buffer) < size:
+            data = self._ZK__sock.recv(max(size - len(buffer), 1024))
+            if not data:
+                raise ZKNetworkError("connection closed")
+            buffer += data
+        return buffer
+
+    def _skip_tcp_events(self, response_size: int):
+        """Acquitter et mettre de côté les paquets CMD_REG_EVENT jusqu'au paquet de réponse"""
+        buffer = self._ZK__tcp_data_recv
+        while True:
+            buffer = self._recv_exact(buffer, 16)
+            length = self._ZK__test_tcp_top(buffer)
+            if not length:
+                raise ZKNetworkError("TCP packet invalid")
+            if unpack('<H', buffer[8:10])[0] != const.CMD_REG_EVENT:
+                break
+            buffer = self._recv_exact(buffer, 8 + length)
+            self.pending_events.append(buffer[16:8 + length])
+            self._ZK__ack_ok()
+            buffer = buffer[8 + length:]
+        # Le reste éventuel du paquet de réponse (CMD_DATA) est lu par ZK via __tcp_length
+        trailing = buffer[8 + length:]
+        self._ZK__tcp_data_recv = buffer[:8 + length]
+        self._ZK__tcp_length = length
+        self._set_response(buffer[8:8 + length])
+        while trailing:
+            # Événements reçus à la suite de la réponse: les lire en entier pour ne pas décaler le flux
+            trailing = self._recv_exact(trailing, 8)
+            size = unpack('<HHI', trailing[:8])[2]
+            trailing = self._recv_exact(trailing, 8 + size)
+            if unpack('<H', trailing[8:10])[0] == const.CMD_REG_EVENT:
+                self.pending_events.append(trailing[16:8 + size])
+                self._ZK__ack_ok()
+            trailing = trailing[8 + size:]
+
+    def read_buffer_from(self, command: int, start: int = 0, fct: int = 0, ext: int = 0) -> Tuple[bytes, int]:
+        """
+        Préparer un buffer côté device (1503) et ne transférer que les octets à partir de start (1504).
+
+        :return: (données lues depuis start, taille totale du buffer)
+        """
+        size, chunks = self.iter_buffer_from(command, start, fct, ext)
+        return b''.join(chunks), size
+
+    def iter_buffer_from(self, command: int, start: int = 0, fct: int = 0, ext: int = 0) -> Tuple[int, Iterator[bytes]]:
+        """
+        Préparer un buffer côté device (1503) sans le transférer.
+
+        :return: (taille totale du buffer, itérateur sur ses blocs à partir de start, lus (1504) à la demande)
+        """
+        if self.tcp:
+            max_chunk = 0xFFc0
+        else:
+            max_chunk = 16 * 1024
+        command_string = pack('<bhii', 1, command, fct, ext)
+        with METRICS.phase('prepare_buffer', self.metrics_label):
+            cmd_response = self._ZK__send_command(1503, command_string, 1024)
+        if not cmd_response.get('status'):
+            raise ZKErrorResponse("RWB Not supported")
+        if cmd_response['code'] == const.CMD_DATA:
+            # Petit buffer renvoyé directement dans la réponse
+            data = self._ZK__data
+            if self.tcp and len(data) < (self._ZK__tcp_length - 8):
+                data = b''.join([data, self._ZK__recieve_raw_data((self._ZK__tcp_length - 8) - len(data))])
+            METRICS.inc('zkteco_bytes_read_total', len(data), device=self.metrics_label)
+            return len(data), iter([data[start:]])
+        size = unpack('I', self._ZK__data[1:5])[0]
+        return size, self._iter_chunks(start, size, max_chunk)
+
+    def _iter_chunks(self, position: int, size: int, max_chunk: int) -> Iterator[bytes]:
+        while position < size:
+            chunk_size = min(max_chunk, size - position)
+            with METRICS.phase('read_chunk', self.metrics_label):
+                chunk = self._ZK__read_chunk(position, chunk_size)
+            METRICS.inc('zkteco_bytes_read_total', len(chunk), device=self.metrics_label)
+            yield chunk
+            position += chunk_size
+        self.free_data()
+
+    def decode_attendance(self, data, record_size: int, users: UserIndex) -> List[Attendance]:
+        """Décoder des enregistrements ATTLOG bruts"""
+        return decode_attendance_records(data, record_size, users)
+
+    def get_user_index(self, refresh_sizes: bool = True) -> UserIndex:
+        """
+        Table utilisateurs indexée, conservée entre les polls.
+
+        Retéléchargée uniquement si l'empreinte read_sizes (utilisateurs, empreintes,
+        cartes, visages) a changé ou si le cache a dépassé USER_CACHE_TTL.
+        """
+        if refresh_sizes:
+            self.read_sizes()
+        fingerprint = (self.users, self.users_av, self.fingers, self.cards, self.faces)
+        index = cached_user_index(self.helper.address, fingerprint, self.USER_CACHE_TTL)
+        if index is None:
+            with METRICS.phase('read_users', self.metrics_label):
+                index = UserIndex(self.get_users(), fingerprint)
+            store_user_index(self.helper.address, index)
+        return index
+
+    def get_users(self) -> List[User]:
+        """Liste des utilisateurs (décodage par lot, sans recopie du buffer)"""
+        self.read_sizes()
+        if self.users == 0:
+            self.next_uid = 1
+            self.next_user_id = '1'
+            return []
+        userdata, size = self.read_with_buffer(const.CMD_USERTEMP_RRQ, const.FCT_USER)
+        if size <= 4:
+            return []
+        total_size = unpack('I', userdata[:4])[0]
+        self.user_packet_size = total_size / self.users
+        users = decode_user_records(memoryview(userdata)[4:], 28 if self.user_packet_size == 28 else 72, self.encoding)
+        max_uid = max((u.uid for u in users), default=0) + 1
+        self.next_uid = max_uid
+        user_ids = {u.user_id for u in users}
+        while str(max_uid) in user_ids:
+            max_uid += 1
+        self.next_user_id = str(max_uid)
+        return users
+
+    def get_attendance(self, on_buffer: Callable[[bytes, int, int], None] = None) -> List[Attendance]:
+        """
+        Liste complète des pointages (décodage par lot, sans recopie du buffer).
+
+        :param on_buffer: reçoit le buffer ATTLOG brut, son offset de début et la taille d'un enregistrement (archivage)
+        """
+        self.read_sizes()
+        if self.records == 0:
+            return []
+        users = self.get_user_index(refresh_sizes=False)
+        attendance_data, size = self.read_with_buffer(const.CMD_ATTLOG_RRQ)
+        if size < self.ATTLOG_HEADER_SIZE:
+            return []
+        total_size = unpack('I', attendance_data[:4])[0]
+        if on_buffer:
+            on_buffer(attendance_data, 0, total_size // self.records)
+        return self.decode_attendance(memoryview(attendance_data)[self.ATTLOG_HEADER_SIZE:], total_size // self.records, users)
+
+    def get_attendance_since_cursor(self, cursor: Optional[AttendanceCursor] = None,
+                                    on_buffer: Callable[[bytes, int, int], None] = None,
+                                    decode: Callable = decode_attendance_records) -> Tuple[list, AttendanceCursor, bool]:
+        """
+        Lire uniquement les enregistrements ATTLOG ajoutés depuis le curseur (en une seule liste).
+
+        :param decode: décodeur des enregistrements (Attendance de pyzk par défaut, ou decode_records)
+        :return: (nouveaux pointages, nouveau curseur, lecture complète effectuée)
+        """
+        attendances, new_cursor, full_read = [], cursor, False
+        for batch, new_cursor, full_read in self.iter_attendance_since_cursor(cursor, on_buffer, self.BATCH_SIZE, decode):
+            attendances.extend(batch)
+        return attendances, new_cursor, full_read
+
+    def iter_attendance_since_cursor(self, cursor: Optional[AttendanceCursor] = None,
+                                     on_buffer: Callable[[bytes, int, int], None] = None,
+                                     batch_size: int = None,
+                                     decode: Callable = decode_records) -> Iterator[Tuple[list, AttendanceCursor, bool]]:
+        """
+        Lire les enregistrements ATTLOG ajoutés depuis le curseur, décodés au fil des blocs reçus.
+
+        Relecture complète si aucun curseur n'est connu ou si le nombre d'enregistrements
+        a diminué (log effacé ou tourné). Chaque lot arrive avec le curseur atteint après lui:
+        le premier est disponible avant la fin du transfert et la mémoire utilisée ne dépend
+        pas de la taille du log. Au moins un lot (éventuellement vide) est produit.
+
+        :param on_buffer: reçoit les octets bruts de chaque lot, leur offset de début et la taille d'un enregistrement
+        :param batch_size: nombre maximal de pointages par lot (BATCH_SIZE par défaut)
+        :return: itérateur de (pointages du lot, curseur après le lot, lecture complète)
+        """
+        batch_size = batch_size or self.BATCH_SIZE
+        decode = self._timed_decode(decode)
+        self.read_sizes()
+        records = self.records
+        if records == 0:
+            if cursor is not None and cursor.records == 0:
+                # Device toujours vide: curseur inchangé, le cycle reste à vide (aucune écriture ni envoi)
+                METRICS.inc('zkteco_idle_polls_total', device=self.metrics_label)
+                yield [], cursor, False
+            else:
+                # Premier passage, ou log effacé depuis la dernière lecture
+                yield [], AttendanceCursor(), cursor is not None
+            return
+
+        incremental = cursor is not None and cursor.record_size > 0 and records >= cursor.records
+        if incremental and records == cursor.records:
+            # Cycle à vide: read_sizes a suffi, ni la table utilisateurs ni l'ATTLOG ne sont transférés
+            METRICS.inc('zkteco_idle_polls_total', device=self.metrics_label)
+            yield [], cursor, False
+            return
+
+        users = self.get_user_index(refresh_sizes=False)
+        if incremental:
+            # Le dernier enregistrement déjà lu est relu avec la suite (un enregistrement de plus, même échange)
+            start = verify_start(cursor)
+            size, chunks = self.iter_buffer_from(const.CMD_ATTLOG_RRQ, cursor.offset if start is None else start)
+            consistent = size >= cursor.offset and not (size - ATTLOG_HEADER_SIZE) % cursor.record_size
+            if consistent and start is not None:
+                previous, chunks = _take(chunks, cursor.record_size)
+                if zlib.crc32(previous) != cursor.last_record:
+                    self.logger.warning(f"⚠️ Log du device {self.metrics_label} remplacé depuis la dernière lecture: relecture complète")
+                    consistent = False
+            if consistent:
+                # Des pointages ont pu arriver entre read_sizes et la préparation du buffer: tous sont lus
+                batches = iter_attlog_batches(chunks, size - cursor.offset, cursor, users, batch_size, decode, on_buffer)
+                yield from _at_least_one(batches, cursor, False)
+                return
+            # Taille ou dernier enregistrement incohérents avec le curseur: relecture complète
+            self.free_data()
+
+        size, chunks = self.iter_buffer_from(const.CMD_ATTLOG_RRQ)
+        head = b''
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= ATTLOG_HEADER_SIZE:
+                break
+        total_size = unpack('I', head[:4])[0] if len(head) >= ATTLOG_HEADER_SIZE else 0
+        record_size = total_size // records
+        if not record_size:
+            for _ in chunks:
+                pass
+            yield [], AttendanceCursor(), True
+            return
+        start = AttendanceCursor(0, ATTLOG_HEADER_SIZE, record_size, 0)
+        batches = iter_attlog_batches(chain([head[ATTLOG_HEADER_SIZE:]], chunks), total_size, start, users,
+                                      batch_size, decode, on_buffer, head[:ATTLOG_HEADER_SIZE])
+        yield from _at_least_one(batches, start, True)
+
+    def _timed_decode(self, decode: Callable) -> Callable:
+        def timed(data, record_size: int, users: UserIndex):
+            with METRICS.phase('decode', self.metrics_label):
+                return decode(data, record_size, users)
+        return timed
+
+    def get_records_since_cursor(self, cursor: Optional[AttendanceCursor] = None,
+                                 on_buffer: Callable[[bytes, int, int], None] = None) -> Tuple[List[AttendanceRecord], AttendanceCursor, bool]:
+        """Comme get_attendance_since_cursor, en AttendanceRecord décodés sans datetime"""
+        return self.get_attendance_since_cursor(cursor, on_buffer, decode_records)
+
+    def rotate_attendance(self, cursor: AttendanceCursor) -> int:
+        """
+        Effacer l'ATTLOG si son contenu est exactement celui déjà lu jusqu'au curseur.
+
+        Nombre d'enregistrements, taille et CRC32 sont vérifiés device désactivé, puis le log est
+        effacé avant la réactivation: aucun pointage ne peut arriver entre la vérification et l'effacement.
+        Une erreur de vérification n'est pas une erreur réseau: la session ne relance pas l'opération.
+
+        :return: nombre d'enregistrements effacés
+        :raises ValueError: si le log ne correspond pas au curseur (rien n'est effacé)
+        :raises RotationUnverified: erreur après la commande d'effacement (le log a pu être effacé)
+        """
+        if cursor.checksum is None or not cursor.records:
+            raise ValueError("Curseur sans somme de contrôle: rotation impossible")
+        self.disable_device()
+        try:
+            self.read_sizes()
+            if self.records != cursor.records:
+                raise ValueError(f"{self.records} enregistrements sur le device, {cursor.records} attendus")
+            data, size = self.read_buffer_from(const.CMD_ATTLOG_RRQ)
+            total_size, checksum = attlog_checksum(data)
+            if ATTLOG_HEADER_SIZE + total_size != cursor.offset or checksum != cursor.checksum:
+                raise ValueError("Contenu de l'ATTLOG différent des pointages lus (somme de contrôle)")
+            try:
+                self.clear_attendance()
+                self.read_sizes()
+            except Exception as e:
+                raise RotationUnverified(f"Effacement non vérifié: {e}") from e
+            if self.records:
+                raise RotationUnverified(f"{self.records} enregistrements encore présents après l'effacement")
+            return cursor.records
+        finally:
+            self.enable_device()
+
+    def live_capture(self, new_timeout=10):
+        """
+        Capture des événements temps réel (même comportement que ZK.live_capture).
+
+        Les user_id sont résolus via la table utilisateurs indexée en cache.
+        """
+        was_enabled = self.is_enabled
+        users = self.get_user_index()
+        self.cancel_capture()
+        self.verify_user()
+        if not self.is_enabled:
+            self.enable_device()
+        self.reg_event(const.EF_ATTLOG)
+        self._ZK__sock.settimeout(new_timeout)
+        self.end_live_capture = False
+        buffer = b''
+        while not self.end_live_capture:
+            try:
+                if self.pending_events:
+                    packets = [self.pending_events.pop(0)]
+                elif self.tcp:
+                    # Plusieurs paquets peuvent arriver dans un même recv: découpage selon l'en-tête TCP
+                    buffer += self._ZK__sock.recv(1032)
+                    packets, buffer = split_tcp_packets(buffer)
+                    for _ in packets:
+                        self._ZK__ack_ok()
+                    packets = [packet[8:] for packet in packets if unpack('<H', packet[:2])[0] == const.CMD_REG_EVENT]
+                else:
+                    data_recv = self._ZK__sock.recv(1032)
+                    self._ZK__ack_ok()
+                    if unpack('<H', data_recv[:2])[0] != const.CMD_REG_EVENT:
+                        continue
+                    packets = [data_recv[8:]]
+                for data in packets:
+                    for attendance in decode_live_events(data, users):
+                        yield attendance
+            except SocketTimeout:
+                yield None  # rendre la main pour continuer la surveillance
+            except (KeyboardInterrupt, SystemExit):
+                break
+        if buffer:
+            # Paquet incomplet en fin d'écoute: le lire en entier pour ne pas décaler les réponses suivantes
+            self._ZK__sock.settimeout(self._ZK__timeout)
+            buffer = self._recv_exact(buffer, 8)
+            buffer = self._recv_exact(buffer, 8 + unpack('<HHI', buffer[:8])[2])
+            for packet in split_tcp_packets(buffer)[0]:
+                self._ZK__ack_ok()
+                if unpack('<H', packet[:2])[0] == const.CMD_REG_EVENT:
+                    self.pending_events.append(packet[8:])
+        self._ZK__sock.settimeout(self._ZK__timeout)
+        self.reg_event(0)
+        if not was_enabled:
+            self.disable_device()
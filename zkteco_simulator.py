@@ -0,0 +1,457 @@
+"""
+Simulateur de terminal ZKTeco (TCP ou UDP) pour tester et mesurer le client sans device physique.
+
+Répond aux commandes utilisées par zk.base.ZK: connexion, read_sizes, lectures par buffer
+(1503/1504), ATTLOG aux formats 8, 16 et 40 octets, utilisateurs (28 et 72 octets),
+options, effacement du log et événements temps réel (CMD_REG_EVENT).
+
+    python zkteco_simulator.py --records 50000 --latency 0.005 --loss 0.01 --punch-every 10
+
+Depuis Python (port choisi par le système):
+    with ZKTecoSimulator(SimulatedDevice(records=5000)) as simulator:
+        ZKTecoClient(*simulator.address).get_attendance()
+"""
+import argparse
+import logging
+import random
+import socket
+import socketserver
+import threading
+import time
+from datetime import datetime, timedelta
+from struct import pack, unpack
+from typing import List, Optional, Tuple
+
+from zk import const
+
+RECORD_SIZES = (8, 16, 40)
+USER_PACKET_SIZES = (28, 72)
+# Délai d'un paquet TCP perdu (retransmission)
+TCP_RETRANSMIT_DELAY = 0.2
+
+
+def encode_time(t: datetime) -> int:
+    """Encoder un datetime au format horloge ZKTeco (zkemsdk.c - EncodeTime)"""
+    return (
+        ((t.year % 100) * 12 * 31 + ((t.month - 1) * 31) + t.day - 1) *
+        (24 * 60 * 60) + (t.hour * 60 + t.minute) * 60 + t.second
+    )
+
+
+def encode_timehex(t: datetime) -> bytes:
+    """Encoder un datetime au format 6 octets des événements temps réel"""
+    return pack('6B', t.year - 2000, t.month, t.day, t.hour, t.minute, t.second)
+
+
+class SimulatedDevice:
+    """
+    État d'un terminal ZKTeco simulé (utilisateurs, ATTLOG, options).
+
+    :param records: pointages générés à l'avance, répartis sur 30 jours à partir de start
+    :param latency: délai ajouté à chaque réponse (secondes)
+    :param loss: probabilité de perte d'un paquet (UDP: pas de réponse, TCP: délai de retransmission)
+    :param seed: graine du générateur aléatoire (pertes et pointages) pour des mesures reproductibles
+    """
+
+    def __init__(self, records: int = 1000, users: int = 50, record_size: int = 40,
+                 user_packet_size: int = 72, serial: str = 'SIM0000001',
+                 start: datetime = None, latency: float = 0.0, loss: float = 0.0,
+                 seed: int = None):
+        if record_size not in RECORD_SIZES:
+            raise ValueError(f"record_size doit être dans {RECORD_SIZES}")
+        if user_packet_size not in USER_PACKET_SIZES:
+            raise ValueError(f"user_packet_size doit être dans {USER_PACKET_SIZES}")
+        self.record_size = record_size
+        self.user_packet_size = user_packet_size
+        self.serial = serial
+        self.device_name = 'ZKTeco Simulator'
+        self.firmware = 'Ver 6.60 Sim'
+        self.latency = latency
+        self.loss = loss
+        self.rec_cap = max(100000, records * 2)
+        self.users_cap = 3000
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.is_enabled = True
+
+        self.users = [(uid, str(1000 + uid)) for uid in range(1, users + 1)]
+        self.attendances: List[Tuple[int, str, datetime, int, int]] = []
+        start = start or (datetime.now() - timedelta(days=30)).replace(microsecond=0)
+        step = timedelta(seconds=max(1, int(30 * 24 * 3600 / max(records, 1))))
+        for i in range(records):
+            uid, user_id = self.users[i % len(self.users)] if self.users else (i + 1, str(i + 1))
+            self.attendances.append((uid, user_id, start + step * i, 1, i % 2))
+
+    def add_punch(self, user_id: str = None, timestamp: datetime = None,
+                  status: int = 1, punch: int = 0):
+        """Ajouter un pointage et le pousser aux abonnés temps réel"""
+        if user_id is None:
+            uid, user_id = self.random.choice(self.users)
+        else:
+            uid = next((u for u, uid_str in self.users if uid_str == user_id), int(user_id))
+        timestamp = (timestamp or datetime.now()).replace(microsecond=0)
+        with self.lock:
+            self.attendances.append((uid, user_id, timestamp, status, punch))
+            subscribers = list(self.subscribers)
+        for push in subscribers:
+            try:
+                push(user_id, timestamp, status, punch)
+            except OSError:
+                self.unsubscribe(push)
+
+    def clear_attendance(self):
+        """Effacer l'ATTLOG (CMD_CLEAR_ATTLOG)"""
+        with self.lock:
+            self.attendances = []
+
+    def subscribe(self, push):
+        with self.lock:
+            self.subscribers.append(push)
+
+    def unsubscribe(self, push):
+        with self.lock:
+            if push in self.subscribers:
+                self.subscribers.remove(push)
+
+    def attlog_buffer(self) -> bytes:
+        """Buffer ATTLOG tel que renvoyé par CMD_ATTLOG_RRQ (taille + enregistrements)"""
+        with self.lock:
+            attendances = list(self.attendances)
+        parts = []
+        for uid, user_id, timestamp, status, punch in attendances:
+            t = pack('<I', encode_time(timestamp))
+            if self.record_size == 8:
+                parts.append(pack('<HB4sB', uid, status, t, punch))
+            elif self.record_size == 16:
+                parts.append(pack('<I4sBB2sI', int(user_id), t, status, punch, b'\x00\x00', 0))
+            else:
+                parts.append(pack('<H24sB4sB8s', uid, user_id.encode(), status, t, punch, b''))
+        body = b''.join(parts)
+        return pack('<I', len(body)) + body
+
+    def users_buffer(self) -> bytes:
+        """Buffer utilisateurs tel que renvoyé par CMD_USERTEMP_RRQ/FCT_USER"""
+        parts = []
+        for uid, user_id in self.users:
+            name = f'User {user_id}'.encode()
+            if self.user_packet_size == 28:
+                parts.append(pack('<HB5s8sIxBhI', uid, 0, b'', name[:8], 0, 1, 0, int(user_id)))
+            else:
+                parts.append(pack('<HB8s24sIx7sx24s', uid, 0, b'', name, 0, b'1', user_id.encode()))
+        body = b''.join(parts)
+        return pack('<I', len(body)) + body
+
+    def sizes(self) -> bytes:
+        """Réponse CMD_GET_FREE_SIZES (20 entiers + infos visages)"""
+        fields = [0] * 20
+        with self.lock:
+            records = len(self.attendances)
+        fields[4] = len(self.users)
+        fields[8] = records
+        fields[14] = 3000
+        fields[15] = self.users_cap
+        fields[16] = self.rec_cap
+        fields[17] = 3000
+        fields[18] = self.users_cap - len(self.users)
+        fields[19] = self.rec_cap - records
+        return pack('20i', *fields) + pack('3i', 0, 0, 0)
+
+    def option(self, name: bytes) -> bytes:
+        name = name.split(b'\x00')[0]
+        values = {
+            b'~SerialNumber': self.serial,
+            b'~DeviceName': self.device_name,
+            b'~Platform': 'ZMM220_TFT',
+            b'MAC': '00:17:61:00:00:01',
+        }
+        value = values.get(name, '')
+        return name + b'=' + value.encode() + b'\x00'
+
+    def delay(self):
+        """Appliquer la latence et la perte simulées. Retourne False si le paquet est perdu"""
+        if self.latency:
+            time.sleep(self.latency)
+        return not (self.loss and self.random.random() < self.loss)
+
+
+class _Session:
+    """État d'une session client (buffer préparé, session_id)"""
+
+    def __init__(self, device: SimulatedDevice, session_id: int):
+        self.device = device
+        self.session_id = session_id
+        self.buffer = b''
+
+    def handle(self, command: int, data: bytes) -> Tuple[int, bytes]:
+        device = self.device
+        if command == const.CMD_GET_FREE_SIZES:
+            return const.CMD_ACK_OK, device.sizes()
+        if command == 1503:
+            _, rrq, fct, _ext = unpack('<bhii', data[:11])
+            if rrq == const.CMD_ATTLOG_RRQ:
+                self.buffer = device.attlog_buffer()
+            elif rrq == const.CMD_USERTEMP_RRQ and fct == const.FCT_USER:
+                self.buffer = device.users_buffer()
+            else:
+                return const.CMD_ACK_ERROR, b''
+            return const.CMD_ACK_OK, b'\x00' + pack('<I', len(self.buffer)) + b'\x00' * 4
+        if command == const.CMD_FREE_DATA:
+            self.buffer = b''
+            return const.CMD_ACK_OK, b''
+        if command == const.CMD_OPTIONS_RRQ:
+            return const.CMD_ACK_OK, device.option(data)
+        if command == const.CMD_GET_VERSION:
+            return const.CMD_ACK_OK, device.firmware.encode() + b'\x00'
+        if command == const.CMD_GET_TIME:
+            return const.CMD_ACK_OK, pack('<I', encode_time(datetime.now()))
+        if command == const.CMD_CLEAR_ATTLOG:
+            device.clear_attendance()
+            return const.CMD_ACK_OK, b''
+        if command == const.CMD_DISABLEDEVICE:
+            device.is_enabled = False
+            return const.CMD_ACK_OK, b''
+        if command == const.CMD_ENABLEDEVICE:
+            device.is_enabled = True
+            return const.CMD_ACK_OK, b''
+        return const.CMD_ACK_OK, b''
+
+
+class _ReusableTCPServer(socketserver.ThreadingTCPServer):
+    """Serveur TCP relançable aussitôt sur le même port (sans modifier ThreadingTCPServer)"""
+    allow_reuse_address = True
+
+
+class ZKTecoSimulator:
+    """Serveur TCP/UDP parlant le protocole utilisé par zk.base.ZK"""
+
+    def __init__(self, device: SimulatedDevice = None, host: str = '127.0.0.1',
+                 port: int = 0, udp: bool = False):
+        self.device = device or SimulatedDevice()
+        self.udp = udp
+        self.logger = logging.getLogger(__name__)
+        self._session_ids = iter(range(1, 1 << 16))
+        simulator = self
+
+        class TCPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                simulator._serve_tcp(self.request)
+
+        class UDPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                simulator._serve_udp(data, sock, self.client_address)
+
+        if udp:
+            self.server = socketserver.ThreadingUDPServer((host, port), UDPHandler)
+        else:
+            self.server = _ReusableTCPServer((host, port), TCPHandler)
+        self.server.daemon_threads = True
+        self._udp_sessions = {}
+        self.thread = None
+        # Octets échangés avec les clients (en-têtes TCP compris), pour les mesures de débit
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.counter_lock = threading.Lock()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.logger.info(f"🧪 Simulateur ZKTeco sur {self.address[0]}:{self.address[1]} "
+                         f"({'UDP' if self.udp else 'TCP'})")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @staticmethod
+    def _packet(command: int, session_id: int, reply_id: int, data: bytes = b'') -> bytes:
+        return pack('<4H', command, 0, session_id, reply_id) + data
+
+    @staticmethod
+    def _tcp_top(packet: bytes) -> bytes:
+        return pack('<HHI', const.MACHINE_PREPARE_DATA_1, const.MACHINE_PREPARE_DATA_2,
+                    len(packet)) + packet
+
+    def _count(self, sent: int = 0, received: int = 0):
+        with self.counter_lock:
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def _sendto(self, sock: socket.socket, packet: bytes, address):
+        sock.sendto(packet, address)
+        self._count(sent=len(packet))
+
+    def _serve_tcp(self, sock: socket.socket):
+        device = self.device
+        session: Optional[_Session] = None
+        send_lock = threading.Lock()
+        push = None
+
+        def send(packet: bytes):
+            with send_lock:
+                sock.sendall(self._tcp_top(packet))
+            self._count(sent=len(packet) + 8)
+
+        def recv_exact(size: int) -> bytes:
+            data = b''
+            while len(data) < size:
+                part = sock.recv(size - len(data))
+                if not part:
+                    raise ConnectionError
+                data += part
+            self._count(received=size)
+            return data
+
+        try:
+            while True:
+                top = recv_exact(8)
+                _, _, length = unpack('<HHI', top)
+                packet = recv_exact(length)
+                command, _, _, reply_id = unpack('<4H', packet[:8])
+                data = packet[8:]
+                if command == const.CMD_ACK_OK:
+                    continue  # ACK d'un événement temps réel
+                if not device.delay():
+                    time.sleep(TCP_RETRANSMIT_DELAY)
+                if command == const.CMD_CONNECT:
+                    session = _Session(device, next(self._session_ids))
+                    send(self._packet(const.CMD_ACK_OK, session.session_id, reply_id))
+                    continue
+                if session is None:
+                    send(self._packet(const.CMD_ACK_UNAUTH, 0, reply_id))
+                    continue
+                if command == const.CMD_EXIT:
+                    send(self._packet(const.CMD_ACK_OK, session.session_id, reply_id))
+                    break
+                if command == 1504:
+                    start, size = unpack('<ii', data[:8])
+                    send(self._packet(const.CMD_DATA, session.session_id, reply_id,
+                                      session.buffer[start:start + size]))
+                    continue
+                if command == const.CMD_REG_EVENT:
+                    flags = unpack('<I', data[:4])[0]
+                    if push:
+                        device.unsubscribe(push)
+                        push = None
+                    if flags & const.EF_ATTLOG:
+                        session_id = session.session_id
+
+                        def push(user_id, timestamp, status, punch):
+                            send(self._packet(const.CMD_REG_EVENT, session_id, 0,
+                                              self._event(user_id, timestamp, status, punch)))
+                        device.subscribe(push)
+                    send(self._packet(const.CMD_ACK_OK, session.session_id, reply_id))
+                    continue
+                code, payload = session.handle(command, data)
+                send(self._packet(code, session.session_id, reply_id, payload))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if push:
+                device.unsubscribe(push)
+
+    def _event(self, user_id: str, timestamp: datetime, status: int, punch: int) -> bytes:
+        if self.device.record_size == 40:
+            return pack('<24sBB6s', user_id.encode(), status, punch, encode_timehex(timestamp))
+        return pack('<IBB6s', int(user_id), status, punch, encode_timehex(timestamp))
+
+    def _serve_udp(self, packet: bytes, sock: socket.socket, address):
+        device = self.device
+        self._count(received=len(packet))
+        command, _, session_id, reply_id = unpack('<4H', packet[:8])
+        data = packet[8:]
+        if command == const.CMD_ACK_OK:
+            return
+        if not device.delay():
+            return  # paquet perdu: le client expire
+        if command == const.CMD_CONNECT:
+            session = _Session(device, next(self._session_ids))
+            self._udp_sessions[address] = session
+            self._sendto(sock, self._packet(const.CMD_ACK_OK, session.session_id, reply_id), address)
+            return
+        session = self._udp_sessions.get(address)
+        if session is None:
+            self._sendto(sock, self._packet(const.CMD_ACK_UNAUTH, 0, reply_id), address)
+            return
+        if command == const.CMD_EXIT:
+            self._udp_sessions.pop(address, None)
+            self._sendto(sock, self._packet(const.CMD_ACK_OK, session.session_id, reply_id), address)
+            return
+        if command == 1504:
+            start, size = unpack('<ii', data[:8])
+            chunk = session.buffer[start:start + size]
+            self._sendto(sock, self._packet(const.CMD_PREPARE_DATA, session.session_id, reply_id,
+                                     pack('<I', len(chunk))), address)
+            for i in range(0, len(chunk), 1024):
+                self._sendto(sock, self._packet(const.CMD_DATA, session.session_id, reply_id,
+                                         chunk[i:i + 1024]), address)
+            self._sendto(sock, self._packet(const.CMD_ACK_OK, session.session_id, reply_id), address)
+            return
+        if command == const.CMD_REG_EVENT:
+            flags = unpack('<I', data[:4])[0]
+            if flags & const.EF_ATTLOG:
+                sid = session.session_id
+
+                def push(user_id, timestamp, status, punch):
+                    self._sendto(sock, self._packet(const.CMD_REG_EVENT, sid, 0,
+                                             self._event(user_id, timestamp, status, punch)), address)
+                session.push = push
+                device.subscribe(push)
+            elif getattr(session, 'push', None):
+                device.unsubscribe(session.push)
+                session.push = None
+            self._sendto(sock, self._packet(const.CMD_ACK_OK, session.session_id, reply_id), address)
+            return
+        code, payload = session.handle(command, data)
+        self._sendto(sock, self._packet(code, session.session_id, reply_id, payload), address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulateur de terminal ZKTeco")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4370)
+    parser.add_argument('--udp', action='store_true')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--record-size', type=int, default=40, choices=RECORD_SIZES)
+    parser.add_argument('--user-packet-size', type=int, default=72, choices=USER_PACKET_SIZES)
+    parser.add_argument('--serial', default='SIM0000001')
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence par réponse (s)")
+    parser.add_argument('--loss', type=float, default=0.0, help="Taux de perte de paquets (0-1)")
+    parser.add_argument('--seed', type=int, default=None, help="Graine aléatoire (mesures reproductibles)")
+    parser.add_argument('--punch-every', type=float, default=0.0,
+                        help="Générer un pointage temps réel toutes les N secondes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    device = SimulatedDevice(records=args.records, users=args.users, record_size=args.record_size,
+                             user_packet_size=args.user_packet_size, serial=args.serial,
+                             latency=args.latency, loss=args.loss, seed=args.seed)
+    simulator = ZKTecoSimulator(device, args.host, args.port, udp=args.udp).start()
+    try:
+        while True:
+            if args.punch_every:
+                time.sleep(args.punch_every)
+                device.add_punch()
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()